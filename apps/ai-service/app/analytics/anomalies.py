@@ -0,0 +1,428 @@
+import copy
+import math
+import os
+from collections import deque
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from pymongo import UpdateOne
+
+from app.analytics.models import Insight, MetricType
+from app.database.mongodb import get_database
+
+# Rolling z-score: points in the trailing window and the |z| that flags
+ANOMALY_WINDOW = int(os.getenv("ANOMALY_WINDOW", "60"))
+ANOMALY_Z_THRESHOLD = float(os.getenv("ANOMALY_Z_THRESHOLD", "3.5"))
+# EWMA control chart: smoothing factor, limit in EW standard deviations,
+# and points seen before the limits are trusted
+ANOMALY_EWMA_ALPHA = float(os.getenv("ANOMALY_EWMA_ALPHA", "0.1"))
+ANOMALY_EWMA_LIMIT = float(os.getenv("ANOMALY_EWMA_LIMIT", "3.5"))
+ANOMALY_EWMA_WARMUP = int(os.getenv("ANOMALY_EWMA_WARMUP", "20"))
+# Seasonal MAD: a point is compared with the same slot (bucket % period)
+# of the last ANOMALY_SEASON_CYCLES cycles; hour of day by default
+ANOMALY_SEASON_BUCKET = int(os.getenv("ANOMALY_SEASON_BUCKET", "3600"))
+ANOMALY_SEASON_PERIOD = int(os.getenv("ANOMALY_SEASON_PERIOD", "24"))
+ANOMALY_SEASON_CYCLES = int(os.getenv("ANOMALY_SEASON_CYCLES", "12"))
+ANOMALY_SEASON_MIN_CYCLES = int(os.getenv("ANOMALY_SEASON_MIN_CYCLES", "6"))
+ANOMALY_MAD_THRESHOLD = float(os.getenv("ANOMALY_MAD_THRESHOLD", "3.5"))
+# Detectors (of those warmed up) that must agree before a point is reported
+ANOMALY_MIN_VOTES = int(os.getenv("ANOMALY_MIN_VOTES", "2"))
+
+DETECTORS = ("zscore", "ewma", "seasonal")
+# Severity by the strongest detector's score as a multiple of its threshold
+SEVERITY_LEVELS = ((2.0, "critical"), (1.5, "high"), (1.2, "medium"), (0.0, "low"))
+SEVERITY_ORDER = {"low": 0, "medium": 1, "high": 2, "critical": 3}
+
+# Keeps a flat series from dividing by zero; relative to the level
+_SCALE_FLOOR = 1e-9
+# 1.4826 * MAD estimates the standard deviation of normal data
+_MAD_SCALE = 1.4826
+
+
+def severity_for(ratio: float) -> str:
+    for bound, severity in SEVERITY_LEVELS:
+        if ratio >= bound:
+            return severity
+    return "low"
+
+
+def _floor(scale, level):
+    return np.maximum(scale, _SCALE_FLOOR * np.maximum(np.abs(level), 1.0))
+
+
+def _floor_scalar(scale: float, level: float) -> float:
+    return max(scale, _SCALE_FLOOR * max(abs(level), 1.0))
+
+
+def _epoch(timestamp: datetime) -> float:
+    if timestamp.tzinfo:
+        return timestamp.timestamp()
+    return (timestamp - datetime(1970, 1, 1)).total_seconds()
+
+
+def anomaly_insight(
+    user_id: str,
+    metric_type: str,
+    timestamp: datetime,
+    value: float,
+    expected: float,
+    ratios: Dict[str, float]
+) -> Insight:
+    """Insight for a flagged point; the id is stable so re-detections dedupe"""
+    strongest = max(ratios.values())
+    severity = severity_for(strongest)
+    direction = "above" if value > expected else "below"
+    change = f" ({(value - expected) / abs(expected) * 100:+.1f}%)" if expected else ""
+    name = metric_type.replace("_", " ")
+    return Insight(
+        id=f"anomaly:{user_id}:{metric_type}:{timestamp.isoformat()}",
+        type="anomaly",
+        title=f"Unusual {name}",
+        description=f"{name.capitalize()} was {value:.4g}, {direction} the expected {expected:.4g}{change}",
+        severity=severity,
+        metric_type=MetricType(metric_type),
+        timestamp=timestamp,
+        actionable=severity in ("high", "critical"),
+        metadata={
+            "value": value,
+            "expected": expected,
+            "scores": {name: round(ratio, 3) for name, ratio in ratios.items()},
+            "detectors": [name for name, ratio in ratios.items() if ratio > 1]
+        }
+    )
+
+
+class _SeriesState:
+    __slots__ = ("window", "shift", "total", "total_sq", "pushes", "ewma", "ewvar", "seen", "seasons", "last_ts")
+
+    def __init__(self, window: int):
+        self.window: deque = deque(maxlen=window)
+        self.shift: Optional[float] = None
+        self.total = 0.0
+        self.total_sq = 0.0
+        self.pushes = 0
+        self.ewma = 0.0
+        self.ewvar = 0.0
+        self.seen = 0
+        self.seasons: Dict[int, deque] = {}
+        self.last_ts: Optional[float] = None
+
+
+class AnomalyDetector:
+    """Streaming anomaly detection over many (user, metric) series.
+
+    ``update`` scores one point against its series' state in O(1):
+    - rolling z-score against the previous ``window`` points (running
+      sums over a ring buffer, shifted by the series' first value);
+    - EWMA control limits (exponentially weighted mean and variance);
+    - seasonal MAD: robust z against the same seasonal slot of the last
+      ``season_cycles`` cycles (a median of at most that many values).
+    Each detector scores |deviation| / threshold, so > 1 means it fired;
+    a point is an anomaly when ``min_votes`` detectors fire. Points older
+    than the series' newest are ignored. ``detect_series`` computes the
+    same scores for a whole series at once for backfills.
+    """
+
+    def __init__(
+        self,
+        window: int = ANOMALY_WINDOW,
+        z_threshold: float = ANOMALY_Z_THRESHOLD,
+        ewma_alpha: float = ANOMALY_EWMA_ALPHA,
+        ewma_limit: float = ANOMALY_EWMA_LIMIT,
+        ewma_warmup: int = ANOMALY_EWMA_WARMUP,
+        season_bucket: int = ANOMALY_SEASON_BUCKET,
+        season_period: int = ANOMALY_SEASON_PERIOD,
+        season_cycles: int = ANOMALY_SEASON_CYCLES,
+        season_min_cycles: int = ANOMALY_SEASON_MIN_CYCLES,
+        mad_threshold: float = ANOMALY_MAD_THRESHOLD,
+        min_votes: int = ANOMALY_MIN_VOTES
+    ):
+        self.window = window
+        self.z_threshold = z_threshold
+        self.ewma_alpha = ewma_alpha
+        self.ewma_limit = ewma_limit
+        self.ewma_warmup = ewma_warmup
+        self.season_bucket = season_bucket
+        self.season_period = season_period
+        self.season_cycles = season_cycles
+        self.season_min_cycles = season_min_cycles
+        self.mad_threshold = mad_threshold
+        self.min_votes = min_votes
+        self.series: Dict[Tuple[str, str], _SeriesState] = {}
+        self.points = 0
+        self.anomalies = 0
+
+    def _score(self, state: _SeriesState, value: float, ts: float) -> Dict[str, float]:
+        """Score a point against the state, then fold it in"""
+        ratios = {}
+        if state.shift is None:
+            state.shift = value
+
+        # Rolling z-score over the previous window
+        x = value - state.shift
+        n = len(state.window)
+        if n == self.window:
+            mean = state.total / n
+            std = _floor_scalar(math.sqrt(max(state.total_sq / n - mean * mean, 0.0)), mean + state.shift)
+            ratios["zscore"] = abs(x - mean) / std / self.z_threshold
+            old = state.window[0]
+            state.total -= old
+            state.total_sq -= old * old
+        state.window.append(x)
+        state.total += x
+        state.total_sq += x * x
+        state.pushes += 1
+        if state.pushes % self.window == 0:
+            # Re-sum now and then so subtraction error does not accumulate
+            state.total = sum(state.window)
+            state.total_sq = sum(v * v for v in state.window)
+
+        # EWMA control limits
+        if state.seen == 0:
+            state.ewma = value
+        else:
+            deviation = value - state.ewma
+            if state.seen >= self.ewma_warmup:
+                std = _floor_scalar(math.sqrt(state.ewvar), state.ewma)
+                ratios["ewma"] = abs(deviation) / std / self.ewma_limit
+            state.ewma += self.ewma_alpha * deviation
+            state.ewvar = (1 - self.ewma_alpha) * (state.ewvar + self.ewma_alpha * deviation * deviation)
+        state.seen += 1
+
+        # Seasonal MAD against the same slot of previous cycles
+        if self.season_period > 0:
+            phase = int(ts // self.season_bucket) % self.season_period
+            history = state.seasons.get(phase)
+            if history is None:
+                history = state.seasons[phase] = deque(maxlen=self.season_cycles)
+            if len(history) >= self.season_min_cycles:
+                ordered = sorted(history)
+                median = _median_sorted(ordered)
+                mad = _median_sorted(sorted(abs(v - median) for v in ordered))
+                scale = _floor_scalar(_MAD_SCALE * mad, median)
+                ratios["seasonal"] = abs(value - median) / scale / self.mad_threshold
+            history.append(value)
+        return ratios
+
+    def snapshot(self, keys: Sequence[Tuple[str, str]]) -> Dict[str, Any]:
+        """Copy of the state of some series, for ``restore`` if a batch fails"""
+        return {
+            "series": {key: copy.deepcopy(self.series.get(key)) for key in set(keys)},
+            "points": self.points,
+            "anomalies": self.anomalies
+        }
+
+    def restore(self, snapshot: Dict[str, Any]):
+        """Put back the series state captured by ``snapshot``"""
+        for key, state in snapshot["series"].items():
+            if state is None:
+                self.series.pop(key, None)
+            else:
+                self.series[key] = state
+        self.points = snapshot["points"]
+        self.anomalies = snapshot["anomalies"]
+
+    def update(self, user_id: str, metric_type: str, value: float, timestamp: datetime) -> Optional[Insight]:
+        """Feed one point; returns an anomaly Insight if it is one"""
+        key = (user_id, metric_type)
+        state = self.series.get(key)
+        if state is None:
+            state = self.series[key] = _SeriesState(self.window)
+        ts = _epoch(timestamp)
+        if state.last_ts is not None and ts < state.last_ts:
+            return None
+        state.last_ts = ts
+        self.points += 1
+
+        expected = state.ewma if state.seen else value
+        ratios = self._score(state, value, ts)
+        if sum(ratio > 1 for ratio in ratios.values()) < self.min_votes:
+            return None
+        self.anomalies += 1
+        return anomaly_insight(user_id, metric_type, timestamp, value, expected, ratios)
+
+    def detect_series(self, timestamps: np.ndarray, values: np.ndarray) -> Dict[str, np.ndarray]:
+        """Vectorized scores for a whole chronological series
+
+        ``timestamps`` are epoch seconds. Returns per-point arrays: one
+        ratio array per detector (NaN before it has warmed up), ``expected``
+        (the EWMA before each point) and the boolean ``anomaly`` mask, equal
+        to what streaming the same points through ``update`` would give.
+        """
+        values = np.asarray(values, dtype=float)
+        timestamps = np.asarray(timestamps, dtype=float)
+        n = len(values)
+        result = {name: np.full(n, np.nan) for name in DETECTORS}
+        if n == 0:
+            result["expected"] = np.empty(0)
+            result["anomaly"] = np.zeros(0, dtype=bool)
+            return result
+
+        # Rolling z-score: window statistics of the points before each one
+        shift = values[0]
+        x = values - shift
+        w = self.window
+        if n > w:
+            # Window sums from prefix sums, so memory stays O(n)
+            sums = np.concatenate(([0.0], np.cumsum(x)))
+            sums_sq = np.concatenate(([0.0], np.cumsum(x * x)))
+            mean = (sums[w:n] - sums[:n - w]) / w
+            var = np.maximum((sums_sq[w:n] - sums_sq[:n - w]) / w - mean * mean, 0.0)
+            std = _floor(np.sqrt(var), mean + shift)
+            result["zscore"][w:] = np.abs(x[w:] - mean) / std / self.z_threshold
+
+        # EWMA control limits: both moments are linear recurrences
+        a = self.ewma_alpha
+        ewma = np.empty(n)
+        ewma[0] = values[0]
+        if n > 1:
+            ewma[1:] = linear_recurrence(a * values[1:], 1 - a, values[0])
+        deviation = np.zeros(n)
+        deviation[1:] = values[1:] - ewma[:-1]
+        ewvar = np.zeros(n)
+        if n > 1:
+            ewvar[1:] = linear_recurrence((1 - a) * a * deviation[1:] ** 2, 1 - a, 0.0)
+        expected = np.concatenate(([values[0]], ewma[:-1]))
+        scored = np.arange(n) >= max(self.ewma_warmup, 1)
+        std = _floor(np.sqrt(np.concatenate(([0.0], ewvar[:-1]))), expected)
+        result["ewma"][scored] = (np.abs(deviation) / std / self.ewma_limit)[scored]
+
+        # Seasonal MAD: all slots at once. Points are grouped by slot
+        # (stable, so each group stays chronological) and every point gets
+        # a row holding the previous k values of its slot.
+        if self.season_period > 0:
+            phases = (timestamps // self.season_bucket).astype(np.int64) % self.season_period
+            k, k_min = self.season_cycles, self.season_min_cycles
+            order = np.argsort(phases, kind="stable")
+            grouped = values[order]
+            starts = np.flatnonzero(np.r_[True, phases[order][1:] != phases[order][:-1]])
+            rank = np.arange(n) - np.repeat(starts, np.diff(np.r_[starts, n]))
+
+            lags = np.arange(1, k + 1)
+            history = grouped[np.maximum(np.arange(n)[:, None] - lags, 0)]
+            full = rank >= k
+            partial = (rank >= k_min) & ~full
+
+            median = np.median(history[full], axis=1)
+            mad = np.median(np.abs(history[full] - median[:, None]), axis=1)
+            scale = _floor(_MAD_SCALE * mad, median)
+            result["seasonal"][order[full]] = np.abs(grouped[full] - median) / scale / self.mad_threshold
+
+            # Only the first k cycles of each slot have a shorter history
+            if partial.any():
+                rows = np.where(lags <= rank[partial][:, None], history[partial], np.nan)
+                median = np.nanmedian(rows, axis=1)
+                mad = np.nanmedian(np.abs(rows - median[:, None]), axis=1)
+                scale = _floor(_MAD_SCALE * mad, median)
+                result["seasonal"][order[partial]] = np.abs(grouped[partial] - median) / scale / self.mad_threshold
+
+        votes = sum((result[name] > 1) for name in DETECTORS)
+        result["expected"] = expected
+        result["anomaly"] = votes >= self.min_votes
+        return result
+
+    def backfill(
+        self,
+        user_id: str,
+        series: Dict[str, Tuple[Sequence[datetime], Sequence[float]]]
+    ) -> List[Insight]:
+        """Anomaly insights for every series of a user, newest first
+
+        ``series`` maps metric type to chronological (timestamps, values).
+        """
+        insights = []
+        for metric_type, (timestamps, values) in series.items():
+            epochs = np.array([_epoch(t) for t in timestamps])
+            scores = self.detect_series(epochs, np.asarray(values, dtype=float))
+            for i in np.flatnonzero(scores["anomaly"]):
+                ratios = {name: float(scores[name][i]) for name in DETECTORS if not np.isnan(scores[name][i])}
+                insights.append(anomaly_insight(
+                    user_id, metric_type, timestamps[i], float(values[i]), float(scores["expected"][i]), ratios
+                ))
+        insights.sort(key=lambda insight: insight.timestamp, reverse=True)
+        return insights
+
+    def stats(self) -> Dict[str, Any]:
+        return {"series": len(self.series), "points": self.points, "anomalies": self.anomalies}
+
+
+def _median_sorted(ordered: List[float]) -> float:
+    mid = len(ordered) // 2
+    return ordered[mid] if len(ordered) % 2 else (ordered[mid - 1] + ordered[mid]) / 2
+
+
+def linear_recurrence(inputs: np.ndarray, decay: float, initial: float) -> np.ndarray:
+    """y[t] = decay * y[t-1] + inputs[t] with y[-1] = initial, vectorized
+
+    Solved in blocks short enough that decay**-block stays small: within a
+    block the sum is a scaled cumsum, and only the carry between blocks is
+    propagated in a (short) Python loop.
+    """
+    n = len(inputs)
+    if decay <= 0:
+        return inputs.astype(float)
+    block = max(1, min(n, int(np.log(1e6) / -np.log(decay)))) if decay < 1 else n
+    padded = np.zeros(-(-n // block) * block)
+    padded[:n] = inputs
+    blocks = padded.reshape(-1, block)
+
+    powers = decay ** np.arange(block)
+    local = powers * np.cumsum(blocks / powers, axis=1)
+
+    # Carry into each block: y at the end of the previous one
+    carries = np.empty(len(blocks))
+    carry = initial
+    tail = decay ** block
+    for b, last in enumerate(local[:, -1]):
+        carries[b] = carry
+        carry = last + tail * carry
+    out = local + carries[:, None] * (powers * decay)
+    return out.reshape(-1)[:n]
+
+
+class AnomalyStore:
+    """Anomaly insights found while streaming, in the ``anomalies`` collection"""
+
+    async def save(self, user_insights: List[Tuple[str, Insight]]):
+        """Upsert (user id, insight) pairs; an already stored anomaly is kept
+
+        Keyed on (user, metric, timestamp), so saving a redelivered batch
+        again adds nothing.
+        """
+        if not user_insights:
+            return
+        db = await get_database()
+        await db.anomalies.bulk_write(
+            [
+                UpdateOne(
+                    {"user_id": user_id, "metric_type": insight.metric_type.value, "timestamp": insight.timestamp},
+                    {"$setOnInsert": {
+                        key: value for key, value in insight.dict().items() if key not in ("metric_type", "timestamp")
+                    }},
+                    upsert=True
+                )
+                for user_id, insight in user_insights
+            ],
+            ordered=False
+        )
+
+    async def list(
+        self,
+        user_id: str,
+        since: datetime,
+        min_severity: str = "low",
+        metric_types: Optional[List[str]] = None,
+        limit: int = 100
+    ) -> List[Insight]:
+        """Stored anomalies of a user, newest first"""
+        query: Dict[str, Any] = {
+            "user_id": user_id,
+            "timestamp": {"$gte": since},
+            "severity": {"$in": [s for s, rank in SEVERITY_ORDER.items() if rank >= SEVERITY_ORDER[min_severity]]}
+        }
+        if metric_types:
+            query["metric_type"] = {"$in": metric_types}
+        db = await get_database()
+        cursor = db.anomalies.find(query, {"_id": 0, "user_id": 0}).sort("timestamp", -1).limit(limit)
+        return [Insight(**doc) for doc in await cursor.to_list(length=limit)]
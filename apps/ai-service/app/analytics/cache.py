@@ -0,0 +1,147 @@
+import json
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Union
+
+from fastapi.encoders import jsonable_encoder
+
+from app.database.redis_client import get_redis_client
+
+# Seconds each endpoint's result stays valid; keys are bucketed by the same
+# width so every request inside a bucket maps to the same entry
+CACHE_TTLS = {
+    "metrics": 30,
+    "metric_details": 60,
+    "dashboard": 60,
+    "insights": 300,
+    "trends": 300,
+    "anomalies": 120,
+}
+
+ALL_METRICS = "all"
+
+
+class AnalyticsCache:
+    """Redis result cache for analytics endpoints.
+
+    Every entry is also registered in an index set per (user, metric) so that
+    inserting a point can drop exactly the entries it makes stale. Redis
+    errors never fail a request; the result is just computed uncached.
+    """
+
+    def __init__(self, ttls: Optional[Dict[str, int]] = None, prefix: str = "analytics_cache"):
+        self.ttls = {**CACHE_TTLS, **(ttls or {})}
+        self.prefix = prefix
+        self.hits: Dict[str, int] = {endpoint: 0 for endpoint in self.ttls}
+        self.misses: Dict[str, int] = {endpoint: 0 for endpoint in self.ttls}
+        self.errors = 0
+
+    def make_key(
+        self,
+        endpoint: str,
+        user_id: str,
+        metric_types: Union[str, List[str], None] = None,
+        time_range: Optional[str] = None,
+        now: Optional[float] = None
+    ) -> str:
+        """Build the cache key for an endpoint call"""
+        ttl = self.ttls[endpoint]
+        bucket = int((now if now is not None else time.time()) // ttl)
+        metrics = ",".join(sorted(self._metric_list(metric_types)))
+        return f"{self.prefix}:{endpoint}:{user_id}:{metrics}:{time_range or '-'}:{bucket}"
+
+    def _index_key(self, user_id: str, metric_type: str) -> str:
+        return f"{self.prefix}_index:{user_id}:{metric_type}"
+
+    def _metric_list(self, metric_types: Union[str, List[str], None]) -> List[str]:
+        if not metric_types:
+            return [ALL_METRICS]
+        if isinstance(metric_types, str):
+            return [metric_types]
+        return list(metric_types)
+
+    async def get_or_set(
+        self,
+        endpoint: str,
+        user_id: str,
+        compute: Callable[[], Awaitable[Any]],
+        metric_types: Union[str, List[str], None] = None,
+        time_range: Optional[str] = None
+    ) -> Any:
+        """Return the cached result or compute, store and return it
+
+        compute signals failure by raising, so errors reach the caller and
+        are never stored. Results flagged partial (a dashboard whose
+        insights or summaries fell back) are returned but not stored either.
+        """
+        key = self.make_key(endpoint, user_id, metric_types, time_range)
+
+        try:
+            redis = await get_redis_client()
+            cached = await redis.get(key)
+        except Exception:
+            self.errors += 1
+            return await compute()
+
+        if cached is not None:
+            self.hits[endpoint] += 1
+            return json.loads(cached)
+
+        self.misses[endpoint] += 1
+        result = jsonable_encoder(await compute())
+        if isinstance(result, dict) and result.get("partial"):
+            return result
+
+        try:
+            ttl = self.ttls[endpoint]
+            pipe = redis.pipeline(transaction=False)
+            pipe.set(key, json.dumps(result), ex=ttl)
+            for metric_type in self._metric_list(metric_types):
+                index_key = self._index_key(user_id, metric_type)
+                pipe.sadd(index_key, key)
+                pipe.expire(index_key, max(self.ttls.values()) * 2)
+            await pipe.execute()
+        except Exception:
+            self.errors += 1
+
+        return result
+
+    async def invalidate(self, user_id: str, metric_types: Union[str, List[str], None] = None):
+        """Drop entries that depend on the given metrics of a user
+
+        User-wide entries (dashboard, insights, unfiltered metrics) always go
+        too, since any new point changes them.
+        """
+        index_keys = [self._index_key(user_id, ALL_METRICS)]
+        if metric_types:
+            index_keys += [
+                self._index_key(user_id, metric_type)
+                for metric_type in self._metric_list(metric_types)
+            ]
+
+        try:
+            redis = await get_redis_client()
+            pipe = redis.pipeline(transaction=False)
+            for index_key in index_keys:
+                pipe.smembers(index_key)
+            members = await pipe.execute()
+
+            keys = set().union(*members)
+            await redis.delete(*keys, *index_keys)
+        except Exception:
+            self.errors += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters for this process"""
+        hits = sum(self.hits.values())
+        misses = sum(self.misses.values())
+        total = hits + misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "errors": self.errors,
+            "hit_rate": round(hits / total, 4) if total else 0.0,
+            "endpoints": {
+                endpoint: {"hits": self.hits[endpoint], "misses": self.misses[endpoint]}
+                for endpoint in self.ttls
+            }
+        }
@@ -0,0 +1,101 @@
+from typing import Dict, List, Sequence
+
+import numpy as np
+
+from app.analytics.models import AnalyticsData
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """Largest-Triangle-Three-Buckets: indices of n_out points keeping the shape
+
+    x must be increasing. The first and last points are always kept; every
+    bucket in between contributes the point forming the largest triangle
+    with the previously kept point and the next bucket's mean. The choice
+    is sequential, so buckets are walked in Python but each bucket's
+    candidates are scored in one NumPy expression, and bucket means are
+    computed for all buckets up front.
+    """
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n) if n_out >= n else np.array([0, n - 1])[:max(n_out, 0)]
+
+    # Bucket edges over the interior points 1..n-2
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    starts, ends = edges[:-1], edges[1:]
+
+    # Mean of each bucket, plus the last point as the final "next bucket"
+    sums_x = np.add.reduceat(x[1:n - 1], starts - 1)
+    sums_y = np.add.reduceat(y[1:n - 1], starts - 1)
+    sizes = ends - starts
+    mean_x = np.append(sums_x / sizes, x[-1])
+    mean_y = np.append(sums_y / sizes, y[-1])
+
+    selected = np.empty(n_out, dtype=int)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for bucket, (start, end) in enumerate(zip(starts, ends)):
+        cx, cy = mean_x[bucket + 1], mean_y[bucket + 1]
+        bx, by = x[start:end], y[start:end]
+        # Twice the triangle area for every candidate in the bucket
+        area = np.abs((x[a] - cx) * (by - y[a]) - (x[a] - bx) * (cy - y[a]))
+        a = start + int(np.argmax(area))
+        selected[bucket + 1] = a
+    return selected
+
+
+def minmax_indices(y: np.ndarray, n_out: int) -> np.ndarray:
+    """Min and max of each of n_out // 2 equal-count buckets (fully vectorized)
+
+    Keeps every spike, at the cost of a less even spacing than LTTB.
+    """
+    n = len(y)
+    n_buckets = n_out // 2
+    if n_out >= n or n_buckets < 1:
+        return np.arange(min(n, max(n_out, 0)))
+
+    bucket = (np.arange(n) * n_buckets) // n
+    # Sort by (bucket, value): each bucket's first entry is its min, last its max
+    order = np.lexsort((y, bucket))
+    boundaries = np.flatnonzero(np.diff(bucket[order])) + 1
+    firsts = np.concatenate(([0], boundaries))
+    lasts = np.concatenate((boundaries - 1, [n - 1]))
+    return np.unique(np.concatenate((order[firsts], order[lasts])))
+
+
+def downsample_indices(x: np.ndarray, y: np.ndarray, max_points: int, method: str = "lttb") -> np.ndarray:
+    """Indices (ascending) of at most max_points points to draw"""
+    if method == "minmax":
+        return minmax_indices(y, max_points)
+    return lttb_indices(x, y, max_points)
+
+
+def downsample_points(
+    points: Sequence[AnalyticsData],
+    max_points: int,
+    method: str = "lttb"
+) -> List[AnalyticsData]:
+    """Downsample each metric type's points to at most max_points
+
+    Points keep their original (newest first) order; series that already
+    fit are returned untouched.
+    """
+    if not max_points or len(points) <= max_points:
+        return list(points)
+
+    by_metric: Dict[str, List[int]] = {}
+    for index, point in enumerate(points):
+        by_metric.setdefault(point.metric_type, []).append(index)
+
+    keep = []
+    for indices in by_metric.values():
+        if len(indices) <= max_points:
+            keep.extend(indices)
+            continue
+        # Chronological order for the geometry
+        indices = indices[::-1]
+        x = np.array([points[i].timestamp.timestamp() for i in indices])
+        y = np.array([points[i].value for i in indices], dtype=float)
+        keep.extend(indices[i] for i in downsample_indices(x, y, max_points, method))
+
+    keep.sort()
+    return [points[i] for i in keep]
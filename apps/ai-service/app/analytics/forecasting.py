@@ -0,0 +1,245 @@
+from datetime import datetime
+from typing import List, Dict, Any, Sequence
+
+import numpy as np
+
+# Two-sided prediction interval reported with every forecast
+INTERVAL_LEVEL = 0.8
+_Z = {0.8: 1.2816, 0.9: 1.6449, 0.95: 1.9600}
+
+# Smoothing parameter grid; every combination is fitted in the same pass
+_ALPHAS = np.array([0.1, 0.3, 0.5, 0.7, 0.9])
+_BETAS = np.array([0.05, 0.2, 0.4])
+
+
+def _to_matrix(series: Sequence[Sequence[float]]) -> np.ndarray:
+    """Left-pad series with NaN into an (n_series, n_points) array"""
+    width = max((len(s) for s in series), default=0)
+    matrix = np.full((len(series), width), np.nan)
+    for i, values in enumerate(series):
+        if len(values):
+            matrix[i, width - len(values):] = values
+    return matrix
+
+
+def fill_days(days: Sequence[datetime], values: Sequence[float]) -> List[float]:
+    """One value per calendar day from the first to the last day given
+
+    Forecast steps are days and the seasonal models assume a 7-day cycle,
+    so series are resampled to daily means before fitting; days without
+    points are linearly interpolated.
+    """
+    if not len(days):
+        return []
+    ordinals = np.array([day.toordinal() for day in days], dtype=float)
+    order = np.argsort(ordinals)
+    ordinals, y = ordinals[order], np.asarray(values, dtype=float)[order]
+    grid = np.arange(ordinals[0], ordinals[-1] + 1)
+    return np.interp(grid, ordinals, y).tolist()
+
+
+def _format(mean: np.ndarray, lower: np.ndarray, upper: np.ndarray, level: float) -> List[Dict[str, Any]]:
+    return [
+        {
+            "day": day + 1,
+            "value": float(mean[day]),
+            "lower": float(lower[day]),
+            "upper": float(upper[day]),
+            "confidence": level
+        }
+        for day in range(len(mean))
+    ]
+
+
+def linear_trend(Y: np.ndarray, horizon: int, level: float = INTERVAL_LEVEL):
+    """Least-squares line per row, extrapolated with OLS prediction intervals"""
+    n_series, width = Y.shape
+    valid = ~np.isnan(Y)
+    n = valid.sum(axis=1)
+    x = np.broadcast_to(np.arange(width, dtype=float), Y.shape)
+
+    x_mean = np.where(valid, x, 0).sum(axis=1) / np.maximum(n, 1)
+    y_mean = np.where(valid, Y, 0).sum(axis=1) / np.maximum(n, 1)
+    dx = np.where(valid, x - x_mean[:, None], 0)
+    dy = np.where(valid, Y - y_mean[:, None], 0)
+    sxx = (dx ** 2).sum(axis=1)
+    slope = np.divide((dx * dy).sum(axis=1), sxx, out=np.zeros(n_series), where=sxx > 0)
+    intercept = y_mean - slope * x_mean
+
+    residuals = np.where(valid, Y - (intercept[:, None] + slope[:, None] * x), 0)
+    dof = np.maximum(n - 2, 1)
+    sigma = np.sqrt((residuals ** 2).sum(axis=1) / dof)
+
+    x_new = width - 1 + np.arange(1, horizon + 1, dtype=float)
+    mean = intercept[:, None] + slope[:, None] * x_new
+    leverage = np.divide(
+        (x_new[None, :] - x_mean[:, None]) ** 2, sxx[:, None],
+        out=np.zeros((n_series, horizon)), where=sxx[:, None] > 0
+    )
+    half_width = _Z[level] * sigma[:, None] * np.sqrt(1 + 1 / np.maximum(n, 1)[:, None] + leverage)
+    return mean, mean - half_width, mean + half_width
+
+
+def holt(Y: np.ndarray, horizon: int, level: float = INTERVAL_LEVEL):
+    """Holt's linear exponential smoothing, fitted by grid search per row
+
+    Each (series, alpha, beta) combination is one row of the state arrays, so
+    the recursion is a single loop over time regardless of how many series
+    or parameter pairs are evaluated.
+    """
+    n_series, width = Y.shape
+    alphas, betas = (g.ravel() for g in np.meshgrid(_ALPHAS, _BETAS))
+    n_params = len(alphas)
+
+    Yg = np.repeat(Y, n_params, axis=0)
+    a = np.tile(alphas, n_series)
+    b = np.tile(betas, n_series)
+
+    lvl = np.full(len(Yg), np.nan)
+    trend = np.zeros(len(Yg))
+    sse = np.zeros(len(Yg))
+    steps = np.zeros(len(Yg))
+
+    for t in range(width):
+        y = Yg[:, t]
+        valid = ~np.isnan(y)
+        start = valid & np.isnan(lvl)
+        if t > 0:
+            # Seed the trend from the first difference once two points exist
+            second = valid & (steps == 0) & ~start & ~np.isnan(lvl)
+            trend = np.where(second, y - lvl, trend)
+        update = valid & ~start & ~np.isnan(lvl)
+
+        prediction = lvl + trend
+        error = np.where(update, y - prediction, 0)
+        sse += error ** 2
+        steps += update
+
+        new_lvl = a * y + (1 - a) * prediction
+        new_trend = b * (new_lvl - lvl) + (1 - b) * trend
+        lvl = np.where(update, new_lvl, np.where(start, y, lvl))
+        trend = np.where(update, new_trend, trend)
+
+    # Pick the parameter pair with the lowest one-step-ahead error per series
+    mse = np.divide(sse, steps, out=np.full(len(Yg), np.inf), where=steps > 0)
+    best = mse.reshape(n_series, n_params).argmin(axis=1)
+    rows = np.arange(n_series) * n_params + best
+    lvl, trend, a, b = lvl[rows], trend[rows], a[rows], b[rows]
+    sigma = np.sqrt(np.where(np.isfinite(mse[rows]), mse[rows], 0))
+
+    h = np.arange(1, horizon + 1, dtype=float)
+    mean = lvl[:, None] + h[None, :] * trend[:, None]
+
+    # Var(e_h) = sigma^2 * (1 + sum_{j<h} (alpha * (1 + j * beta))^2)
+    j = np.arange(horizon, dtype=float)
+    terms = (a[:, None] * (1 + j[None, :] * b[:, None])) ** 2
+    terms[:, 0] = 0
+    variance = sigma[:, None] ** 2 * (1 + np.cumsum(terms, axis=1))
+    half_width = _Z[level] * np.sqrt(variance)
+    return mean, mean - half_width, mean + half_width
+
+
+def seasonal_naive(values: Sequence[float], horizon: int, season: int = 7, level: float = INTERVAL_LEVEL):
+    """Repeat the last season, with intervals from seasonal differences"""
+    y = np.asarray(values, dtype=float)
+    last_season = y[-season:]
+    mean = np.resize(last_season, horizon)
+    diffs = y[season:] - y[:-season]
+    sigma = diffs.std() if len(diffs) > 1 else 0.0
+    k = np.floor(np.arange(horizon) / season) + 1
+    half_width = _Z[level] * sigma * np.sqrt(k)
+    return mean, mean - half_width, mean + half_width
+
+
+def holt_winters(
+    values: Sequence[float],
+    horizon: int,
+    season: int = 7,
+    alpha: float = 0.3,
+    beta: float = 0.05,
+    gamma: float = 0.2,
+    level: float = INTERVAL_LEVEL
+):
+    """Additive Holt-Winters; needs at least two full seasons of data"""
+    y = np.asarray(values, dtype=float)
+    lvl = y[:season].mean()
+    trend = (y[season:2 * season].mean() - lvl) / season
+    seasonal = list(y[:season] - lvl)
+
+    errors = []
+    for t in range(season, len(y)):
+        s = seasonal[t - season]
+        errors.append(y[t] - (lvl + trend + s))
+        prev_lvl = lvl
+        lvl = alpha * (y[t] - s) + (1 - alpha) * (lvl + trend)
+        trend = beta * (lvl - prev_lvl) + (1 - beta) * trend
+        seasonal.append(gamma * (y[t] - lvl) + (1 - gamma) * s)
+
+    h = np.arange(1, horizon + 1)
+    last_season = np.asarray(seasonal[-season:])
+    mean = lvl + h * trend + last_season[(h - 1) % season]
+    sigma = np.std(errors) if len(errors) > 1 else 0.0
+    half_width = _Z[level] * sigma * np.sqrt(h)
+    return mean, mean - half_width, mean + half_width
+
+
+def forecast_series(
+    values: Sequence[float],
+    horizon: int = 7,
+    method: str = "auto",
+    season: int = 7,
+    level: float = INTERVAL_LEVEL
+) -> List[Dict[str, Any]]:
+    """Forecast one chronologically ordered daily series (see ``fill_days``)
+
+    Returns ``[{"day", "value", "lower", "upper", "confidence"}]`` where
+    lower/upper bound the ``confidence`` prediction interval.
+    """
+    values = [v for v in values if v is not None]
+    if not values:
+        return []
+
+    if method == "auto":
+        if len(values) >= 2 * season + 1:
+            method = "holt_winters"
+        elif len(values) >= 3:
+            method = "holt"
+        else:
+            method = "linear"
+
+    if method == "holt_winters":
+        return _format(*holt_winters(values, horizon, season, level=level), level)
+    if method == "seasonal_naive":
+        return _format(*seasonal_naive(values, horizon, season, level=level), level)
+    if method == "linear":
+        mean, lower, upper = linear_trend(_to_matrix([values]), horizon, level)
+    elif method == "holt":
+        mean, lower, upper = holt(_to_matrix([values]), horizon, level)
+    else:
+        raise ValueError(f"Unknown forecast method: {method}")
+    return _format(mean[0], lower[0], upper[0], level)
+
+
+def forecast_batch(
+    series: Dict[str, Sequence[float]],
+    horizon: int = 7,
+    method: str = "holt",
+    level: float = INTERVAL_LEVEL
+) -> Dict[str, List[Dict[str, Any]]]:
+    """Forecast many chronologically ordered daily series in one vectorized call"""
+    keys = [key for key, values in series.items() if len(values)]
+    if not keys:
+        return {}
+
+    Y = _to_matrix([series[key] for key in keys])
+    if method == "holt":
+        mean, lower, upper = holt(Y, horizon, level)
+    elif method == "linear":
+        mean, lower, upper = linear_trend(Y, horizon, level)
+    else:
+        raise ValueError(f"Unsupported batch forecast method: {method}")
+
+    return {
+        key: _format(mean[i], lower[i], upper[i], level)
+        for i, key in enumerate(keys)
+    }
@@ -0,0 +1,113 @@
+import json
+import os
+from typing import Any, AsyncIterator, Tuple
+
+# Rows written per insert_many
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "1000"))
+# Per-row errors echoed back in the response (the count is always exact)
+INGEST_MAX_REPORTED_ERRORS = int(os.getenv("INGEST_MAX_REPORTED_ERRORS", "100"))
+# Largest single row accepted before the stream is rejected
+INGEST_MAX_ROW_BYTES = int(os.getenv("INGEST_MAX_ROW_BYTES", str(64 * 1024)))
+
+
+class IngestFormatError(ValueError):
+    """The body is not valid NDJSON / JSON array framing"""
+
+
+async def iter_ndjson(chunks: AsyncIterator[bytes]) -> AsyncIterator[Tuple[int, Any]]:
+    """Yield (row number, parsed object or exception) per NDJSON line
+
+    Only the current partial line is buffered, so memory stays constant no
+    matter how large the body is. Blank lines are skipped.
+    """
+    buffer = b""
+    row = 0
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        if len(buffer) > INGEST_MAX_ROW_BYTES:
+            raise IngestFormatError(f"Row {row + len(lines) + 1} exceeds {INGEST_MAX_ROW_BYTES} bytes")
+        for line in lines:
+            if not line.strip():
+                continue
+            row += 1
+            yield row, _loads(line)
+    if buffer.strip():
+        yield row + 1, _loads(buffer)
+
+
+async def iter_json_array(chunks: AsyncIterator[bytes]) -> AsyncIterator[Tuple[int, Any]]:
+    """Yield (row number, parsed object or exception) per JSON array element
+
+    Elements are decoded one at a time with ``raw_decode`` as soon as they
+    are complete; the array itself is never materialized.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ""
+    pending = b""
+    row = 0
+    started = finished = False
+    expect_value = True
+
+    async for chunk in chunks:
+        # Hold back an incomplete trailing UTF-8 sequence for the next chunk
+        data = pending + chunk
+        try:
+            buffer += data.decode("utf-8")
+            pending = b""
+        except UnicodeDecodeError as e:
+            if e.start < len(data) - 3:
+                raise IngestFormatError("Body is not valid UTF-8")
+            buffer += data[:e.start].decode("utf-8")
+            pending = data[e.start:]
+
+        position = 0
+        while True:
+            while position < len(buffer) and buffer[position].isspace():
+                position += 1
+            if position == len(buffer):
+                break
+            char = buffer[position]
+
+            if finished:
+                raise IngestFormatError("Unexpected data after the closing bracket")
+            if not started:
+                if char != "[":
+                    raise IngestFormatError("Expected a JSON array")
+                started = True
+                position += 1
+                continue
+            if char == "]" and (expect_value is False or row == 0):
+                finished = True
+                position += 1
+                continue
+            if not expect_value:
+                if char != ",":
+                    raise IngestFormatError(f"Expected ',' after row {row}")
+                expect_value = True
+                position += 1
+                continue
+
+            try:
+                value, end = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                # Incomplete element: wait for more data
+                if len(buffer) - position > INGEST_MAX_ROW_BYTES:
+                    raise IngestFormatError(f"Row {row + 1} is not valid JSON")
+                break
+            row += 1
+            yield row, value
+            position = end
+            expect_value = False
+
+        buffer = buffer[position:]
+
+    if not finished:
+        raise IngestFormatError("JSON array is not terminated")
+
+
+def _loads(line: bytes) -> Any:
+    try:
+        return json.loads(line)
+    except ValueError as e:
+        return e
@@ -0,0 +1,330 @@
+import asyncio
+import json
+import os
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from pydantic import ValidationError
+
+from app.analytics.anomalies import AnomalyDetector, AnomalyStore
+from app.analytics.models import AnalyticsData
+from app.analytics.running_stats import RunningStatsStore, epoch
+
+# kafka, file or memory (memory only works within one process)
+METRIC_STREAM_BROKER = os.getenv("METRIC_STREAM_BROKER", "kafka").lower()
+METRIC_STREAM_TOPIC = os.getenv("METRIC_STREAM_TOPIC", "metric-events")
+METRIC_STREAM_GROUP = os.getenv("METRIC_STREAM_GROUP", "ai-service-stats")
+METRIC_STREAM_FILE = os.getenv("METRIC_STREAM_FILE", "metric-events.ndjson")
+# Same variable the Nest.js server uses for its broker address
+KAFKA_BROKER = os.getenv("KAFKA_BROKER", "localhost:9092")
+METRIC_STREAM_BATCH_SIZE = int(os.getenv("METRIC_STREAM_BATCH_SIZE", "1000"))
+METRIC_STREAM_POLL_MS = int(os.getenv("METRIC_STREAM_POLL_MS", "500"))
+# Also publish points written through this service's own API
+METRIC_STREAM_PUBLISH = os.getenv("METRIC_STREAM_PUBLISH", "false").lower() == "true"
+
+
+def _event_value(doc: Dict[str, Any]) -> bytes:
+    doc = {key: value for key, value in doc.items() if key != "_id"}
+    doc["metric_type"] = getattr(doc["metric_type"], "value", doc["metric_type"])
+    return json.dumps(doc, default=lambda v: v.isoformat() if isinstance(v, datetime) else str(v)).encode()
+
+
+class MemoryBroker:
+    """In-process stand-in for the metric topic (tests and benchmarks)"""
+
+    def __init__(self, topic: str = METRIC_STREAM_TOPIC):
+        self.topic = topic
+        self.log: List[bytes] = []
+        self.position = 0
+        self.committed = 0
+        self._appended = asyncio.Event()
+
+    async def start(self):
+        pass
+
+    async def publish(self, docs: List[Dict[str, Any]]):
+        self.log.extend(_event_value(doc) for doc in docs)
+        self._appended.set()
+
+    async def poll(self, max_records: int, timeout_ms: int) -> List[Dict[str, Any]]:
+        """Next records as {"source", "offset", "value"}"""
+        if self.position >= len(self.log):
+            self._appended.clear()
+            try:
+                await asyncio.wait_for(self._appended.wait(), timeout=timeout_ms / 1000)
+            except asyncio.TimeoutError:
+                return []
+        records = [
+            {"source": f"{self.topic}:0", "offset": offset, "value": self.log[offset]}
+            for offset in range(self.position, min(len(self.log), self.position + max_records))
+        ]
+        self.position += len(records)
+        return records
+
+    async def commit(self):
+        self.committed = self.position
+
+    async def rewind(self):
+        """Redeliver everything after the last commit"""
+        self.position = self.committed
+
+    async def stop(self):
+        pass
+
+
+class FileBroker:
+    """NDJSON file standing in for the topic; offsets are byte positions
+
+    The committed position is kept next to the file (``<path>.offset``) so
+    a restarted consumer resumes where it stopped.
+    """
+
+    def __init__(self, path: str = METRIC_STREAM_FILE, topic: str = METRIC_STREAM_TOPIC):
+        self.path = path
+        self.topic = topic
+        self.offset_path = f"{path}.offset"
+        self.position = 0
+        self.committed = 0
+
+    async def start(self):
+        if os.path.exists(self.offset_path):
+            with open(self.offset_path) as f:
+                self.position = self.committed = int(f.read().strip() or 0)
+
+    async def publish(self, docs: List[Dict[str, Any]]):
+        with open(self.path, "ab") as f:
+            f.writelines(_event_value(doc) + b"\n" for doc in docs)
+
+    def _read(self, max_records: int) -> List[Dict[str, Any]]:
+        if not os.path.exists(self.path):
+            return []
+        records = []
+        with open(self.path, "rb") as f:
+            f.seek(self.position)
+            while len(records) < max_records:
+                line = f.readline()
+                # A line without its newline is still being written
+                if not line.endswith(b"\n"):
+                    break
+                records.append({"source": f"{self.topic}:0", "offset": self.position, "value": line})
+                self.position += len(line)
+        return [record for record in records if record["value"].strip()]
+
+    async def poll(self, max_records: int, timeout_ms: int) -> List[Dict[str, Any]]:
+        records = await asyncio.to_thread(self._read, max_records)
+        if not records:
+            await asyncio.sleep(timeout_ms / 1000)
+        return records
+
+    async def commit(self):
+        with open(self.offset_path, "w") as f:
+            f.write(str(self.position))
+        self.committed = self.position
+
+    async def rewind(self):
+        self.position = self.committed
+
+    async def stop(self):
+        pass
+
+
+class KafkaBroker:
+    """The metric topic on Kafka (requires aiokafka)"""
+
+    def __init__(
+        self,
+        bootstrap_servers: str = KAFKA_BROKER,
+        topic: str = METRIC_STREAM_TOPIC,
+        group_id: str = METRIC_STREAM_GROUP
+    ):
+        self.bootstrap_servers = bootstrap_servers
+        self.topic = topic
+        self.group_id = group_id
+        self.consumer = None
+        self.producer = None
+
+    async def start(self):
+        from aiokafka import AIOKafkaConsumer
+
+        # Offsets are committed only after the batch is applied
+        self.consumer = AIOKafkaConsumer(
+            self.topic,
+            bootstrap_servers=self.bootstrap_servers,
+            group_id=self.group_id,
+            enable_auto_commit=False,
+            auto_offset_reset="earliest"
+        )
+        await self.consumer.start()
+
+    async def publish(self, docs: List[Dict[str, Any]]):
+        if self.producer is None:
+            from aiokafka import AIOKafkaProducer
+
+            self.producer = AIOKafkaProducer(bootstrap_servers=self.bootstrap_servers, linger_ms=5)
+            await self.producer.start()
+        # Keyed by user so one user's points stay ordered on one partition;
+        # send() enqueues and returns a delivery future
+        await asyncio.gather(*[
+            await self.producer.send(self.topic, _event_value(doc), key=doc["user_id"].encode())
+            for doc in docs
+        ])
+
+    async def poll(self, max_records: int, timeout_ms: int) -> List[Dict[str, Any]]:
+        batches = await self.consumer.getmany(timeout_ms=timeout_ms, max_records=max_records)
+        return [
+            {"source": f"{tp.topic}:{tp.partition}", "offset": message.offset, "value": message.value}
+            for tp, messages in batches.items()
+            for message in messages
+        ]
+
+    async def commit(self):
+        await self.consumer.commit()
+
+    async def rewind(self):
+        await self.consumer.seek_to_committed()
+
+    async def stop(self):
+        if self.consumer is not None:
+            await self.consumer.stop()
+        if self.producer is not None:
+            await self.producer.stop()
+
+
+def create_broker(kind: str = METRIC_STREAM_BROKER):
+    """Broker for the configured METRIC_STREAM_BROKER"""
+    if kind == "file":
+        return FileBroker()
+    if kind == "memory":
+        return MemoryBroker()
+    if kind == "kafka":
+        return KafkaBroker()
+    raise ValueError(f"Unknown metric stream broker: {kind}")
+
+
+class MetricStreamConsumer:
+    """Folds metric events into the running statistics.
+
+    Each poll is validated as AnalyticsData, applied to the store in one
+    transaction (with the offsets it covers) and then committed to the
+    broker. Records at or below an already applied offset are skipped, so
+    a crash between the two steps does not count points twice. A batch
+    that fails to apply is rewound and redelivered by the next poll, and
+    the heartbeat is only written once a poll has been handled, so readers
+    stop trusting the aggregates while the consumer is failing.
+
+    With a detector, every new point is also scored for anomalies (in
+    timestamp order within the batch) and the anomaly insights found are
+    saved before the batch is committed. If saving or applying fails, the
+    detector state of the batch's series is restored, so the redelivered
+    batch is scored once; saves are idempotent either way.
+    """
+
+    def __init__(
+        self,
+        broker,
+        store: Optional[RunningStatsStore] = None,
+        batch_size: int = METRIC_STREAM_BATCH_SIZE,
+        detector: Optional[AnomalyDetector] = None,
+        anomaly_store: Optional[AnomalyStore] = None
+    ):
+        self.broker = broker
+        self.store = store or RunningStatsStore()
+        self.batch_size = batch_size
+        self.detector = detector
+        self.anomaly_store = anomaly_store or (AnomalyStore() if detector else None)
+        self.applied: Dict[str, int] = {}
+        self.consumed = 0
+        self.rejected = 0
+        self.duplicates = 0
+        self.batches = 0
+        self._task: Optional[asyncio.Task] = None
+
+    async def process(self, records: List[Dict[str, Any]]) -> int:
+        """Apply one polled batch; returns the number of points folded"""
+        # Re-read every batch: after a rebalance another consumer may have
+        # applied records of a partition we now own
+        self.applied = await self.store.applied_offsets()
+        points, events, offsets = [], [], {}
+        for record in records:
+            source, offset = record["source"], record["offset"]
+            if offset <= self.applied.get(source, -1):
+                self.duplicates += 1
+                continue
+            offsets[source] = max(offset, offsets.get(source, -1))
+            try:
+                data = AnalyticsData(**json.loads(record["value"]))
+                ts = epoch(data.timestamp)
+            except (ValueError, TypeError, ValidationError) as e:
+                self.rejected += 1
+                print(f"❌ Skipping metric event {source}@{offset}: {str(e).splitlines()[0]}")
+                continue
+            points.append((data.user_id, data.metric_type.value, data.value, ts))
+            events.append((ts, data))
+
+        snapshot = None
+        try:
+            if self.detector and events:
+                snapshot = self.detector.snapshot([(user_id, metric_type) for user_id, metric_type, _, _ in points])
+                # Epoch seconds, since aware and naive timestamps don't compare
+                events.sort(key=lambda event: event[0])
+                anomalies = []
+                for _, data in events:
+                    insight = self.detector.update(data.user_id, data.metric_type.value, data.value, data.timestamp)
+                    if insight:
+                        anomalies.append((data.user_id, insight))
+                await self.anomaly_store.save(anomalies)
+
+            if offsets:
+                await self.store.apply(points, offsets)
+                self.applied.update(offsets)
+        except Exception:
+            if snapshot is not None:
+                self.detector.restore(snapshot)
+            raise
+        self.consumed += len(points)
+        self.batches += 1
+        return len(points)
+
+    async def run_once(self, timeout_ms: int = METRIC_STREAM_POLL_MS) -> int:
+        records = await self.broker.poll(self.batch_size, timeout_ms)
+        count = 0
+        if records:
+            try:
+                count = await self.process(records)
+            except Exception:
+                await self.broker.rewind()
+                raise
+            await self.broker.commit()
+        await self.store.heartbeat()
+        return count
+
+    async def _run(self):
+        while True:
+            try:
+                await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"❌ Metric stream poll failed: {e}")
+                await asyncio.sleep(1)
+
+    async def start(self):
+        await self.broker.start()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.broker.stop()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "consumed": self.consumed,
+            "rejected": self.rejected,
+            "duplicates": self.duplicates,
+            "batches": self.batches,
+            "store_errors": self.store.errors,
+            "anomalies": self.detector.stats() if self.detector else None
+        }
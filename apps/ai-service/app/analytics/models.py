@@ -40,6 +40,9 @@ class MetricDetails(BaseModel):
     trend: str  # "up", "down", "stable"
     data_points: List[AnalyticsData]
     summary: Optional[str] = None
+    forecast: Optional[List[Dict[str, Any]]] = None
+    trend_direction: Optional[str] = None  # regression over the window: "increasing", "decreasing", "stable"
+    trend_strength: Optional[float] = None
 
 class DashboardData(BaseModel):
     user_id: str
@@ -47,12 +50,17 @@ class DashboardData(BaseModel):
     insights: List[str]
     last_updated: datetime = Field(default_factory=datetime.utcnow)
     time_range: TimeRange = TimeRange.WEEK
+    partial: bool = False  # True when some metric summaries or the insights timed out/failed
+    missing_metrics: List[MetricType] = []
+    insights_error: Optional[str] = None  # why the insights are a placeholder, if they are
 
 class TrendAnalysis(BaseModel):
     metric_type: MetricType
     time_range: TimeRange
     trend_direction: str  # "increasing", "decreasing", "stable"
     trend_strength: float  # 0-1 scale
+    trend_slope: Optional[float] = None  # units per day
+    r_squared: Optional[float] = None
     forecast: Optional[List[Dict[str, Any]]] = None
     insights: List[str]
     recommendations: List[str]
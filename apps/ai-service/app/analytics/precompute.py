@@ -0,0 +1,359 @@
+import asyncio
+import json
+import os
+import time
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from fastapi.encoders import jsonable_encoder
+
+from app.database.mongodb import get_database
+from app.database.redis_client import get_redis_client
+
+# Precomputed results older than this many seconds are refreshed
+INSIGHT_REFRESH_INTERVAL = int(os.getenv("INSIGHT_REFRESH_INTERVAL", "900"))
+# Users who viewed insights within this many seconds are kept warm
+INSIGHT_ACTIVE_WINDOW = int(os.getenv("INSIGHT_ACTIVE_WINDOW", "86400"))
+# Seconds after a user's first unprocessed data change before refreshing,
+# so a burst of writes costs one refresh
+INSIGHT_CHANGE_DEBOUNCE = float(os.getenv("INSIGHT_CHANGE_DEBOUNCE", "30"))
+INSIGHT_WORKER_CONCURRENCY = int(os.getenv("INSIGHT_WORKER_CONCURRENCY", "4"))
+INSIGHT_WORKER_TICK = float(os.getenv("INSIGHT_WORKER_TICK", "5"))
+# Upper bound on one user's refresh; the lock expires after it
+INSIGHT_LOCK_TTL = int(os.getenv("INSIGHT_LOCK_TTL", "120"))
+# Time ranges precomputed for /insights (the dashboard always uses 7d)
+INSIGHT_TIME_RANGES = [r for r in os.getenv("INSIGHT_TIME_RANGES", "7d").split(",") if r]
+# "inline" runs the worker in every API process; "off" leaves it to worker.py
+INSIGHT_WORKER = os.getenv("INSIGHT_WORKER", "inline").lower()
+
+
+class InsightStore:
+    """Precomputed insights and dashboards.
+
+    Results live in Redis for fast reads and in the ``ai_insights``
+    collection as the durable copy, one document per (user, insight type,
+    time range). Two sorted sets drive the worker: ``active`` (user ->
+    last view) and ``changed`` (user -> first unprocessed data change).
+    """
+
+    def __init__(self, prefix: str = "ai_insights"):
+        self.prefix = prefix
+        self.active_key = f"{prefix}:active"
+        self.changed_key = f"{prefix}:changed"
+        self.errors = 0
+
+    def _key(self, user_id: str, kind: str, time_range: str) -> str:
+        return f"{self.prefix}:{kind}:{user_id}:{time_range}"
+
+    async def get(self, user_id: str, kind: str, time_range: str) -> Optional[Dict[str, Any]]:
+        """Stored {"data", "generated_at"} for a result, or None"""
+        key = self._key(user_id, kind, time_range)
+        try:
+            redis = await get_redis_client()
+            cached = await redis.get(key)
+            if cached is not None:
+                entry = json.loads(cached)
+                entry["generated_at"] = datetime.fromisoformat(entry["generated_at"])
+                return entry
+        except Exception:
+            self.errors += 1
+
+        try:
+            db = await get_database()
+            doc = await db.ai_insights.find_one(
+                {"user_id": user_id, "insight_type": kind, "time_range": time_range},
+                {"_id": 0, "data": 1, "generated_at": 1}
+            )
+        except Exception:
+            self.errors += 1
+            return None
+        if doc:
+            # Warm Redis again, e.g. after a Redis restart
+            await self._cache(key, doc["data"], doc["generated_at"])
+        return doc
+
+    async def put(self, user_id: str, kind: str, time_range: str, data: Any, generated_at: datetime):
+        """Store a freshly computed result in Redis and MongoDB"""
+        data = jsonable_encoder(data)
+        await self._cache(self._key(user_id, kind, time_range), data, generated_at)
+        try:
+            db = await get_database()
+            await db.ai_insights.update_one(
+                {"user_id": user_id, "insight_type": kind, "time_range": time_range},
+                {
+                    "$set": {"data": data, "generated_at": generated_at},
+                    "$setOnInsert": {"createdAt": generated_at}
+                },
+                upsert=True
+            )
+        except Exception as e:
+            self.errors += 1
+            print(f"❌ Failed to store {kind} insights for {user_id}: {e}")
+
+    async def _cache(self, key: str, data: Any, generated_at: datetime):
+        try:
+            redis = await get_redis_client()
+            entry = {"data": data, "generated_at": generated_at.isoformat()}
+            # Kept past the refresh interval so a stale result can still be served
+            await redis.set(key, json.dumps(entry), ex=INSIGHT_ACTIVE_WINDOW)
+        except Exception:
+            self.errors += 1
+
+    async def mark_active(self, user_id: str):
+        """Record a view so the worker keeps this user's results fresh"""
+        try:
+            redis = await get_redis_client()
+            await redis.zadd(self.active_key, {user_id: time.time()})
+        except Exception:
+            self.errors += 1
+
+    async def mark_changed(self, user_ids: Iterable[str], now: Optional[float] = None):
+        """Record new data; the earliest pending change time is kept"""
+        user_ids = list(user_ids)
+        if not user_ids:
+            return
+        now = now if now is not None else time.time()
+        try:
+            redis = await get_redis_client()
+            await redis.zadd(self.changed_key, {user_id: now for user_id in user_ids}, nx=True)
+        except Exception:
+            self.errors += 1
+
+    async def claim_changed(self, before: float, limit: int) -> List[str]:
+        """Take users whose pending change is older than ``before``
+
+        ZREM decides the winner when several workers see the same user.
+        """
+        redis = await get_redis_client()
+        candidates = await redis.zrangebyscore(self.changed_key, "-inf", before, start=0, num=limit)
+        if not candidates:
+            return []
+        pipe = redis.pipeline(transaction=False)
+        for user_id in candidates:
+            pipe.zrem(self.changed_key, user_id)
+        removed = await pipe.execute()
+        return [user_id for user_id, won in zip(candidates, removed) if won]
+
+    async def active_users(self, now: float) -> List[str]:
+        """Users seen within the active window (older entries are pruned)"""
+        redis = await get_redis_client()
+        await redis.zremrangebyscore(self.active_key, "-inf", now - INSIGHT_ACTIVE_WINDOW)
+        return await redis.zrangebyscore(self.active_key, now - INSIGHT_ACTIVE_WINDOW, "+inf")
+
+    async def is_active(self, user_ids: List[str], now: float) -> List[bool]:
+        redis = await get_redis_client()
+        pipe = redis.pipeline(transaction=False)
+        for user_id in user_ids:
+            pipe.zscore(self.active_key, user_id)
+        scores = await pipe.execute()
+        return [score is not None and score >= now - INSIGHT_ACTIVE_WINDOW for score in scores]
+
+    async def generated_times(self, user_ids: List[str]) -> List[Optional[datetime]]:
+        """When each user's dashboard was last generated (None if never)"""
+        redis = await get_redis_client()
+        pipe = redis.pipeline(transaction=False)
+        for user_id in user_ids:
+            pipe.get(self._key(user_id, "dashboard", "7d"))
+        entries = await pipe.execute()
+        return [
+            datetime.fromisoformat(json.loads(entry)["generated_at"]) if entry else None
+            for entry in entries
+        ]
+
+    async def acquire(self, user_id: str) -> bool:
+        """Cross-process lock on refreshing one user"""
+        try:
+            redis = await get_redis_client()
+            return bool(await redis.set(f"{self.prefix}:lock:{user_id}", "1", nx=True, ex=INSIGHT_LOCK_TTL))
+        except Exception:
+            # Without Redis a duplicate refresh is better than none
+            self.errors += 1
+            return True
+
+    async def release(self, user_id: str):
+        try:
+            redis = await get_redis_client()
+            await redis.delete(f"{self.prefix}:lock:{user_id}")
+        except Exception:
+            self.errors += 1
+
+
+def data_age(generated_at: datetime, now: Optional[datetime] = None) -> float:
+    """Seconds since a result was generated"""
+    return max(0.0, ((now or datetime.utcnow()) - generated_at).total_seconds())
+
+
+class InsightWorker:
+    """Keeps insights and dashboards precomputed for active users.
+
+    Every tick it refreshes users whose data changed at least
+    ``INSIGHT_CHANGE_DEBOUNCE`` seconds ago and active users whose results
+    are older than ``INSIGHT_REFRESH_INTERVAL``, at most ``concurrency`` at
+    a time. Users nobody has viewed recently are skipped, so ingest alone
+    never spends LLM calls. Endpoints call ``refresh_user`` directly on a
+    miss; concurrent misses for one user share a single computation.
+    """
+
+    def __init__(
+        self,
+        analytics_service,
+        store: InsightStore,
+        concurrency: int = INSIGHT_WORKER_CONCURRENCY,
+        broadcaster=None
+    ):
+        self.analytics_service = analytics_service
+        self.store = store
+        # Tells the user's sockets which results were refreshed, if set
+        self.broadcaster = broadcaster
+        self.concurrency = concurrency
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._task: Optional[asyncio.Task] = None
+        self.refreshed = 0
+        self.skipped_locked = 0
+        self.errors = 0
+        self.last_tick: Optional[datetime] = None
+
+    async def refresh_user(self, user_id: str) -> Optional[Dict[str, Any]]:
+        """Recompute and store a user's results
+
+        Returns {"generated_at", "results", "failures"} with results and
+        exceptions keyed by (insight type, time range), or None when another
+        process holds the user's lock. Raises if every result failed.
+        """
+        task = self._inflight.get(user_id)
+        if task is None:
+            task = asyncio.create_task(self._refresh(user_id))
+            self._inflight[user_id] = task
+            task.add_done_callback(lambda _: self._inflight.pop(user_id, None))
+        return await asyncio.shield(task)
+
+    async def _refresh(self, user_id: str) -> Optional[Dict[str, Any]]:
+        """Compute and store every precomputed result of a user
+
+        A result whose computation fails is not stored, so the previous one
+        stays in place (served as stale) until a later pass succeeds.
+        """
+        if not await self.store.acquire(user_id):
+            self.skipped_locked += 1
+            return None
+        try:
+            generated_at = datetime.utcnow()
+            results: Dict[Tuple[str, str], Any] = {}
+            failures: Dict[Tuple[str, str], Exception] = {}
+
+            outcomes = await asyncio.gather(*[
+                self.analytics_service.generate_insights(user_id, time_range)
+                for time_range in INSIGHT_TIME_RANGES
+            ], return_exceptions=True)
+            for time_range, outcome in zip(INSIGHT_TIME_RANGES, outcomes):
+                if isinstance(outcome, Exception):
+                    failures[("insights", time_range)] = outcome
+                else:
+                    results[("insights", time_range)] = outcome
+
+            if ("insights", "7d") in failures:
+                failures[("dashboard", "7d")] = failures[("insights", "7d")]
+            else:
+                try:
+                    # The dashboard reuses the 7d insights rather than asking the LLM again
+                    dashboard = await self.analytics_service.get_dashboard_data(
+                        user_id, insights=results.get(("insights", "7d"))
+                    )
+                    dashboard.last_updated = generated_at
+                    results[("dashboard", "7d")] = dashboard
+                except Exception as e:
+                    failures[("dashboard", "7d")] = e
+
+            await asyncio.gather(*[
+                self.store.put(user_id, kind, time_range, result, generated_at)
+                for (kind, time_range), result in results.items()
+            ])
+            if self.broadcaster is not None and results:
+                self.broadcaster.publish_to_user(user_id, {
+                    "type": "insights_updated",
+                    "results": [{"kind": kind, "time_range": time_range} for kind, time_range in results],
+                    "generated_at": generated_at.isoformat()
+                })
+        except Exception as e:
+            self.errors += 1
+            print(f"❌ Failed to precompute insights for {user_id}: {e}")
+            raise
+        finally:
+            await self.store.release(user_id)
+
+        if failures:
+            self.errors += 1
+            for (kind, time_range), error in failures.items():
+                print(f"❌ Failed to precompute {kind} ({time_range}) for {user_id}: {error}")
+            if not results:
+                raise next(iter(failures.values()))
+        else:
+            self.refreshed += 1
+        return {"generated_at": generated_at, "results": results, "failures": failures}
+
+    async def _bounded_refresh(self, user_id: str):
+        async with self._semaphore:
+            try:
+                await self.refresh_user(user_id)
+            except Exception:
+                pass
+
+    async def run_once(self, now: Optional[float] = None) -> List[str]:
+        """One scheduling pass; returns the users refreshed"""
+        now = now if now is not None else time.time()
+        self.last_tick = datetime.utcnow()
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+
+        # Data changes past the debounce, for users someone is looking at
+        changed = await self.store.claim_changed(now - INSIGHT_CHANGE_DEBOUNCE, limit=self.concurrency * 25)
+        due = set()
+        if changed:
+            due.update(user_id for user_id, active in zip(changed, await self.store.is_active(changed, now)) if active)
+
+        # Scheduled refresh of active users with old (or no) results
+        active = await self.store.active_users(now)
+        if active:
+            cutoff = datetime.utcfromtimestamp(now - INSIGHT_REFRESH_INTERVAL)
+            for user_id, generated_at in zip(active, await self.store.generated_times(active)):
+                if generated_at is None or generated_at < cutoff:
+                    due.add(user_id)
+
+        due.difference_update(self._inflight)
+        await asyncio.gather(*[self._bounded_refresh(user_id) for user_id in due])
+        return sorted(due)
+
+    async def _run(self, tick: float):
+        while True:
+            try:
+                await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.errors += 1
+                print(f"❌ Insight worker pass failed: {e}")
+            await asyncio.sleep(tick)
+
+    def start(self, tick: float = INSIGHT_WORKER_TICK):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(tick))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._inflight:
+            await asyncio.gather(*self._inflight.values(), return_exceptions=True)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "running": self._task is not None and not self._task.done(),
+            "refreshed": self.refreshed,
+            "in_flight": len(self._inflight),
+            "skipped_locked": self.skipped_locked,
+            "errors": self.errors,
+            "store_errors": self.store.errors,
+            "last_tick": self.last_tick.isoformat() if self.last_tick else None
+        }
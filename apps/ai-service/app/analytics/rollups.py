@@ -0,0 +1,406 @@
+import asyncio
+import os
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from pymongo import UpdateOne
+
+from app.database.redis_client import get_redis_client
+
+# Rollup resolutions, finest first, with their bucket width in seconds
+RESOLUTIONS = {"minute": 60, "hour": 3600, "day": 86400}
+# A resolution is used only if the time range spans at least this many buckets
+ROLLUP_MIN_BUCKETS = int(os.getenv("ROLLUP_MIN_BUCKETS", "24"))
+# Shorter ranges read raw points unless the caller asks for downsampling
+ROLLUP_MIN_RANGE_DAYS = float(os.getenv("ROLLUP_MIN_RANGE_DAYS", "30"))
+# Set to "false" to always read raw points
+ANALYTICS_ROLLUPS = os.getenv("ANALYTICS_ROLLUPS", "true").lower() == "true"
+# Retries of a failed rollup update, with full-jitter backoff (seconds),
+# before its span is marked dirty
+ROLLUP_RETRIES = int(os.getenv("ROLLUP_RETRIES", "2"))
+ROLLUP_RETRY_BASE = float(os.getenv("ROLLUP_RETRY_BASE", "0.05"))
+ROLLUP_RETRY_CAP = float(os.getenv("ROLLUP_RETRY_CAP", "1"))
+# Seconds between maintenance passes (backfill, dirty repair, reconcile)
+ROLLUP_MAINTENANCE_INTERVAL = int(os.getenv("ROLLUP_MAINTENANCE_INTERVAL", "300"))
+# Users backfilled per maintenance pass
+ROLLUP_BACKFILL_BATCH = int(os.getenv("ROLLUP_BACKFILL_BATCH", "20"))
+# Each pass rebuilds the days touching the last N hours for every user, so
+# points written straight to analytics_data (the Nest.js server) reach the
+# rollups; 0 disables
+ROLLUP_RECONCILE_HOURS = float(os.getenv("ROLLUP_RECONCILE_HOURS", "2"))
+
+ROLLUP_COLLECTION = "analytics_rollups"
+# Per user: valid_since (rollups are complete from there on, set by the
+# backfill) and dirty_from/dirty_to (a span whose incremental update failed)
+ROLLUP_STATE_COLLECTION = "analytics_rollup_state"
+# Watermark for a backfill that covered all of a user's points
+ROLLUP_EPOCH = datetime(1970, 1, 1)
+
+
+def utc_naive(timestamp: datetime) -> datetime:
+    """Naive UTC datetime, as MongoDB returns them, for aware or naive input"""
+    if timestamp.tzinfo:
+        return timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+    return timestamp
+
+
+def bucket_start(timestamp: datetime, resolution: str) -> datetime:
+    """Start of the UTC bucket containing timestamp"""
+    timestamp = utc_naive(timestamp)
+    if resolution == "day":
+        return timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+    if resolution == "hour":
+        return timestamp.replace(minute=0, second=0, microsecond=0)
+    return timestamp.replace(second=0, microsecond=0)
+
+
+def choose_resolution(
+    since: datetime,
+    max_points: Optional[int] = None,
+    now: Optional[datetime] = None
+) -> Optional[str]:
+    """Coarsest resolution that still gives enough buckets over the range
+
+    Ranges shorter than ROLLUP_MIN_RANGE_DAYS read raw points unless the
+    caller downsamples to max_points anyway; then at least max_points
+    buckets (and ROLLUP_MIN_BUCKETS) are required. Returns None when raw
+    points should be read.
+    """
+    if not ANALYTICS_ROLLUPS:
+        return None
+    span = ((now or datetime.utcnow()) - since).total_seconds()
+    if max_points is None and span < ROLLUP_MIN_RANGE_DAYS * 86400:
+        return None
+    min_buckets = max(ROLLUP_MIN_BUCKETS, max_points or 0)
+    for resolution in reversed(list(RESOLUTIONS)):
+        if span / RESOLUTIONS[resolution] >= min_buckets:
+            return resolution
+    return None
+
+
+def rollup_updates(docs: List[Dict[str, Any]]) -> List[UpdateOne]:
+    """Upserts folding a batch of raw points into every resolution
+
+    Points are pre-aggregated per (user, metric, resolution, bucket) so a
+    batch costs one update per touched bucket rather than one per point.
+    Merging uses an update pipeline so ``last`` follows the newest
+    timestamp even when points arrive out of order.
+    """
+    partials: Dict[Tuple[str, str, str, datetime], Dict[str, Any]] = defaultdict(
+        lambda: {"count": 0, "sum": 0.0, "min": None, "max": None, "last": None, "last_ts": None}
+    )
+    for doc in docs:
+        metric_type = getattr(doc["metric_type"], "value", doc["metric_type"])
+        value, timestamp = doc["value"], utc_naive(doc["timestamp"])
+        for resolution in RESOLUTIONS:
+            partial = partials[(doc["user_id"], metric_type, resolution, bucket_start(timestamp, resolution))]
+            partial["count"] += 1
+            partial["sum"] += value
+            partial["min"] = value if partial["min"] is None else min(partial["min"], value)
+            partial["max"] = value if partial["max"] is None else max(partial["max"], value)
+            if partial["last_ts"] is None or timestamp >= partial["last_ts"]:
+                partial["last"], partial["last_ts"] = value, timestamp
+
+    updates = []
+    for (user_id, metric_type, resolution, bucket), partial in partials.items():
+        newer = {"$gte": [partial["last_ts"], {"$ifNull": ["$last_ts", partial["last_ts"]]}]}
+        updates.append(UpdateOne(
+            {"user_id": user_id, "metric_type": metric_type, "resolution": resolution, "bucket": bucket},
+            [{"$set": {
+                "count": {"$add": [{"$ifNull": ["$count", 0]}, partial["count"]]},
+                "sum": {"$add": [{"$ifNull": ["$sum", 0]}, partial["sum"]]},
+                "min": {"$min": [{"$ifNull": ["$min", partial["min"]]}, partial["min"]]},
+                "max": {"$max": [{"$ifNull": ["$max", partial["max"]]}, partial["max"]]},
+                "last": {"$cond": [newer, partial["last"], "$last"]},
+                "last_ts": {"$cond": [newer, partial["last_ts"], "$last_ts"]}
+            }}],
+            upsert=True
+        ))
+    return updates
+
+
+async def apply_rollups(db, docs: List[Dict[str, Any]]):
+    """Fold newly inserted raw points into the rollup buckets
+
+    Users seen for the first time get a state without a watermark, which
+    queues them for the backfill.
+    """
+    updates = rollup_updates(docs)
+    if updates:
+        await db[ROLLUP_COLLECTION].bulk_write(updates, ordered=False)
+        await db[ROLLUP_STATE_COLLECTION].bulk_write(
+            [
+                UpdateOne({"user_id": user_id}, {"$setOnInsert": {"valid_since": None}}, upsert=True)
+                for user_id in {doc["user_id"] for doc in docs}
+            ],
+            ordered=False
+        )
+
+
+async def mark_dirty(db, docs: List[Dict[str, Any]]):
+    """Record the span of points whose rollup update failed, per user"""
+    spans: Dict[str, Tuple[datetime, datetime]] = {}
+    for doc in docs:
+        timestamp = utc_naive(doc["timestamp"])
+        first, last = spans.get(doc["user_id"], (timestamp, timestamp))
+        spans[doc["user_id"]] = (min(first, timestamp), max(last, timestamp))
+    if spans:
+        await db[ROLLUP_STATE_COLLECTION].bulk_write(
+            [
+                UpdateOne(
+                    {"user_id": user_id},
+                    {"$min": {"dirty_from": first}, "$max": {"dirty_to": last}},
+                    upsert=True
+                )
+                for user_id, (first, last) in spans.items()
+            ],
+            ordered=False
+        )
+
+
+def rollups_cover(state: Optional[Dict[str, Any]], start: datetime) -> bool:
+    """Whether a user's rollups are complete from start (a bucket start) on"""
+    if not state or state.get("valid_since") is None or state["valid_since"] > start:
+        return False
+    return state.get("dirty_to") is None or state["dirty_to"] < start
+
+
+def rollup_point(doc: Dict[str, Any]) -> Dict[str, Any]:
+    """Shape a rollup bucket like a raw point (mean as the value)"""
+    return {
+        "metric_type": doc["metric_type"],
+        "value": doc["sum"] / doc["count"],
+        "user_id": doc["user_id"],
+        "timestamp": doc["bucket"],
+        "metadata": {
+            "resolution": doc["resolution"],
+            "count": doc["count"],
+            "min": doc["min"],
+            "max": doc["max"],
+            "last": doc["last"]
+        }
+    }
+
+
+async def read_rollups(
+    db,
+    user_id: str,
+    resolution: str,
+    since: datetime,
+    metric_types: Optional[List[str]] = None,
+    limit: int = 10000
+) -> List[Dict[str, Any]]:
+    """Newest rollup buckets covering since..now, newest first
+
+    Returns nothing unless the user's rollups are known to be complete over
+    the range (backfilled before it, not dirty inside it), so callers read
+    raw points instead.
+    """
+    start = bucket_start(since, resolution)
+    if not rollups_cover(await db[ROLLUP_STATE_COLLECTION].find_one({"user_id": user_id}), start):
+        return []
+
+    query = {
+        "user_id": user_id,
+        "resolution": resolution,
+        "bucket": {"$gte": start}
+    }
+    if metric_types:
+        query["metric_type"] = metric_types[0] if len(metric_types) == 1 else {"$in": metric_types}
+
+    cursor = db[ROLLUP_COLLECTION].find(query, {"_id": 0}).sort("bucket", -1).limit(limit)
+    return await cursor.to_list(length=limit)
+
+
+def rebuild_pipeline(resolution: str, match: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+    """Aggregation recomputing one resolution from raw points into the rollups"""
+    return [
+        {"$match": match or {}},
+        {"$group": {
+            "_id": {
+                "user_id": "$user_id",
+                "metric_type": "$metric_type",
+                "bucket": {"$dateTrunc": {"date": "$timestamp", "unit": resolution}}
+            },
+            "count": {"$sum": 1},
+            "sum": {"$sum": "$value"},
+            "min": {"$min": "$value"},
+            "max": {"$max": "$value"},
+            "latest": {"$top": {"sortBy": {"timestamp": -1}, "output": ["$value", "$timestamp"]}}
+        }},
+        {"$project": {
+            "_id": 0,
+            "user_id": "$_id.user_id",
+            "metric_type": "$_id.metric_type",
+            "resolution": {"$literal": resolution},
+            "bucket": "$_id.bucket",
+            "count": 1,
+            "sum": 1,
+            "min": 1,
+            "max": 1,
+            "last": {"$arrayElemAt": ["$latest", 0]},
+            "last_ts": {"$arrayElemAt": ["$latest", 1]}
+        }},
+        {"$merge": {
+            "into": ROLLUP_COLLECTION,
+            "on": ["user_id", "metric_type", "resolution", "bucket"],
+            "whenMatched": "replace",
+            "whenNotMatched": "insert"
+        }}
+    ]
+
+
+async def rebuild_rollups(db, user_id: Optional[str] = None, since: Optional[datetime] = None):
+    """Recompute rollups from raw points (backfill, or repair after bulk edits)
+
+    Rebuilding all of a user's points (or everyone's) marks the rollups
+    complete. A partial rebuild of one user only moves an existing
+    watermark back to the first rebuilt day; buckets before it may still
+    be missing points.
+    """
+    match: Dict[str, Any] = {}
+    if user_id:
+        match["user_id"] = user_id
+    start = bucket_start(since, "day") if since else ROLLUP_EPOCH
+    if since:
+        match["timestamp"] = {"$gte": start}
+    for resolution in RESOLUTIONS:
+        await db.analytics_data.aggregate(rebuild_pipeline(resolution, match)).to_list(length=None)
+    if user_id and since is None:
+        await db[ROLLUP_STATE_COLLECTION].update_one(
+            {"user_id": user_id}, {"$set": {"valid_since": ROLLUP_EPOCH}}, upsert=True
+        )
+    elif user_id:
+        await db[ROLLUP_STATE_COLLECTION].update_one(
+            {"user_id": user_id, "valid_since": {"$ne": None}}, {"$min": {"valid_since": start}}
+        )
+    elif since is None:
+        users = await db.analytics_data.aggregate([{"$group": {"_id": "$user_id"}}]).to_list(length=None)
+        if users:
+            await db[ROLLUP_STATE_COLLECTION].bulk_write(
+                [
+                    UpdateOne({"user_id": user["_id"]}, {"$set": {"valid_since": ROLLUP_EPOCH}}, upsert=True)
+                    for user in users
+                ],
+                ordered=False
+            )
+
+
+async def backfill_pending(db, limit: int = ROLLUP_BACKFILL_BATCH) -> int:
+    """Fully rebuild users whose rollups have no watermark yet"""
+    backfilled = 0
+    async for state in db[ROLLUP_STATE_COLLECTION].find({"valid_since": None}).limit(limit):
+        await rebuild_rollups(db, state["user_id"])
+        backfilled += 1
+    return backfilled
+
+
+async def repair_dirty(db) -> int:
+    """Rebuild every dirty span from raw points and clear its mark"""
+    repaired = 0
+    async for state in db[ROLLUP_STATE_COLLECTION].find({"dirty_to": {"$ne": None}}):
+        await rebuild_rollups(db, state["user_id"], state["dirty_from"])
+        # A failure marked while rebuilding widens the span and keeps the mark
+        result = await db[ROLLUP_STATE_COLLECTION].update_one(
+            {"_id": state["_id"], "dirty_from": state["dirty_from"], "dirty_to": state["dirty_to"]},
+            {"$unset": {"dirty_from": "", "dirty_to": ""}}
+        )
+        repaired += result.modified_count
+    return repaired
+
+
+class RollupMaintainer:
+    """Background upkeep of the rollups, one process at a time.
+
+    Each pass backfills users without a watermark, repairs dirty spans and
+    rebuilds the most recent days for everyone. Runs next to the insight
+    worker; a Redis lock keeps concurrent processes from duplicating work.
+    """
+
+    lock_key = "analytics_rollups:maintenance"
+
+    def __init__(self, interval: float = ROLLUP_MAINTENANCE_INTERVAL):
+        self.interval = interval
+        self.passes = 0
+        self.backfilled = 0
+        self.repaired = 0
+        self.errors = 0
+        self.last_pass: Optional[datetime] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def run_once(self, db=None) -> bool:
+        """One maintenance pass; False if another process holds the lock"""
+        redis = await get_redis_client()
+        if not await redis.set(self.lock_key, "1", nx=True, ex=max(int(self.interval), 1)):
+            return False
+        if db is None:
+            from app.database.mongodb import get_database
+
+            db = await get_database()
+        self.backfilled += await backfill_pending(db)
+        self.repaired += await repair_dirty(db)
+        if ROLLUP_RECONCILE_HOURS > 0:
+            await rebuild_rollups(db, since=datetime.utcnow() - timedelta(hours=ROLLUP_RECONCILE_HOURS))
+        self.passes += 1
+        self.last_pass = datetime.utcnow()
+        return True
+
+    async def _run(self):
+        while True:
+            try:
+                await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.errors += 1
+                print(f"❌ Rollup maintenance pass failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        if ANALYTICS_ROLLUPS and (self._task is None or self._task.done()):
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "running": self._task is not None and not self._task.done(),
+            "passes": self.passes,
+            "backfilled": self.backfilled,
+            "repaired": self.repaired,
+            "errors": self.errors,
+            "last_pass": self.last_pass.isoformat() if self.last_pass else None
+        }
+
+
+if __name__ == "__main__":
+    import argparse
+    import asyncio
+
+    from app.database.mongodb import close_mongo_connection, get_database
+
+    parser = argparse.ArgumentParser(description="Rebuild analytics rollups from raw points")
+    parser.add_argument("--user-id")
+    parser.add_argument("--days", type=int, help="only rebuild the last N days")
+    parser.add_argument("--dirty", action="store_true", help="only repair spans whose rollup updates failed")
+    parser.add_argument("--pending", action="store_true", help="only backfill users without a watermark")
+    args = parser.parse_args()
+
+    async def run():
+        db = await get_database()
+        if args.dirty:
+            print(f"✅ Repaired rollups for {await repair_dirty(db)} users")
+        elif args.pending:
+            print(f"✅ Backfilled rollups for {await backfill_pending(db, limit=0)} users")
+        else:
+            since = datetime.utcnow() - timedelta(days=args.days) if args.days else None
+            await rebuild_rollups(db, args.user_id, since)
+            print("✅ Rollups rebuilt")
+        await close_mongo_connection()
+
+    asyncio.run(run())
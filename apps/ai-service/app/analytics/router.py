@@ -1,10 +1,17 @@
-from fastapi import APIRouter, HTTPException, Query
-from typing import List, Dict, Any, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from typing import List, Dict, Any, Optional, Callable, Awaitable
 from datetime import datetime, timedelta
 import json
+import time
 
+from app.analytics.cache import AnalyticsCache
+from app.analytics.ingest import iter_json_array, iter_ndjson
+from app.analytics.precompute import (
+    INSIGHT_CHANGE_DEBOUNCE, INSIGHT_REFRESH_INTERVAL, INSIGHT_TIME_RANGES, InsightWorker, data_age
+)
 from app.analytics.service import AnalyticsService
-from app.analytics.models import AnalyticsData, MetricType, TimeRange
+from app.analytics.models import AnalyticsData, Insight, MetricType, TimeRange
+from app.dependencies import get_analytics_cache, get_analytics_service, get_insight_worker
 
 router = APIRouter()
 
@@ -13,16 +20,27 @@ async def get_metrics(
     user_id: str = Query(..., description="User ID"),
     metric_types: Optional[List[str]] = Query(None, description="List of metric types"),
     time_range: Optional[str] = Query("7d", description="Time range (1d, 7d, 30d, 90d)"),
-    limit: int = Query(100, description="Maximum number of records")
+    limit: int = Query(100, description="Maximum number of records"),
+    max_points: Optional[int] = Query(None, ge=3, description="Downsample each metric to at most this many points"),
+    downsample: str = Query("lttb", pattern="^(lttb|minmax)$", description="Downsampling method (lttb, minmax)"),
+    analytics_service: AnalyticsService = Depends(get_analytics_service),
+    cache: AnalyticsCache = Depends(get_analytics_cache)
 ):
     """Get analytics metrics for a user"""
     try:
-        analytics_service = AnalyticsService()
-        metrics = await analytics_service.get_metrics(
-            user_id=user_id,
+        metrics = await cache.get_or_set(
+            "metrics",
+            user_id,
+            lambda: analytics_service.get_metrics(
+                user_id=user_id,
+                metric_types=metric_types,
+                time_range=time_range,
+                limit=limit,
+                max_points=max_points,
+                downsample=downsample
+            ),
             metric_types=metric_types,
-            time_range=time_range,
-            limit=limit
+            time_range=f"{time_range}:{limit}:{max_points}:{downsample}"
         )
         return metrics
     except Exception as e:
@@ -32,36 +50,125 @@ async def get_metrics(
 async def get_metric_details(
     metric_type: str,
     user_id: str = Query(..., description="User ID"),
-    time_range: str = Query("7d", description="Time range")
+    time_range: str = Query("7d", description="Time range"),
+    max_points: Optional[int] = Query(None, ge=3, description="Downsample data_points to at most this many points"),
+    downsample: str = Query("lttb", pattern="^(lttb|minmax)$", description="Downsampling method (lttb, minmax)"),
+    analytics_service: AnalyticsService = Depends(get_analytics_service),
+    cache: AnalyticsCache = Depends(get_analytics_cache)
 ):
     """Get detailed data for a specific metric"""
     try:
-        analytics_service = AnalyticsService()
-        data = await analytics_service.get_metric_details(
-            metric_type=metric_type,
-            user_id=user_id,
-            time_range=time_range
+        data = await cache.get_or_set(
+            "metric_details",
+            user_id,
+            lambda: analytics_service.get_metric_details(
+                metric_type=metric_type,
+                user_id=user_id,
+                time_range=time_range,
+                max_points=max_points,
+                downsample=downsample
+            ),
+            metric_types=metric_type,
+            time_range=f"{time_range}:{max_points}:{downsample}"
         )
         return data
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error retrieving metric details: {str(e)}")
 
 @router.post("/metrics")
-async def create_metric(data: AnalyticsData):
+async def create_metric(
+    data: AnalyticsData,
+    analytics_service: AnalyticsService = Depends(get_analytics_service)
+):
     """Create a new analytics metric"""
     try:
-        analytics_service = AnalyticsService()
         result = await analytics_service.create_metric(data)
         return result
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error creating metric: {str(e)}")
 
+@router.post("/metrics/bulk")
+async def ingest_metrics(
+    request: Request,
+    analytics_service: AnalyticsService = Depends(get_analytics_service)
+):
+    """Bulk-ingest metrics from an NDJSON body or a JSON array (streamed)"""
+    content_type = request.headers.get("content-type", "")
+    if "ndjson" in content_type or "jsonlines" in content_type:
+        rows = iter_ndjson(request.stream())
+    elif "json" in content_type:
+        rows = iter_json_array(request.stream())
+    else:
+        raise HTTPException(
+            status_code=415,
+            detail="Use application/x-ndjson or application/json"
+        )
+
+    try:
+        start = datetime.utcnow()
+        result = await analytics_service.ingest_metrics(rows)
+        result["elapsed_ms"] = round((datetime.utcnow() - start).total_seconds() * 1000, 1)
+        return result
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error ingesting metrics: {str(e)}")
+
+async def serve_precomputed(
+    response: Response,
+    worker: InsightWorker,
+    user_id: str,
+    kind: str,
+    time_range: str,
+    fallback: Callable[[], Awaitable[Any]]
+) -> Any:
+    """Serve a worker-precomputed result with its age in the headers
+
+    A stale result is still served, and the worker is asked to refresh it
+    on its next pass. Only the first view of a user computes inline.
+    """
+    store = worker.store
+    await store.mark_active(user_id)
+
+    entry = await store.get(user_id, kind, time_range)
+    if entry is None:
+        refreshed = await worker.refresh_user(user_id)
+        if refreshed is None:
+            # Another worker is computing it right now
+            return await fallback()
+        if (kind, time_range) in refreshed["failures"]:
+            raise refreshed["failures"][(kind, time_range)]
+        entry = {"data": refreshed["results"][(kind, time_range)], "generated_at": refreshed["generated_at"]}
+
+    age = data_age(entry["generated_at"])
+    if age > INSIGHT_REFRESH_INTERVAL:
+        await store.mark_changed([user_id], now=time.time() - INSIGHT_CHANGE_DEBOUNCE)
+
+    response.headers["X-Generated-At"] = entry["generated_at"].isoformat()
+    response.headers["X-Data-Age"] = str(int(age))
+    response.headers["X-Data-Stale"] = "true" if age > INSIGHT_REFRESH_INTERVAL else "false"
+    return entry["data"]
+
 @router.get("/dashboard/{user_id}")
-async def get_dashboard_data(user_id: str):
-    """Get dashboard data for a user"""
+async def get_dashboard_data(
+    user_id: str,
+    response: Response,
+    analytics_service: AnalyticsService = Depends(get_analytics_service),
+    cache: AnalyticsCache = Depends(get_analytics_cache),
+    worker: InsightWorker = Depends(get_insight_worker)
+):
+    """Get dashboard data for a user (precomputed; age in X-Data-Age)"""
     try:
-        analytics_service = AnalyticsService()
-        dashboard_data = await analytics_service.get_dashboard_data(user_id)
+        dashboard_data = await serve_precomputed(
+            response,
+            worker,
+            user_id,
+            "dashboard",
+            "7d",
+            lambda: cache.get_or_set(
+                "dashboard",
+                user_id,
+                lambda: analytics_service.get_dashboard_data(user_id)
+            )
+        )
         return dashboard_data
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error retrieving dashboard data: {str(e)}")
@@ -69,13 +176,26 @@ async def get_dashboard_data(user_id: str):
 @router.get("/insights/{user_id}")
 async def get_insights(
     user_id: str,
-    time_range: str = Query("7d", description="Time range for insights")
+    response: Response,
+    time_range: str = Query("7d", description="Time range for insights"),
+    analytics_service: AnalyticsService = Depends(get_analytics_service),
+    cache: AnalyticsCache = Depends(get_analytics_cache),
+    worker: InsightWorker = Depends(get_insight_worker)
 ):
     """Get AI-generated insights for a user's data"""
+    def compute():
+        return cache.get_or_set(
+            "insights",
+            user_id,
+            lambda: analytics_service.generate_insights(user_id, time_range),
+            time_range=time_range
+        )
+
     try:
-        analytics_service = AnalyticsService()
-        insights = await analytics_service.generate_insights(user_id, time_range)
-        return insights
+        if time_range not in INSIGHT_TIME_RANGES:
+            # Ranges the worker does not precompute keep the cached on-demand path
+            return await compute()
+        return await serve_precomputed(response, worker, user_id, "insights", time_range, compute)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error generating insights: {str(e)}")
 
@@ -83,16 +203,62 @@ async def get_insights(
 async def get_trends(
     user_id: str,
     metric_type: str = Query(..., description="Metric type to analyze"),
-    time_range: str = Query("30d", description="Time range for trend analysis")
+    time_range: str = Query("30d", description="Time range for trend analysis"),
+    analytics_service: AnalyticsService = Depends(get_analytics_service),
+    cache: AnalyticsCache = Depends(get_analytics_cache)
 ):
     """Get trend analysis for a specific metric"""
     try:
-        analytics_service = AnalyticsService()
-        trends = await analytics_service.analyze_trends(user_id, metric_type, time_range)
+        trends = await cache.get_or_set(
+            "trends",
+            user_id,
+            lambda: analytics_service.analyze_trends(user_id, metric_type, time_range),
+            metric_types=metric_type,
+            time_range=time_range
+        )
         return trends
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error analyzing trends: {str(e)}")
 
+@router.get("/anomalies/{user_id}", response_model=List[Insight])
+async def get_anomalies(
+    user_id: str,
+    time_range: str = Query("30d", description="Time range to scan"),
+    metric_types: Optional[List[str]] = Query(None, description="List of metric types"),
+    min_severity: str = Query("low", pattern="^(low|medium|high|critical)$", description="Lowest severity returned"),
+    limit: int = Query(100, ge=1, le=1000, description="Maximum number of anomalies"),
+    source: str = Query("backfill", pattern="^(backfill|stream)$", description="Detect now (backfill) or read what the stream consumer recorded"),
+    analytics_service: AnalyticsService = Depends(get_analytics_service),
+    cache: AnalyticsCache = Depends(get_analytics_cache)
+):
+    """Get anomalies (rolling z-score, EWMA control limits, seasonal MAD) as insights"""
+    try:
+        if source == "stream":
+            return await analytics_service.get_streamed_anomalies(
+                user_id, time_range, metric_types, min_severity, limit
+            )
+        anomalies = await cache.get_or_set(
+            "anomalies",
+            user_id,
+            lambda: analytics_service.detect_anomalies(user_id, time_range, metric_types, min_severity, limit),
+            metric_types=metric_types,
+            time_range=f"{time_range}:{min_severity}:{limit}"
+        )
+        return anomalies
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error detecting anomalies: {str(e)}")
+
+@router.get("/running-stats/{user_id}")
+async def get_running_stats(
+    user_id: str,
+    analytics_service: AnalyticsService = Depends(get_analytics_service)
+):
+    """Get all-time running statistics per metric (count, mean, variance, EWMA, last/previous)"""
+    try:
+        return await analytics_service.get_running_stats(user_id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error retrieving running stats: {str(e)}")
+
 @router.get("/health")
 async def analytics_health():
     """Health check for analytics service"""
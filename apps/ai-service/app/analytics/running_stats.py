@@ -0,0 +1,164 @@
+import json
+import math
+import os
+import time
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from app.analytics.models import MetricType
+from app.database.redis_client import get_redis_client
+
+# Half-life in seconds of the time-decayed EWMA
+METRIC_EWMA_HALFLIFE = float(os.getenv("METRIC_EWMA_HALFLIFE", "3600"))
+# Readers trust the aggregates only while a consumer has polled this recently
+METRIC_STATS_MAX_LAG = int(os.getenv("METRIC_STATS_MAX_LAG", "60"))
+
+
+def empty_state() -> Dict[str, Any]:
+    return {
+        "count": 0, "mean": 0.0, "m2": 0.0, "min": None, "max": None,
+        "ewma": None, "last": None, "last_ts": None, "previous": None, "previous_ts": None
+    }
+
+
+def fold_point(state: Dict[str, Any], value: float, ts: float, halflife: float = METRIC_EWMA_HALFLIFE) -> Dict[str, Any]:
+    """Fold one point (epoch seconds) into a running state in O(1)
+
+    count/mean/m2 use Welford's update, so the variance is exact and order
+    independent. The EWMA decays by elapsed time rather than per point, and
+    together with last/previous it only moves forward: a late point updates
+    the moments (and previous, if it is newer than it) but not the EWMA.
+    """
+    state["count"] += 1
+    delta = value - state["mean"]
+    state["mean"] += delta / state["count"]
+    state["m2"] += delta * (value - state["mean"])
+    state["min"] = value if state["min"] is None else min(state["min"], value)
+    state["max"] = value if state["max"] is None else max(state["max"], value)
+
+    if state["last_ts"] is None or ts >= state["last_ts"]:
+        if state["ewma"] is None:
+            state["ewma"] = value
+        else:
+            alpha = 1 - 0.5 ** ((ts - state["last_ts"]) / halflife) if halflife > 0 else 1.0
+            state["ewma"] += alpha * (value - state["ewma"])
+        state["previous"], state["previous_ts"] = state["last"], state["last_ts"]
+        state["last"], state["last_ts"] = value, ts
+    elif state["previous_ts"] is None or ts > state["previous_ts"]:
+        state["previous"], state["previous_ts"] = value, ts
+    return state
+
+
+def stats_view(state: Dict[str, Any]) -> Dict[str, Any]:
+    """Public shape of a running state"""
+    count = state["count"]
+    variance = state["m2"] / (count - 1) if count > 1 else 0.0
+    return {
+        "count": count,
+        "mean": state["mean"],
+        "variance": variance,
+        "stddev": math.sqrt(variance),
+        "min": state["min"],
+        "max": state["max"],
+        "ewma": state["ewma"],
+        "last": state["last"],
+        "last_timestamp": datetime.utcfromtimestamp(state["last_ts"]) if state["last_ts"] is not None else None,
+        "previous": state["previous"],
+        "previous_timestamp": datetime.utcfromtimestamp(state["previous_ts"]) if state["previous_ts"] is not None else None
+    }
+
+
+def epoch(timestamp: datetime) -> float:
+    """Epoch seconds of an aware datetime, or of a naive one taken as UTC"""
+    if timestamp.tzinfo:
+        return timestamp.timestamp()
+    return (timestamp - datetime(1970, 1, 1)).total_seconds()
+
+
+class RunningStatsStore:
+    """Per-(user, metric) running aggregates in Redis.
+
+    The stream consumer is the only writer. Each batch reads the states it
+    touches, folds its points in and writes them back in one MULTI together
+    with the stream offsets it covered, so a redelivered batch (consumer
+    crashed before committing to the broker) is recognised and skipped.
+    """
+
+    def __init__(self, prefix: str = "metric_stats"):
+        self.prefix = prefix
+        self.offsets_key = f"{prefix}:offsets"
+        self.heartbeat_key = f"{prefix}:heartbeat"
+        self.errors = 0
+
+    def _key(self, user_id: str, metric_type: str) -> str:
+        return f"{self.prefix}:{user_id}:{metric_type}"
+
+    async def applied_offsets(self) -> Dict[str, int]:
+        """Last applied offset per "topic:partition\""""
+        redis = await get_redis_client()
+        return {source: int(offset) for source, offset in (await redis.hgetall(self.offsets_key)).items()}
+
+    async def apply(
+        self,
+        points: Iterable[Tuple[str, str, float, float]],
+        offsets: Dict[str, int]
+    ) -> int:
+        """Fold (user, metric, value, epoch ts) points and record offsets
+
+        Points of one series are folded in timestamp order. Returns the
+        number of series updated.
+        """
+        series: Dict[Tuple[str, str], List[Tuple[float, float]]] = {}
+        for user_id, metric_type, value, ts in points:
+            series.setdefault((user_id, metric_type), []).append((ts, value))
+
+        redis = await get_redis_client()
+        keys = [self._key(user_id, metric_type) for user_id, metric_type in series]
+        stored = await redis.mget(keys) if keys else []
+
+        pipe = redis.pipeline(transaction=True)
+        for key, raw, values in zip(keys, stored, series.values()):
+            state = json.loads(raw) if raw else empty_state()
+            for ts, value in sorted(values):
+                fold_point(state, value, ts)
+            pipe.set(key, json.dumps(state))
+        if offsets:
+            pipe.hset(self.offsets_key, mapping=offsets)
+        await pipe.execute()
+        return len(series)
+
+    async def heartbeat(self):
+        redis = await get_redis_client()
+        await redis.set(self.heartbeat_key, time.time(), ex=METRIC_STATS_MAX_LAG)
+
+    async def get(self, user_id: str, metric_type: str) -> Optional[Dict[str, Any]]:
+        """Aggregates for one series, or None if absent or no consumer is live"""
+        try:
+            redis = await get_redis_client()
+            pipe = redis.pipeline(transaction=False)
+            pipe.exists(self.heartbeat_key)
+            pipe.get(self._key(user_id, metric_type))
+            live, raw = await pipe.execute()
+        except Exception:
+            self.errors += 1
+            return None
+        return stats_view(json.loads(raw)) if live and raw else None
+
+    async def get_user(self, user_id: str) -> Dict[str, Dict[str, Any]]:
+        """Aggregates for every metric type of a user that has any"""
+        metric_types = [metric_type.value for metric_type in MetricType]
+        redis = await get_redis_client()
+        stored = await redis.mget([self._key(user_id, metric_type) for metric_type in metric_types])
+        return {
+            metric_type: stats_view(json.loads(raw))
+            for metric_type, raw in zip(metric_types, stored)
+            if raw
+        }
+
+    async def is_live(self) -> bool:
+        try:
+            redis = await get_redis_client()
+            return bool(await redis.exists(self.heartbeat_key))
+        except Exception:
+            self.errors += 1
+            return False
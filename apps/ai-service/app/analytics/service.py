@@ -1,26 +1,76 @@
 import os
+import asyncio
+from collections import defaultdict
 from datetime import datetime, timedelta
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple, AsyncIterator, Set
 import json
 import statistics
 
 from langchain_google_genai import ChatGoogleGenerativeAI
+from pydantic import ValidationError
+from pymongo.errors import BulkWriteError
 
 from app.analytics.models import (
     AnalyticsData, MetricDetails, DashboardData, 
     TrendAnalysis, Insight, MetricType, TimeRange
 )
+from app.analytics.anomalies import SEVERITY_ORDER, AnomalyDetector, AnomalyStore
+from app.analytics.cache import AnalyticsCache
+from app.analytics.downsampling import downsample_points
+from app.analytics.forecasting import fill_days, forecast_batch, forecast_series
+from app.analytics.ingest import INGEST_BATCH_SIZE, INGEST_MAX_REPORTED_ERRORS, IngestFormatError
+from app.analytics.precompute import InsightStore
+from app.analytics.rollups import (
+    ROLLUP_RETRIES, ROLLUP_RETRY_BASE, ROLLUP_RETRY_CAP, apply_rollups, choose_resolution, mark_dirty, read_rollups,
+    rollup_point
+)
+from app.analytics.running_stats import RunningStatsStore
+from app.analytics.stats import compute_metric_stats
+from app.analytics.trends import trend_for_series, trends_for_series_batch
 from app.database.mongodb import get_database
 from app.database.redis_client import get_redis_client
+from app.services.llm_cache import LLMResponseCache
+from app.services.resilience import backoff_delay
+from app.services.structured_output import LLM_BATCH_MODE, build_batched_prompt, parse_batched_response
+
+# Dashboard fan-out limits
+DASHBOARD_CONCURRENCY = int(os.getenv("DASHBOARD_CONCURRENCY", "4"))
+DASHBOARD_METRIC_TIMEOUT = float(os.getenv("DASHBOARD_METRIC_TIMEOUT", "5"))
+DASHBOARD_INSIGHTS_TIMEOUT = float(os.getenv("DASHBOARD_INSIGHTS_TIMEOUT", "10"))
+DASHBOARD_MAX_POINTS = int(os.getenv("DASHBOARD_MAX_POINTS", "50"))
+
+# Points regressed per trend analysis
+TREND_MAX_POINTS = int(os.getenv("TREND_MAX_POINTS", "10000"))
+# Raw points scanned per anomaly backfill (newest first)
+ANOMALY_MAX_POINTS = int(os.getenv("ANOMALY_MAX_POINTS", "200000"))
 
 class AnalyticsService:
-    def __init__(self):
-        self.llm = ChatGoogleGenerativeAI(
+    def __init__(
+        self,
+        llm: Optional[ChatGoogleGenerativeAI] = None,
+        cache: Optional[AnalyticsCache] = None,
+        llm_cache: Optional[LLMResponseCache] = None,
+        insight_store: Optional[InsightStore] = None,
+        running_stats: Optional[RunningStatsStore] = None,
+        metric_stream=None,
+        broadcaster=None
+    ):
+        # Prefer the process-wide client from the service container; building
+        # a new one re-configures the global Gemini transport.
+        self.llm = llm or ChatGoogleGenerativeAI(
             model="gemini-pro",
             google_api_key=os.getenv("GOOGLE_API_KEY"),
             temperature=0.3,
             max_output_tokens=1024
         )
+        self.cache = cache
+        self.llm_cache = llm_cache
+        self.insight_store = insight_store
+        self.running_stats = running_stats
+        # Broker that points written here are published to, if any
+        self.metric_stream = metric_stream
+        # Tells the affected users' sockets about new points, if set
+        self.broadcaster = broadcaster
 
     async def get_analytics_data(
         self, 
@@ -62,171 +112,488 @@ class AnalyticsService:
         user_id: str,
         metric_types: Optional[List[str]] = None,
         time_range: str = "7d",
-        limit: int = 100
+        limit: int = 100,
+        max_points: Optional[int] = None,
+        downsample: str = "lttb"
     ) -> List[AnalyticsData]:
-        """Get metrics for a user"""
+        """Get metrics for a user, optionally downsampled to max_points per metric"""
+        db = await get_database()
+        
+        query = {"user_id": user_id}
+        
+        if metric_types:
+            query["metric_type"] = {"$in": metric_types}
+        
+        # Apply time range filter
+        time_filter = self._parse_time_range(time_range)
+        query["timestamp"] = {"$gte": time_filter}
+        
+        # Long or downsampled ranges read pre-aggregated buckets instead of raw points
+        resolution = choose_resolution(time_filter, max_points)
+        if resolution:
+            buckets = await read_rollups(db, user_id, resolution, time_filter, metric_types, limit)
+            if buckets:
+                metrics = [AnalyticsData(**rollup_point(bucket)) for bucket in buckets]
+                return downsample_points(metrics, max_points, downsample)
+        
+        cursor = db.analytics_data.find(query).sort("timestamp", -1).limit(limit)
+        metrics = []
+        
+        async for doc in cursor:
+            metrics.append(AnalyticsData(**doc))
+        
+        return downsample_points(metrics, max_points, downsample)
+
+    async def get_metric_series(
+        self,
+        user_id: str,
+        metric_type: str,
+        time_range: str = "7d",
+        limit: int = 10000
+    ) -> Tuple[List[datetime], List[float]]:
+        """Get the newest points of one metric as chronological (timestamps, values)
+
+        Uses rollup bucket means at the coarsest resolution that suits the
+        time range, falling back to raw points when no rollups exist.
+        """
+        db = await get_database()
+        since = self._parse_time_range(time_range)
+        
+        resolution = choose_resolution(since)
+        if resolution:
+            buckets = await read_rollups(db, user_id, resolution, since, [metric_type], limit)
+            if buckets:
+                buckets.reverse()
+                return [b["bucket"] for b in buckets], [b["sum"] / b["count"] for b in buckets]
+        
+        query = {
+            "user_id": user_id,
+            "metric_type": metric_type,
+            "timestamp": {"$gte": since}
+        }
+        projection = {"_id": 0, "timestamp": 1, "value": 1}
+        
+        cursor = db.analytics_data.find(query, projection).sort("timestamp", -1).limit(limit)
+        docs = await cursor.to_list(length=limit)
+        docs.reverse()
+        
+        return [doc["timestamp"] for doc in docs], [doc["value"] for doc in docs]
+
+    async def get_daily_series(
+        self,
+        user_id: str,
+        time_range: str = "7d",
+        metric_types: Optional[List[str]] = None
+    ) -> Dict[str, List[float]]:
+        """Mean per UTC day of each metric, oldest first, with gaps interpolated
+
+        Forecasts step in days, so they are fitted on this rather than on raw
+        points or finer rollups. Reads the day rollups when they cover the
+        range, otherwise aggregates raw points by day.
+        """
         try:
             db = await get_database()
-            
-            query = {"user_id": user_id}
-            
-            if metric_types:
-                query["metric_type"] = {"$in": metric_types}
-            
-            # Apply time range filter
-            time_filter = self._parse_time_range(time_range)
-            query["timestamp"] = {"$gte": time_filter}
-            
-            cursor = db.analytics_data.find(query).sort("timestamp", -1).limit(limit)
-            metrics = []
-            
-            async for doc in cursor:
-                metrics.append(AnalyticsData(**doc))
-            
-            return metrics
-            
+            since = self._parse_time_range(time_range)
+
+            buckets = await read_rollups(db, user_id, "day", since, metric_types)
+            if buckets:
+                rows = [(b["metric_type"], b["bucket"], b["sum"] / b["count"]) for b in buckets]
+            else:
+                match = {"user_id": user_id, "timestamp": {"$gte": since}}
+                if metric_types:
+                    match["metric_type"] = {"$in": metric_types}
+                pipeline = [
+                    {"$match": match},
+                    {"$group": {
+                        "_id": {
+                            "metric_type": "$metric_type",
+                            "day": {"$dateTrunc": {"date": "$timestamp", "unit": "day"}}
+                        },
+                        "mean": {"$avg": "$value"}
+                    }}
+                ]
+                rows = [
+                    (doc["_id"]["metric_type"], doc["_id"]["day"], doc["mean"])
+                    async for doc in db.analytics_data.aggregate(pipeline)
+                ]
+
+            days = defaultdict(list)
+            for metric_type, day, mean in rows:
+                days[metric_type].append((day, mean))
+            return {
+                metric_type: fill_days([day for day, _ in points], [mean for _, mean in points])
+                for metric_type, points in days.items()
+            }
         except Exception as e:
-            return []
+            print(f"❌ Failed to read daily series for {user_id}: {e}")
+            return {}
 
     async def get_metric_details(
         self,
         metric_type: str,
         user_id: str,
-        time_range: str = "7d"
+        time_range: str = "7d",
+        max_points: Optional[int] = None,
+        downsample: str = "lttb"
     ) -> MetricDetails:
-        """Get detailed information for a specific metric"""
-        try:
-            db = await get_database()
-            
-            # Get current data
-            time_filter = self._parse_time_range(time_range)
-            current_query = {
-                "user_id": user_id,
-                "metric_type": metric_type,
-                "timestamp": {"$gte": time_filter}
-            }
-            
+        """Get detailed information for a specific metric
+
+        With max_points, data_points is downsampled (LTTB or min/max buckets)
+        after the summary has been computed from the full window.
+        """
+        db = await get_database()
+        
+        # Get current data
+        time_filter = self._parse_time_range(time_range)
+        current_query = {
+            "user_id": user_id,
+            "metric_type": metric_type,
+            "timestamp": {"$gte": time_filter}
+        }
+        
+        data_points = []
+        resolution = choose_resolution(time_filter, max_points)
+        if resolution:
+            buckets = await read_rollups(db, user_id, resolution, time_filter, [metric_type])
+            data_points = [AnalyticsData(**rollup_point(bucket)) for bucket in buckets]
+        
+        if data_points:
+            # Current/previous stay exact: the two newest raw points, read
+            # from the stream's running stats when a consumer keeps them
+            latest = await self._latest_values(user_id, metric_type, time_filter)
+            if latest is None:
+                cursor = db.analytics_data.find(current_query).sort("timestamp", -1).limit(2)
+                latest = [doc["value"] for doc in await cursor.to_list(length=2)]
+        else:
             cursor = db.analytics_data.find(current_query).sort("timestamp", -1)
-            data_points = []
-            
             async for doc in cursor:
                 data_points.append(AnalyticsData(**doc))
-            
-            if not data_points:
-                return MetricDetails(
-                    metric_type=MetricType(metric_type),
-                    current_value=0,
-                    data_points=[],
-                    trend="stable"
-                )
-            
-            # Calculate metrics
-            current_value = data_points[0].value if data_points else 0
-            previous_value = data_points[1].value if len(data_points) > 1 else None
-            
-            change_percentage = None
-            if previous_value and previous_value != 0:
-                change_percentage = ((current_value - previous_value) / previous_value) * 100
-            
-            # Determine trend
-            trend = "stable"
-            if change_percentage:
-                if change_percentage > 5:
-                    trend = "up"
-                elif change_percentage < -5:
-                    trend = "down"
-            
-            # Generate summary using AI
-            summary = await self._generate_metric_summary(metric_type, data_points)
-            
-            return MetricDetails(
-                metric_type=MetricType(metric_type),
-                current_value=current_value,
-                previous_value=previous_value,
-                change_percentage=change_percentage,
-                trend=trend,
-                data_points=data_points,
-                summary=summary
-            )
-            
-        except Exception as e:
+            latest = [point.value for point in data_points[:2]]
+        
+        if not data_points:
             return MetricDetails(
                 metric_type=MetricType(metric_type),
                 current_value=0,
                 data_points=[],
-                trend="stable",
-                summary=f"Error retrieving data: {str(e)}"
+                trend="stable"
             )
+        
+        # Calculate metrics
+        current_value = latest[0] if latest else 0
+        previous_value = latest[1] if len(latest) > 1 else None
+        change_percentage, trend = self._calculate_change(current_value, previous_value)
+        
+        # Generate summary using AI
+        summary = await self._generate_metric_summary(metric_type, data_points)
+        
+        return MetricDetails(
+            metric_type=MetricType(metric_type),
+            current_value=current_value,
+            previous_value=previous_value,
+            change_percentage=change_percentage,
+            trend=trend,
+            data_points=downsample_points(data_points, max_points, downsample),
+            summary=summary
+        )
 
-    async def get_dashboard_data(self, user_id: str) -> DashboardData:
-        """Get comprehensive dashboard data for a user"""
+    async def _latest_values(self, user_id: str, metric_type: str, since: datetime) -> Optional[List[float]]:
+        """Newest and previous value within the range from the running stats
+
+        None means the aggregates are unavailable and Mongo has to be asked.
+        They are only complete when this service publishes its own writes
+        to the stream (METRIC_STREAM_PUBLISH); otherwise points created
+        through the API never reach them.
+        """
+        if not self.running_stats or self.metric_stream is None:
+            return None
+        stats = await self.running_stats.get(user_id, metric_type)
+        if not stats or stats["last_timestamp"] is None or stats["last_timestamp"] < since:
+            return None
+        if stats["previous_timestamp"] is None or stats["previous_timestamp"] < since:
+            return [stats["last"]]
+        return [stats["last"], stats["previous"]]
+
+    async def get_running_stats(self, user_id: str) -> Dict[str, Dict[str, Any]]:
+        """All-time running statistics per metric, maintained by the stream consumer"""
+        if not self.running_stats:
+            return {}
         try:
-            # Get all metric types
-            metric_types = [metric.value for metric in MetricType]
-            
-            # Get metrics for each type
-            metrics = []
-            for metric_type in metric_types:
-                metric_details = await self.get_metric_details(metric_type, user_id)
-                if metric_details.data_points:  # Only include metrics with data
-                    metrics.append(metric_details)
-            
-            # Generate insights
-            insights = await self.generate_insights(user_id, "7d")
-            
-            return DashboardData(
-                user_id=user_id,
-                metrics=metrics,
-                insights=insights,
-                time_range=TimeRange.WEEK
-            )
-            
+            return await self.running_stats.get_user(user_id)
         except Exception as e:
-            return DashboardData(
-                user_id=user_id,
-                metrics=[],
-                insights=[f"Error loading dashboard: {str(e)}"],
-                time_range=TimeRange.WEEK
+            return {"error": str(e)}
+
+    async def get_metric_summaries(
+        self,
+        user_id: str,
+        time_range: str = "7d",
+        metric_types: Optional[List[str]] = None,
+        include_points: int = 0
+    ) -> Dict[str, Dict[str, Any]]:
+        """Get latest/previous/count/mean/min/max per metric type in one query
+
+        When include_points is set, up to that many of the newest raw points
+        are returned per metric (newest first) under "data_points".
+        """
+        db = await get_database()
+
+        match = {
+            "user_id": user_id,
+            "timestamp": {"$gte": self._parse_time_range(time_range)}
+        }
+        if metric_types:
+            match["metric_type"] = {"$in": metric_types}
+
+        newest_first = {"timestamp": -1}
+        group = {
+            "_id": "$metric_type",
+            "latest": {"$topN": {"n": 2, "sortBy": newest_first, "output": "$value"}},
+            "count": {"$sum": 1},
+            "mean": {"$avg": "$value"},
+            "min": {"$min": "$value"},
+            "max": {"$max": "$value"}
+        }
+        if include_points > 0:
+            group["data_points"] = {
+                "$topN": {
+                    "n": include_points,
+                    "sortBy": newest_first,
+                    "output": {
+                        "metric_type": "$metric_type",
+                        "value": "$value",
+                        "user_id": "$user_id",
+                        "timestamp": "$timestamp",
+                        "metadata": "$metadata",
+                        "tags": "$tags"
+                    }
+                }
+            }
+
+        pipeline = [
+            {"$match": match},
+            {"$sort": newest_first},
+            {"$group": group}
+        ]
+
+        summaries = {}
+        async for doc in db.analytics_data.aggregate(pipeline):
+            latest = doc.pop("latest")
+            doc["latest"] = latest[0]
+            doc["previous"] = latest[1] if len(latest) > 1 else None
+            summaries[doc.pop("_id")] = doc
+
+        return summaries
+
+    async def get_dashboard_data(self, user_id: str, insights: Optional[List[str]] = None) -> DashboardData:
+        """Get comprehensive dashboard data for a user
+
+        Pass already generated 7d insights to skip generating them again.
+        """
+        insights_error = None
+        if insights is None:
+            # One aggregation for all metrics while insights are generated
+            # alongside it
+            (metrics, missing_metrics), (insights, insights_error) = await asyncio.gather(
+                self._get_dashboard_metrics(user_id),
+                self._get_dashboard_insights(user_id)
+            )
+        else:
+            metrics, missing_metrics = await self._get_dashboard_metrics(user_id)
+
+        return DashboardData(
+            user_id=user_id,
+            metrics=metrics,
+            insights=insights,
+            time_range=TimeRange.WEEK,
+            partial=bool(missing_metrics) or insights_error is not None,
+            missing_metrics=missing_metrics,
+            insights_error=insights_error
+        )
+
+    async def _get_dashboard_metrics(self, user_id: str) -> Tuple[List[MetricDetails], List[MetricType]]:
+        """Build dashboard metric details, fanning out summaries with bounded concurrency"""
+        all_types = [metric.value for metric in MetricType]
+        summaries, daily = await asyncio.gather(
+            self.get_metric_summaries(
+                user_id,
+                time_range="7d",
+                metric_types=all_types,
+                include_points=DASHBOARD_MAX_POINTS
+            ),
+            self.get_daily_series(user_id, "7d", all_types)
+        )
+
+        # Keep the dashboard ordering stable (MetricType declaration order)
+        metric_types = [metric.value for metric in MetricType if metric.value in summaries]
+
+        # Forecast (on daily means) and regress (on the newest points, which
+        # come newest first) every metric in one vectorized call each
+        points = {
+            metric_type: list(reversed(summaries[metric_type].get("data_points", [])))
+            for metric_type in metric_types
+        }
+        forecasts = forecast_batch({
+            metric_type: daily[metric_type]
+            for metric_type in metric_types if metric_type in daily
+        })
+        trends = trends_for_series_batch({
+            metric_type: (
+                [point["timestamp"] for point in metric_points],
+                [point["value"] for point in metric_points]
+            )
+            for metric_type, metric_points in points.items()
+        })
+
+        semaphore = asyncio.Semaphore(DASHBOARD_CONCURRENCY)
+        results = await asyncio.gather(*[
+            self._get_dashboard_metric(metric_type, summaries[metric_type], semaphore)
+            for metric_type in metric_types
+        ])
+
+        metrics = []
+        missing_metrics = []
+        for metric_type, (metric_details, complete) in zip(metric_types, results):
+            metric_details.forecast = forecasts.get(metric_type)
+            metric_details.trend_direction = trends[metric_type]["direction"]
+            metric_details.trend_strength = trends[metric_type]["strength"]
+            metrics.append(metric_details)
+            if not complete:
+                missing_metrics.append(MetricType(metric_type))
+
+        return metrics, missing_metrics
+
+    async def _get_dashboard_metric(
+        self,
+        metric_type: str,
+        stats: Dict[str, Any],
+        semaphore: asyncio.Semaphore
+    ) -> Tuple[MetricDetails, bool]:
+        """Build metric details from aggregated stats; False if the summary timed out"""
+        current_value = stats["latest"]
+        previous_value = stats["previous"]
+        change_percentage, trend = self._calculate_change(current_value, previous_value)
+
+        async with semaphore:
+            try:
+                summary = await asyncio.wait_for(
+                    self._summarize_metric(metric_type, current_value, stats["mean"], stats["count"]),
+                    timeout=DASHBOARD_METRIC_TIMEOUT
+                )
+                complete = True
+            except asyncio.TimeoutError:
+                summary = None
+                complete = False
+
+        return MetricDetails(
+            metric_type=MetricType(metric_type),
+            current_value=current_value,
+            previous_value=previous_value,
+            change_percentage=change_percentage,
+            trend=trend,
+            data_points=stats.get("data_points", []),
+            summary=summary
+        ), complete
+
+    async def _get_dashboard_insights(self, user_id: str) -> Tuple[List[str], Optional[str]]:
+        """Generate dashboard insights within the dashboard time budget
+
+        Returns (insights, error); on a timeout or failure the insights are a
+        placeholder so the rest of the dashboard is still served.
+        """
+        try:
+            insights = await asyncio.wait_for(
+                self.generate_insights(user_id, "7d"),
+                timeout=DASHBOARD_INSIGHTS_TIMEOUT
             )
+            return insights, None
+        except asyncio.TimeoutError:
+            return ["Insights are taking longer than usual, please refresh shortly"], "timeout"
+        except Exception as e:
+            print(f"❌ Failed to generate dashboard insights for {user_id}: {e}")
+            return ["Insights are unavailable right now, please refresh shortly"], str(e)
 
     async def generate_insights(self, user_id: str, time_range: str) -> List[str]:
         """Generate AI-powered insights from user's data"""
+        # Statistics over the whole window, computed in MongoDB
+        stats = await compute_metric_stats(user_id, self._parse_time_range(time_range))
+        
+        if not stats:
+            return ["No data available for insights generation"]
+        
+        # Prepare data for AI analysis
+        data_summary = self._prepare_data_summary(stats)
+        
+        # Generate insights using AI
+        insights_prompt = f"""
+        Analyze this analytics data and provide 3-5 key insights and recommendations:
+        
+        Data Summary: {json.dumps(data_summary, default=str)}
+        
+        Please provide:
+        1. Key trends and patterns
+        2. Performance highlights
+        3. Areas for improvement
+        4. Actionable recommendations
+        
+        Format as a JSON array of insight strings.
+        """
+        
+        content = await self._ask_llm(insights_prompt, "insights")
         try:
-            # Get recent data
-            metrics = await self.get_metrics(user_id, time_range=time_range, limit=50)
-            
-            if not metrics:
-                return ["No data available for insights generation"]
-            
-            # Prepare data for AI analysis
-            data_summary = self._prepare_data_summary(metrics)
-            
-            # Generate insights using AI
-            insights_prompt = f"""
-            Analyze this analytics data and provide 3-5 key insights and recommendations:
-            
-            Data Summary: {json.dumps(data_summary, default=str)}
-            
-            Please provide:
-            1. Key trends and patterns
-            2. Performance highlights
-            3. Areas for improvement
-            4. Actionable recommendations
-            
-            Format as a JSON array of insight strings.
-            """
-            
-            response = await self.llm.ainvoke(insights_prompt)
-            insights = json.loads(response.content)
-            
-            return insights if isinstance(insights, list) else [
-                "Data analysis completed",
-                "Review your metrics regularly",
-                "Consider setting up automated alerts"
-            ]
-            
-        except Exception as e:
-            return [f"Error generating insights: {str(e)}"]
+            insights = json.loads(content)
+        except json.JSONDecodeError:
+            insights = None
+        
+        return insights if isinstance(insights, list) else [
+            "Data analysis completed",
+            "Review your metrics regularly",
+            "Consider setting up automated alerts"
+        ]
+
+    async def detect_anomalies(
+        self,
+        user_id: str,
+        time_range: str = "30d",
+        metric_types: Optional[List[str]] = None,
+        min_severity: str = "low",
+        limit: int = 100
+    ) -> List[Insight]:
+        """Anomaly insights over the raw points of a user's metrics, newest first
+
+        Every series is scored at once with the vectorized detectors, which
+        flag the same points the streaming consumer would.
+        """
+        db = await get_database()
+        query = {"user_id": user_id, "timestamp": {"$gte": self._parse_time_range(time_range)}}
+        if metric_types:
+            query["metric_type"] = {"$in": metric_types}
+        projection = {"_id": 0, "metric_type": 1, "timestamp": 1, "value": 1}
+        cursor = db.analytics_data.find(query, projection).sort("timestamp", -1).limit(ANOMALY_MAX_POINTS)
+
+        series: Dict[str, Tuple[List[datetime], List[float]]] = defaultdict(lambda: ([], []))
+        async for doc in cursor:
+            timestamps, values = series[doc["metric_type"]]
+            timestamps.append(doc["timestamp"])
+            values.append(doc["value"])
+        for timestamps, values in series.values():
+            timestamps.reverse()
+            values.reverse()
+
+        insights = AnomalyDetector().backfill(user_id, series)
+        threshold = SEVERITY_ORDER[min_severity]
+        return [insight for insight in insights if SEVERITY_ORDER[insight.severity] >= threshold][:limit]
+
+    async def get_streamed_anomalies(
+        self,
+        user_id: str,
+        time_range: str = "30d",
+        metric_types: Optional[List[str]] = None,
+        min_severity: str = "low",
+        limit: int = 100
+    ) -> List[Insight]:
+        """Anomalies the stream consumer has recorded, newest first"""
+        return await AnomalyStore().list(
+            user_id, self._parse_time_range(time_range), min_severity, metric_types, limit
+        )
 
     async def analyze_trends(
         self, 
@@ -235,61 +602,64 @@ class AnalyticsService:
         time_range: str
     ) -> TrendAnalysis:
         """Analyze trends for a specific metric"""
-        try:
-            # Get data points
-            metrics = await self.get_metrics(
-                user_id=user_id,
-                metric_types=[metric_type],
-                time_range=time_range,
-                limit=100
-            )
-            
-            if not metrics:
-                return TrendAnalysis(
-                    metric_type=MetricType(metric_type),
-                    time_range=TimeRange(time_range),
-                    trend_direction="stable",
-                    trend_strength=0.0,
-                    insights=["No data available for trend analysis"],
-                    recommendations=["Start collecting data for this metric"]
-                )
-            
-            # Calculate trend
-            values = [m.value for m in metrics]
-            trend_direction, trend_strength = self._calculate_trend(values)
-            
-            # Generate forecast
-            forecast = await self._generate_forecast(values)
-            
-            # Generate insights and recommendations
-            insights = await self._generate_trend_insights(metric_type, values, trend_direction)
-            recommendations = await self._generate_trend_recommendations(metric_type, trend_direction)
-            
-            return TrendAnalysis(
-                metric_type=MetricType(metric_type),
-                time_range=TimeRange(time_range),
-                trend_direction=trend_direction,
-                trend_strength=trend_strength,
-                forecast=forecast,
-                insights=insights,
-                recommendations=recommendations
-            )
-            
-        except Exception as e:
+        # Get data points (chronological, without per-document models)
+        timestamps, values = await self.get_metric_series(
+            user_id=user_id,
+            metric_type=metric_type,
+            time_range=time_range,
+            limit=TREND_MAX_POINTS
+        )
+        
+        if not values:
             return TrendAnalysis(
                 metric_type=MetricType(metric_type),
                 time_range=TimeRange(time_range),
                 trend_direction="stable",
                 trend_strength=0.0,
-                insights=[f"Error analyzing trends: {str(e)}"],
-                recommendations=["Please try again later"]
+                insights=["No data available for trend analysis"],
+                recommendations=["Start collecting data for this metric"]
             )
+        
+        # Calculate trend over the real timestamps
+        trend = trend_for_series(timestamps, values)
+        trend_direction, trend_strength = trend["direction"], trend["strength"]
+        
+        # Forecast days ahead from daily means, whatever the series resolution
+        daily = await self.get_daily_series(user_id, time_range, [metric_type])
+        forecast = self._generate_forecast(daily.get(metric_type, []))
+        
+        # Generate insights and recommendations
+        insights, recommendations = await self._generate_trend_commentary(
+            metric_type, values, trend_direction
+        )
+        
+        return TrendAnalysis(
+            metric_type=MetricType(metric_type),
+            time_range=TimeRange(time_range),
+            trend_direction=trend_direction,
+            trend_strength=trend_strength,
+            trend_slope=trend["slope"],
+            r_squared=trend["r2"],
+            forecast=forecast,
+            insights=insights,
+            recommendations=recommendations
+        )
 
     async def create_metric(self, data: AnalyticsData) -> Dict[str, Any]:
         """Create a new analytics metric"""
         try:
             db = await get_database()
-            result = await db.analytics_data.insert_one(data.dict())
+            doc = data.dict()
+            result = await db.analytics_data.insert_one(doc)
+            await self._apply_rollups(db, [doc])
+            await self._publish([doc])
+            
+            # Drop cached results the new point makes stale
+            if self.cache:
+                await self.cache.invalidate(data.user_id, data.metric_type.value)
+            if self.insight_store:
+                await self.insight_store.mark_changed([data.user_id])
+            self._notify({data.user_id: {data.metric_type.value}})
             
             return {
                 "id": str(result.inserted_id),
@@ -300,6 +670,144 @@ class AnalyticsService:
         except Exception as e:
             return {"error": str(e)}
 
+    async def ingest_metrics(
+        self,
+        rows: AsyncIterator[Tuple[int, Any]],
+        batch_size: int = INGEST_BATCH_SIZE
+    ) -> Dict[str, Any]:
+        """Validate streamed rows and insert them in unordered batches
+
+        Rows come from the ingest parsers as (row number, object or parse
+        error). Invalid rows are reported and skipped; valid ones are written
+        with insert_many(ordered=False) while the next batch is parsed, and
+        each batch invalidates the caches of the users it touched once.
+        """
+        db = await get_database()
+        result = {"accepted": 0, "rejected": 0, "batches": 0, "errors": []}
+
+        def reject(row: int, error: str):
+            result["rejected"] += 1
+            if len(result["errors"]) < INGEST_MAX_REPORTED_ERRORS:
+                result["errors"].append({"row": row, "error": error})
+
+        async def write_batch(docs: List[Dict[str, Any]], row_numbers: List[int]):
+            failed = set()
+            try:
+                await db.analytics_data.insert_many(docs, ordered=False)
+            except BulkWriteError as e:
+                for error in e.details.get("writeErrors", []):
+                    failed.add(error["index"])
+                    reject(row_numbers[error["index"]], error.get("errmsg", "write failed"))
+            except Exception as e:
+                for row in row_numbers:
+                    reject(row, f"Write failed: {str(e)}")
+                return
+
+            result["accepted"] += len(docs) - len(failed)
+            result["batches"] += 1
+            written = [doc for index, doc in enumerate(docs) if index not in failed]
+            await self._apply_rollups(db, written)
+            await self._publish(written)
+
+            # One invalidation per user per batch instead of one per point
+            touched = defaultdict(set)
+            for index, doc in enumerate(docs):
+                if index not in failed:
+                    touched[doc["user_id"]].add(doc["metric_type"].value)
+            if self.cache:
+                await asyncio.gather(*[
+                    self.cache.invalidate(user_id, sorted(metric_types))
+                    for user_id, metric_types in touched.items()
+                ])
+            if self.insight_store:
+                await self.insight_store.mark_changed(touched)
+            self._notify(touched)
+
+        docs, row_numbers = [], []
+        in_flight = None
+        try:
+            async for row, value in rows:
+                if isinstance(value, Exception):
+                    reject(row, f"Invalid JSON: {str(value)}")
+                    continue
+                if not isinstance(value, dict):
+                    reject(row, "Expected a JSON object")
+                    continue
+                try:
+                    data = AnalyticsData(**value)
+                except ValidationError as e:
+                    reject(row, "; ".join(
+                        f"{'.'.join(str(part) for part in error['loc'])}: {error['msg']}"
+                        for error in e.errors()
+                    ))
+                    continue
+
+                docs.append(data.dict())
+                row_numbers.append(row)
+                if len(docs) >= batch_size:
+                    # Keep at most one batch in flight while parsing the next
+                    if in_flight:
+                        await in_flight
+                    in_flight = asyncio.create_task(write_batch(docs, row_numbers))
+                    docs, row_numbers = [], []
+        except IngestFormatError as e:
+            # Rows before the framing error are still written
+            result["format_error"] = str(e)
+        finally:
+            if in_flight:
+                await in_flight
+            if docs:
+                await write_batch(docs, row_numbers)
+
+        return result
+
+    async def _apply_rollups(self, db, docs: List[Dict[str, Any]]):
+        """Fold inserted points into the rollups; raw points stay authoritative
+
+        After the retries the span is marked dirty, so reads over it fall
+        back to raw points until `python -m app.analytics.rollups --dirty`
+        rebuilds it.
+        """
+        for attempt in range(ROLLUP_RETRIES + 1):
+            if attempt:
+                await asyncio.sleep(backoff_delay(attempt, ROLLUP_RETRY_BASE, ROLLUP_RETRY_CAP))
+            try:
+                await apply_rollups(db, docs)
+                return
+            except Exception as e:
+                print(f"❌ Failed to update rollups for {len(docs)} points (attempt {attempt + 1}): {e}")
+        try:
+            await mark_dirty(db, docs)
+        except Exception as e:
+            print(f"❌ Failed to mark rollups dirty for {len(docs)} points: {e}")
+
+    async def _publish(self, docs: List[Dict[str, Any]]):
+        """Send written points to the metric stream; Mongo stays authoritative"""
+        if self.metric_stream is None or not docs:
+            return
+        try:
+            await self.metric_stream.publish(docs)
+        except Exception as e:
+            print(f"❌ Failed to publish {len(docs)} points to the metric stream: {e}")
+
+    def _notify(self, touched: Dict[str, Set[str]]):
+        """Queue a metrics_updated event for each user with new points"""
+        if self.broadcaster is None:
+            return
+        for user_id, metric_types in touched.items():
+            self.broadcaster.publish_to_user(user_id, {
+                "type": "metrics_updated",
+                "metric_types": sorted(metric_types),
+                "timestamp": datetime.utcnow().isoformat()
+            })
+
+    async def _ask_llm(self, prompt: str, kind: str) -> str:
+        """Send a prompt to the LLM, through the response cache when configured"""
+        if self.llm_cache:
+            return await self.llm_cache.ainvoke(self.llm, prompt, kind)
+        response = await self.llm.ainvoke(prompt)
+        return response.content
+
     def _parse_time_range(self, time_range: str) -> datetime:
         """Parse time range string to datetime"""
         now = datetime.utcnow()
@@ -319,99 +827,105 @@ class AnalyticsService:
         else:
             return now - timedelta(days=7)  # Default to 7 days
 
-    def _prepare_data_summary(self, metrics: List[AnalyticsData]) -> Dict[str, Any]:
+    def _calculate_change(
+        self,
+        current_value: float,
+        previous_value: Optional[float]
+    ) -> Tuple[Optional[float], str]:
+        """Calculate change percentage and up/down/stable trend between two points"""
+        change_percentage = None
+        if previous_value and previous_value != 0:
+            change_percentage = ((current_value - previous_value) / previous_value) * 100
+        
+        # Determine trend
+        trend = "stable"
+        if change_percentage:
+            if change_percentage > 5:
+                trend = "up"
+            elif change_percentage < -5:
+                trend = "down"
+        
+        return change_percentage, trend
+
+    def _prepare_data_summary(self, stats: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
         """Prepare data summary for AI analysis"""
-        summary = {}
-        
-        # Group by metric type
-        for metric in metrics:
-            metric_type = metric.metric_type
-            if metric_type not in summary:
-                summary[metric_type] = []
-            summary[metric_type].append(metric.value)
-        
-        # Calculate basic statistics
-        for metric_type, values in summary.items():
-            summary[metric_type] = {
-                "count": len(values),
-                "average": statistics.mean(values),
-                "min": min(values),
-                "max": max(values),
-                "latest": values[0] if values else 0
+        # Round the server-side statistics so the prompt stays compact
+        return {
+            metric_type: {
+                key: round(value, 4) if isinstance(value, float) else value
+                for key, value in metric_stats.items()
             }
-        
-        return summary
+            for metric_type, metric_stats in stats.items()
+        }
 
-    def _calculate_trend(self, values: List[float]) -> tuple:
-        """Calculate trend direction and strength"""
-        if len(values) < 2:
-            return "stable", 0.0
-        
-        # Simple linear regression
-        n = len(values)
-        x = list(range(n))
-        
-        # Calculate slope
-        x_mean = sum(x) / n
-        y_mean = sum(values) / n
-        
-        numerator = sum((x[i] - x_mean) * (values[i] - y_mean) for i in range(n))
-        denominator = sum((x[i] - x_mean) ** 2 for i in range(n))
-        
-        if denominator == 0:
-            return "stable", 0.0
-        
-        slope = numerator / denominator
-        
-        # Determine direction and strength
-        if slope > 0.1:
-            return "increasing", min(abs(slope) / max(values), 1.0)
-        elif slope < -0.1:
-            return "decreasing", min(abs(slope) / max(values), 1.0)
-        else:
-            return "stable", 0.0
+    def _generate_forecast(self, values: List[float]) -> List[Dict[str, Any]]:
+        """Generate a 7-day forecast with prediction intervals
 
-    async def _generate_forecast(self, values: List[float]) -> List[Dict[str, Any]]:
-        """Generate simple forecast using AI"""
+        values must be daily means in chronological order (oldest first).
+        """
         try:
-            forecast_prompt = f"""
-            Based on this time series data, provide a 7-day forecast:
-            Data: {values[-10:]}  # Last 10 values
-            
-            Return as JSON array with format:
-            [{{"day": 1, "value": predicted_value, "confidence": 0.8}}]
-            """
-            
-            response = await self.llm.ainvoke(forecast_prompt)
-            forecast = json.loads(response.content)
-            
-            return forecast if isinstance(forecast, list) else []
-            
-        except:
+            return forecast_series(values, horizon=7)
+        except Exception:
             return []
 
     async def _generate_metric_summary(self, metric_type: str, data_points: List[AnalyticsData]) -> str:
         """Generate AI summary for a metric"""
+        values = [dp.value for dp in data_points]
+        latest = values[0] if values else 0
+        average = statistics.mean(values) if values else 0
+        return await self._summarize_metric(metric_type, latest, average, len(values))
+
+    async def _summarize_metric(self, metric_type: str, latest: float, average: float, count: int) -> str:
+        """Generate AI summary for a metric from precomputed statistics"""
         try:
-            values = [dp.value for dp in data_points]
-            latest = values[0] if values else 0
-            average = statistics.mean(values) if values else 0
-            
             summary_prompt = f"""
             Provide a brief summary for {metric_type}:
             Latest value: {latest}
             Average: {average}
-            Data points: {len(values)}
+            Data points: {count}
             
             Keep it concise and actionable.
             """
             
-            response = await self.llm.ainvoke(summary_prompt)
-            return response.content
+            return await self._ask_llm(summary_prompt, "metric_summary")
             
         except:
             return f"Current {metric_type}: {latest}"
 
+    async def _generate_trend_commentary(
+        self,
+        metric_type: str,
+        values: List[float],
+        trend: str
+    ) -> Tuple[List[str], List[str]]:
+        """Generate trend insights and recommendations, in one LLM call when batching"""
+        if LLM_BATCH_MODE:
+            fields = {
+                "insights": f"2-3 insights about the {metric_type} trend",
+                "recommendations": f"2-3 actionable recommendations for {metric_type} with {trend} trend"
+            }
+            commentary_prompt = build_batched_prompt(f"""
+            Analyze the {metric_type} metric:
+            Trend: {trend}
+            Recent values: {values[-5:]}
+            """, fields)
+            
+            try:
+                content = await self._ask_llm(commentary_prompt, "trend_commentary")
+                parsed = parse_batched_response(content, fields)
+            except Exception:
+                parsed = None
+            
+            if parsed:
+                return parsed["insights"], parsed["recommendations"]
+        
+        # Separate prompts, issued concurrently
+        insights, recommendations = await asyncio.gather(
+            self._generate_trend_insights(metric_type, values, trend),
+            self._generate_trend_recommendations(metric_type, trend)
+        )
+        return insights, recommendations
+
     async def _generate_trend_insights(self, metric_type: str, values: List[float], trend: str) -> List[str]:
         """Generate insights about trends"""
         try:
@@ -423,8 +937,8 @@ class AnalyticsService:
             Return as JSON array of insight strings.
             """
             
-            response = await self.llm.ainvoke(insights_prompt)
-            insights = json.loads(response.content)
+            content = await self._ask_llm(insights_prompt, "trend_insights")
+            insights = json.loads(content)
             
             return insights if isinstance(insights, list) else [
                 f"{metric_type} is showing a {trend} trend",
@@ -443,8 +957,8 @@ class AnalyticsService:
             Return as JSON array of recommendation strings.
             """
             
-            response = await self.llm.ainvoke(recommendations_prompt)
-            recommendations = json.loads(response.content)
+            content = await self._ask_llm(recommendations_prompt, "trend_recommendations")
+            recommendations = json.loads(content)
             
             return recommendations if isinstance(recommendations, list) else [
                 "Continue monitoring this metric",
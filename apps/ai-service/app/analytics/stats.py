@@ -0,0 +1,65 @@
+from datetime import datetime
+from typing import List, Dict, Any, Optional, Sequence
+
+from app.database.mongodb import get_database
+
+# Percentiles reported for every metric type
+DEFAULT_PERCENTILES = (0.5, 0.9, 0.99)
+
+
+def _percentile_key(p: float) -> str:
+    """Field name for a percentile, e.g. 0.9 -> p90, 0.999 -> p99_9"""
+    return "p" + f"{p * 100:g}".replace(".", "_")
+
+
+def build_stats_pipeline(
+    user_id: str,
+    since: datetime,
+    metric_types: Optional[List[str]] = None,
+    percentiles: Sequence[float] = DEFAULT_PERCENTILES
+) -> List[Dict[str, Any]]:
+    """Build the aggregation pipeline computing per-metric statistics
+
+    Everything is reduced inside MongoDB, so the result is one small document
+    per metric type no matter how many points fall in the window.
+    """
+    match = {"user_id": user_id, "timestamp": {"$gte": since}}
+    if metric_types:
+        match["metric_type"] = {"$in": metric_types}
+
+    group = {
+        "_id": "$metric_type",
+        "count": {"$sum": 1},
+        "average": {"$avg": "$value"},
+        "min": {"$min": "$value"},
+        "max": {"$max": "$value"},
+        "stddev": {"$stdDevPop": "$value"},
+        "latest": {"$top": {"sortBy": {"timestamp": -1}, "output": "$value"}}
+    }
+    if percentiles:
+        # $percentile (MongoDB 7.0+) only supports the approximate t-digest method
+        group["percentiles"] = {
+            "$percentile": {"input": "$value", "p": list(percentiles), "method": "approximate"}
+        }
+
+    return [{"$match": match}, {"$group": group}]
+
+
+async def compute_metric_stats(
+    user_id: str,
+    since: datetime,
+    metric_types: Optional[List[str]] = None,
+    percentiles: Sequence[float] = DEFAULT_PERCENTILES
+) -> Dict[str, Dict[str, Any]]:
+    """Get count/average/min/max/stddev/percentiles/latest keyed by metric type"""
+    db = await get_database()
+    pipeline = build_stats_pipeline(user_id, since, metric_types, percentiles)
+
+    stats = {}
+    async for doc in db.analytics_data.aggregate(pipeline):
+        metric_type = doc.pop("_id")
+        for p, value in zip(percentiles, doc.pop("percentiles", [])):
+            doc[_percentile_key(p)] = value
+        stats[metric_type] = doc
+
+    return stats
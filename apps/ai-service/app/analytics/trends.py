@@ -0,0 +1,105 @@
+from datetime import datetime
+from typing import Any, Dict, Hashable, Sequence, Tuple
+
+import numpy as np
+
+# A fitted line whose total change over the window is smaller than this
+# fraction of the series mean counts as "stable"
+STABLE_THRESHOLD = 0.05
+
+SECONDS_PER_DAY = 86400.0
+
+
+def _to_matrices(
+    series: Sequence[Tuple[Sequence[datetime], Sequence[float]]]
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Pack (timestamps, values) pairs into NaN-padded 2-D arrays (days, values)"""
+    width = max((len(values) for _, values in series), default=0)
+    times = np.full((len(series), width), np.nan)
+    values = np.full((len(series), width), np.nan)
+    for i, (timestamps, row) in enumerate(series):
+        n = len(row)
+        if n:
+            times[i, :n] = [ts.timestamp() / SECONDS_PER_DAY for ts in timestamps]
+            values[i, :n] = row
+    return times, values
+
+
+def compute_trends(times: np.ndarray, values: np.ndarray) -> Dict[str, np.ndarray]:
+    """Least-squares trend of values over time for every row at once
+
+    times are in days and may be in any order; NaN marks padding. Returns
+    arrays of slope (units per day), r2, relative change over the window,
+    strength (0-1) and direction (1 up, -1 down, 0 stable).
+    """
+    valid = ~(np.isnan(times) | np.isnan(values))
+    n = valid.sum(axis=1)
+    count = np.maximum(n, 1)
+
+    t = np.where(valid, times, 0.0)
+    y = np.where(valid, values, 0.0)
+    t_mean = t.sum(axis=1) / count
+    y_mean = y.sum(axis=1) / count
+
+    dt = np.where(valid, times - t_mean[:, None], 0.0)
+    dy = np.where(valid, values - y_mean[:, None], 0.0)
+    stt = (dt ** 2).sum(axis=1)
+    syy = (dy ** 2).sum(axis=1)
+    sty = (dt * dy).sum(axis=1)
+
+    fitted = (stt > 0) & (n >= 2)
+    slope = np.divide(sty, stt, out=np.zeros_like(sty), where=fitted)
+    r2 = np.divide(sty ** 2, stt * syy, out=np.zeros_like(sty), where=fitted & (syy > 0))
+
+    span = np.where(valid, times, -np.inf).max(axis=1) - np.where(valid, times, np.inf).min(axis=1)
+    span = np.where(fitted, span, 0.0)
+    relative_change = np.divide(
+        slope * span, np.abs(y_mean),
+        out=np.zeros_like(slope), where=fitted & (y_mean != 0)
+    )
+
+    direction = np.where(
+        np.abs(relative_change) < STABLE_THRESHOLD, 0, np.sign(relative_change)
+    ).astype(int)
+    # How large and how consistent the move is: |change| (capped at 100%)
+    # weighted by the goodness of fit
+    strength = np.where(direction != 0, np.minimum(np.abs(relative_change), 1.0) * r2, 0.0)
+
+    return {
+        "slope": slope,
+        "r2": r2,
+        "relative_change": relative_change,
+        "strength": strength,
+        "direction": direction,
+    }
+
+
+_DIRECTIONS = {1: "increasing", -1: "decreasing", 0: "stable"}
+
+
+def _row(result: Dict[str, np.ndarray], i: int) -> Dict[str, Any]:
+    return {
+        "direction": _DIRECTIONS[int(result["direction"][i])],
+        "strength": float(result["strength"][i]),
+        "slope": float(result["slope"][i]),
+        "r2": float(result["r2"][i]),
+        "relative_change": float(result["relative_change"][i]),
+    }
+
+
+def trend_for_series(timestamps: Sequence[datetime], values: Sequence[float]) -> Dict[str, Any]:
+    """Trend of a single series; see compute_trends"""
+    times, matrix = _to_matrices([(timestamps, values)])
+    return _row(compute_trends(times, matrix), 0)
+
+
+def trends_for_series_batch(
+    series: Dict[Hashable, Tuple[Sequence[datetime], Sequence[float]]]
+) -> Dict[Hashable, Dict[str, Any]]:
+    """Trends for many series, e.g. keyed by (user_id, metric_type)"""
+    keys = list(series)
+    if not keys:
+        return {}
+    times, matrix = _to_matrices([series[key] for key in keys])
+    result = compute_trends(times, matrix)
+    return {key: _row(result, i) for i, key in enumerate(keys)}
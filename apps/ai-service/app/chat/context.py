@@ -0,0 +1,257 @@
+import asyncio
+import json
+import os
+import statistics
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from langchain.schema import AIMessage, BaseMessage, HumanMessage, SystemMessage
+
+from app.chat.memory import CHAT_MEMORY_TTL, RedisConversationMemory
+from app.database.redis_client import get_redis_client
+
+# Prompt tokens allowed per request (system + summary + history + data + input)
+CHAT_CONTEXT_BUDGET = int(os.getenv("CHAT_CONTEXT_BUDGET", "6000"))
+# Share of the budget left after system prompt and input that data may use
+DATA_BUDGET_SHARE = float(os.getenv("CHAT_DATA_BUDGET_SHARE", "0.5"))
+# Upper bound for the rolling summary of older turns
+SUMMARY_MAX_TOKENS = int(os.getenv("CHAT_SUMMARY_MAX_TOKENS", "400"))
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token for Gemini/English)"""
+    return (len(text) + 3) // 4
+
+
+def summary_key(session_id: str) -> str:
+    return f"chat_summary:{session_id}"
+
+
+def _dumps(data: Any) -> str:
+    return json.dumps(data, default=str, separators=(",", ":"))
+
+
+def _downsample(points: List[Any], target: int) -> List[Any]:
+    """Evenly spaced subset of points, always keeping the first and last"""
+    if target <= 0:
+        return []
+    if len(points) <= target:
+        return points
+    if target == 1:
+        return [points[0]]
+    step = (len(points) - 1) / (target - 1)
+    return [points[round(i * step)] for i in range(target)]
+
+
+def fit_data_context(data: Optional[Dict[str, Any]], budget: int) -> Tuple[str, Dict[str, Any]]:
+    """Render analytics data for the prompt within a token budget
+
+    Raw records are used when they fit. Otherwise records are aggregated per
+    metric type (count, mean, min, max, first, latest) and a shrinking
+    evenly spaced sample of values is attached while it still fits.
+    """
+    if not data:
+        return "No specific data requested", {"data_mode": "none"}
+
+    raw = _dumps(data)
+    if estimate_tokens(raw) <= budget:
+        return raw, {"data_mode": "raw"}
+
+    records = data.get("data") or []
+    by_metric: Dict[str, List[Dict[str, Any]]] = {}
+    for record in records:
+        if isinstance(record, dict) and isinstance(record.get("value"), (int, float)):
+            by_metric.setdefault(str(record.get("metric_type")), []).append(record)
+
+    # Records arrive newest first; aggregate and sample in chronological order
+    aggregates = {}
+    series = {}
+    for metric_type, metric_records in by_metric.items():
+        metric_records = metric_records[::-1]
+        values = [record["value"] for record in metric_records]
+        aggregates[metric_type] = {
+            "count": len(values),
+            "mean": round(statistics.mean(values), 4),
+            "min": min(values),
+            "max": max(values),
+            "first": values[0],
+            "latest": values[-1],
+            "from": str(metric_records[0].get("timestamp")),
+            "to": str(metric_records[-1].get("timestamp"))
+        }
+        series[metric_type] = values
+
+    summary = {
+        "count": data.get("count", len(records)),
+        "query_params": data.get("query_params"),
+        "metrics": aggregates
+    }
+
+    samples = max((len(values) for values in series.values()), default=0)
+    while samples > 1:
+        summary["samples"] = {
+            metric_type: [round(v, 4) for v in _downsample(values, samples)]
+            for metric_type, values in series.items()
+        }
+        rendered = _dumps(summary)
+        if estimate_tokens(rendered) <= budget:
+            return rendered, {"data_mode": "aggregated", "data_samples": samples}
+        samples //= 2
+
+    summary.pop("samples", None)
+    rendered = _dumps(summary)
+    if estimate_tokens(rendered) > budget:
+        # Even the aggregates are too large; keep the biggest metrics
+        ranked = sorted(aggregates, key=lambda m: aggregates[m]["count"], reverse=True)
+        while ranked and estimate_tokens(rendered) > budget:
+            ranked.pop()
+            summary["metrics"] = {m: aggregates[m] for m in ranked}
+            rendered = _dumps(summary)
+    return rendered, {"data_mode": "aggregated", "data_samples": 0}
+
+
+class ContextBuilder:
+    """Builds chat prompts that fit a token budget.
+
+    The newest exchanges from the Redis window are included while they fit;
+    exchanges that scroll out of the window are folded into a rolling
+    per-session summary (cached in Redis) by a background LLM call, so long
+    sessions keep their gist at constant prompt cost.
+    """
+
+    def __init__(
+        self,
+        llm: Any,
+        memory: RedisConversationMemory,
+        budget: int = CHAT_CONTEXT_BUDGET,
+        summary_ttl: int = CHAT_MEMORY_TTL
+    ):
+        self.llm = llm
+        self.memory = memory
+        self.budget = budget
+        self.summary_ttl = summary_ttl
+        self._summary_tasks: Set[asyncio.Task] = set()
+        self._summary_locks: Dict[str, Tuple[asyncio.Lock, int]] = {}
+
+    async def build(
+        self,
+        session_id: str,
+        system_prompt: str,
+        user_input: str,
+        data: Optional[Dict[str, Any]] = None
+    ) -> Tuple[List[BaseMessage], Dict[str, Any]]:
+        """Return the prompt messages and a token usage report"""
+        exchanges, summary = await asyncio.gather(
+            self.memory.load_exchanges(session_id),
+            self.get_summary(session_id)
+        )
+
+        system_tokens = estimate_tokens(system_prompt)
+        remaining = self.budget - system_tokens - estimate_tokens(user_input)
+
+        data_text = None
+        data_usage: Dict[str, Any] = {}
+        if data is not None:
+            data_text, data_usage = fit_data_context(data, max(int(remaining * DATA_BUDGET_SHARE), 0))
+            remaining -= estimate_tokens(data_text)
+
+        summary_tokens = 0
+        if summary and estimate_tokens(summary) <= remaining:
+            summary_tokens = estimate_tokens(summary)
+            remaining -= summary_tokens
+        else:
+            summary = None
+
+        # Newest exchanges first until the budget runs out
+        history: List[Tuple[str, str]] = []
+        history_tokens = 0
+        for user_message, ai_message in reversed(exchanges):
+            cost = estimate_tokens(user_message) + estimate_tokens(ai_message)
+            if cost > remaining:
+                break
+            history.append((user_message, ai_message))
+            history_tokens += cost
+            remaining -= cost
+        history.reverse()
+
+        system_content = system_prompt
+        if summary:
+            system_content += f"\n\nSummary of the earlier conversation:\n{summary}"
+
+        messages: List[BaseMessage] = [SystemMessage(content=system_content)]
+        for user_message, ai_message in history:
+            messages.append(HumanMessage(content=user_message))
+            messages.append(AIMessage(content=ai_message))
+
+        human_content = user_input
+        if data_text is not None:
+            human_content = f"{user_input}\n\nAvailable Data Context: {data_text}"
+        messages.append(HumanMessage(content=human_content))
+
+        input_tokens = estimate_tokens(human_content)
+        usage = {
+            "budget": self.budget,
+            "system": system_tokens,
+            "summary": summary_tokens,
+            "history": history_tokens,
+            "input": input_tokens,
+            "total": system_tokens + summary_tokens + history_tokens + input_tokens,
+            "history_exchanges": len(history),
+            "history_dropped": len(exchanges) - len(history),
+            **data_usage
+        }
+        return messages, usage
+
+    async def get_summary(self, session_id: str) -> Optional[str]:
+        try:
+            redis = await get_redis_client()
+            return await redis.get(summary_key(session_id))
+        except Exception:
+            return None
+
+    async def record_exchange(self, session_id: str, user_message: str, ai_message: str):
+        """Append an exchange; anything evicted from the window gets summarized"""
+        evicted = await self.memory.append(session_id, user_message, ai_message)
+        if evicted:
+            task = asyncio.create_task(self._update_summary(session_id, evicted))
+            self._summary_tasks.add(task)
+            task.add_done_callback(self._summary_tasks.discard)
+
+    async def _update_summary(self, session_id: str, evicted: List[Tuple[str, str]]):
+        # Serialize updates per session so concurrent turns don't drop lines
+        lock, users = self._summary_locks.get(session_id, (asyncio.Lock(), 0))
+        self._summary_locks[session_id] = (lock, users + 1)
+        try:
+            async with lock:
+                previous = await self.get_summary(session_id) or "(none)"
+                transcript = "\n".join(
+                    f"User: {user_message}\nAI: {ai_message}" for user_message, ai_message in evicted
+                )
+                prompt = f"""
+                Update the running summary of a conversation between a user and an analytics assistant.
+                Keep facts, numbers, metrics and decisions the assistant may need later.
+                Use at most {SUMMARY_MAX_TOKENS * 3 // 4} words.
+
+                Current summary:
+                {previous}
+
+                New lines:
+                {transcript}
+
+                Updated summary:
+                """
+                response = await self.llm.ainvoke(prompt)
+                redis = await get_redis_client()
+                await redis.set(summary_key(session_id), response.content.strip(), ex=self.summary_ttl)
+        except Exception as e:
+            print(f"❌ Failed to update chat summary for {session_id}: {e}")
+        finally:
+            lock, users = self._summary_locks[session_id]
+            if users == 1:
+                del self._summary_locks[session_id]
+            else:
+                self._summary_locks[session_id] = (lock, users - 1)
+
+    async def clear(self, session_id: str):
+        """Forget a session's summary"""
+        redis = await get_redis_client()
+        await redis.delete(summary_key(session_id))
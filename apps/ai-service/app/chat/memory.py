@@ -0,0 +1,79 @@
+import json
+import os
+from typing import List, Tuple
+
+from app.database.redis_client import get_redis_client
+
+# Exchanges (user message + AI reply) kept per session
+CHAT_MEMORY_WINDOW = int(os.getenv("CHAT_MEMORY_WINDOW", "10"))
+# Seconds of inactivity after which a session's memory expires
+CHAT_MEMORY_TTL = int(os.getenv("CHAT_MEMORY_TTL", str(24 * 3600)))
+
+
+def memory_key(session_id: str) -> str:
+    return f"chat_memory:{session_id}"
+
+
+def _encode(user_message: str, ai_message: str) -> str:
+    # One compact list element per exchange
+    return json.dumps([user_message, ai_message], separators=(",", ":"), ensure_ascii=False)
+
+
+def _decode_all(entries: List[str]) -> List[Tuple[str, str]]:
+    exchanges = []
+    for entry in entries:
+        try:
+            user_message, ai_message = json.loads(entry)
+        except (ValueError, TypeError):
+            continue
+        exchanges.append((user_message, ai_message))
+    return exchanges
+
+
+class RedisConversationMemory:
+    """Conversation window stored as a capped Redis list.
+
+    Loading is a single LRANGE of the last k exchanges and saving a turn is
+    one pipelined RPUSH + LRANGE (evicted) + LTRIM + EXPIRE, so cost depends
+    on the window, never on the length of the whole conversation.
+    """
+
+    def __init__(self, window: int = CHAT_MEMORY_WINDOW, ttl: int = CHAT_MEMORY_TTL):
+        self.window = window
+        self.ttl = ttl
+
+    async def load_exchanges(self, session_id: str) -> List[Tuple[str, str]]:
+        """Get the last window exchanges as (user, ai) pairs, oldest first"""
+        try:
+            redis = await get_redis_client()
+            entries = await redis.lrange(memory_key(session_id), -self.window, -1)
+        except Exception:
+            # Missing Redis (or a legacy non-list value) just means no history
+            return []
+
+        return _decode_all(entries)
+
+    async def append(self, session_id: str, user_message: str, ai_message: str) -> List[Tuple[str, str]]:
+        """Append one exchange, trim to the window and refresh the idle TTL
+
+        Returns the exchanges that fell out of the window, oldest first.
+        """
+        key = memory_key(session_id)
+        try:
+            redis = await get_redis_client()
+            pipe = redis.pipeline(transaction=True)
+            pipe.rpush(key, _encode(user_message, ai_message))
+            pipe.lrange(key, 0, -self.window - 1)
+            pipe.ltrim(key, -self.window, -1)
+            pipe.expire(key, self.ttl)
+            _, evicted, _, _ = await pipe.execute()
+        except Exception as e:
+            print(f"❌ Failed to save chat memory for {session_id}: {e}")
+            return []
+
+        return _decode_all(evicted)
+
+    async def clear(self, session_id: str):
+        """Forget a session's conversation"""
+        redis = await get_redis_client()
+        await redis.delete(memory_key(session_id))
@@ -35,6 +35,20 @@ class ChatSession(BaseModel):
     message_count: int = 0
     is_active: bool = True
 
+class ChatMessagePage(BaseModel):
+    items: List[ChatMessage]
+    before: Optional[str] = None
+    after: Optional[str] = None
+    has_more: bool = False
+    limit: int
+
+class ChatSessionPage(BaseModel):
+    items: List[ChatSession]
+    before: Optional[str] = None
+    after: Optional[str] = None
+    has_more: bool = False
+    limit: int
+
 class AnalyticsQuery(BaseModel):
     query: str
     user_id: str
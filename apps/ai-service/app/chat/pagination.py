@@ -0,0 +1,128 @@
+import base64
+import json
+import os
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from bson import ObjectId
+from bson.errors import InvalidId
+
+# Largest page a client may request
+CHAT_PAGE_MAX = int(os.getenv("CHAT_PAGE_MAX", "200"))
+
+
+def encode_cursor(value: datetime, object_id: ObjectId) -> str:
+    """Opaque cursor for a (sort field value, _id) position"""
+    raw = json.dumps([value.isoformat(), str(object_id)], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, ObjectId]:
+    """Inverse of encode_cursor; raises ValueError for malformed cursors"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        value, object_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return datetime.fromisoformat(value), ObjectId(object_id)
+    except (ValueError, TypeError, InvalidId) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+
+def keyset_condition(field: str, cursor: str, older: bool) -> Dict[str, Any]:
+    """Filter for documents strictly before (older) or after a cursor"""
+    value, object_id = decode_cursor(cursor)
+    op = "$lt" if older else "$gt"
+    return {"$or": [
+        {field: {op: value}},
+        {field: value, "_id": {op: object_id}}
+    ]}
+
+
+def projection_for(fields: Optional[Sequence[str]], allowed: Sequence[str], sort_field: str) -> Dict[str, int]:
+    """Mongo projection for the requested fields (all allowed ones by default)
+
+    The sort field and _id are always fetched because cursors are built
+    from them.
+    """
+    requested = list(fields) if fields else list(allowed)
+    unknown = [field for field in requested if field not in allowed]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    projection = {field: 1 for field in requested}
+    projection[sort_field] = 1
+    projection["_id"] = 1
+    return projection
+
+
+def parse_fields(fields: Optional[str]) -> Optional[List[str]]:
+    """Split a comma-separated ?fields= parameter"""
+    if not fields:
+        return None
+    return [field.strip() for field in fields.split(",") if field.strip()]
+
+
+async def fetch_page(
+    collection,
+    query: Dict[str, Any],
+    sort_field: str,
+    projection: Dict[str, int],
+    returned_fields: Sequence[str],
+    limit: int,
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+    newest_first: bool = True
+) -> Dict[str, Any]:
+    """One keyset page of raw documents, ordered by (sort_field, _id)
+
+    ``before`` pages towards older documents and ``after`` towards newer
+    ones; with neither, the newest page is returned. Items come back
+    newest first when ``newest_first`` else oldest first. Documents are
+    trusted DB reads, so they are returned as JSON-ready dicts without
+    per-document model validation.
+    """
+    if before and after:
+        raise ValueError("Use either before or after, not both")
+    limit = max(1, min(limit, CHAT_PAGE_MAX))
+
+    older = after is None
+    if before or after:
+        query = {"$and": [query, keyset_condition(sort_field, before or after, older)]}
+
+    direction = -1 if older else 1
+    cursor = (
+        collection.find(query, projection)
+        .sort([(sort_field, direction), ("_id", direction)])
+        .limit(limit + 1)
+    )
+    docs = await cursor.to_list(length=limit + 1)
+    has_more = len(docs) > limit
+    docs = docs[:limit]
+
+    # docs run away from the cursor; flip to the requested display order
+    if older != newest_first:
+        docs.reverse()
+
+    items = []
+    for doc in docs:
+        item = {}
+        for field in returned_fields:
+            if field in doc:
+                value = doc[field]
+                item[field] = value.isoformat() if isinstance(value, datetime) else value
+        items.append(item)
+
+    if docs:
+        newest, oldest = (docs[0], docs[-1]) if newest_first else (docs[-1], docs[0])
+        older_cursor = encode_cursor(oldest[sort_field], oldest["_id"])
+        newer_cursor = encode_cursor(newest[sort_field], newest["_id"])
+    else:
+        # Nothing further this way; keep the position so the client can poll
+        older_cursor = newer_cursor = before or after
+
+    return {
+        "items": items,
+        # Cursors to continue in either direction from this page
+        "before": older_cursor,
+        "after": newer_cursor,
+        "has_more": has_more,
+        "limit": limit
+    }
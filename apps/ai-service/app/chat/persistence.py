@@ -0,0 +1,233 @@
+import asyncio
+import os
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from bson import ObjectId
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from app.chat.models import ChatMessage
+from app.database.mongodb import get_database
+from app.services.resilience import backoff_delay
+
+# Flush when this many messages are queued...
+CHAT_WRITE_BATCH_SIZE = int(os.getenv("CHAT_WRITE_BATCH_SIZE", "100"))
+# ...or when the oldest queued message has waited this long
+CHAT_WRITE_INTERVAL_MS = int(os.getenv("CHAT_WRITE_INTERVAL_MS", "50"))
+# Messages held in memory before enqueue falls back to a synchronous flush
+CHAT_WRITE_MAX_PENDING = int(os.getenv("CHAT_WRITE_MAX_PENDING", "10000"))
+# Retries of a failed batch within one flush, with full-jitter backoff (seconds)
+CHAT_WRITE_RETRIES = int(os.getenv("CHAT_WRITE_RETRIES", "3"))
+CHAT_WRITE_RETRY_BASE = float(os.getenv("CHAT_WRITE_RETRY_BASE", "0.1"))
+CHAT_WRITE_RETRY_CAP = float(os.getenv("CHAT_WRITE_RETRY_CAP", "2"))
+
+# Server error code for a duplicate key
+DUPLICATE_KEY = 11000
+
+
+class ChatMessageWriter:
+    """Write-behind persistence for chat messages.
+
+    ``enqueue`` only appends to an in-memory buffer; a background task
+    writes everything buffered during one interval (or as soon as a batch
+    fills) with unordered ``insert_many`` calls plus one ``bulk_write``
+    of per-session ``message_count``/``updated_at`` updates. ``close``
+    drains the buffer so nothing queued is lost on a clean shutdown.
+
+    Each message gets its ``_id`` when queued, so retrying a batch is
+    idempotent: rows an earlier attempt already stored come back as
+    duplicate keys and count as written. Rows the server rejects for any
+    other reason are dropped on their own. A batch that still fails after
+    the retries goes back to the front of the queue for the next flush.
+
+    Session counters are only queued once a batch is stored, so a batch
+    that is inserted again adds nothing. When the session update partly
+    fails, only the sessions in its ``writeErrors`` stay queued; the
+    others are not incremented twice.
+    """
+
+    def __init__(
+        self,
+        batch_size: int = CHAT_WRITE_BATCH_SIZE,
+        interval_ms: int = CHAT_WRITE_INTERVAL_MS,
+        max_pending: int = CHAT_WRITE_MAX_PENDING,
+        retries: int = CHAT_WRITE_RETRIES
+    ):
+        self.batch_size = batch_size
+        self.interval = interval_ms / 1000
+        self.max_pending = max_pending
+        self.retries = retries
+        self._pending: List[Dict[str, Any]] = []
+        # Session counter increments of stored messages not yet applied
+        self._sessions: Dict[str, Dict[str, Any]] = {}
+        self._wakeup: Optional[asyncio.Event] = None
+        self._full: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self.written = 0
+        self.batches = 0
+        self.errors = 0
+        self.retried = 0
+        self.rejected = 0
+        self.dropped = 0
+
+    def _ensure_started(self):
+        # Started lazily so the writer can be built outside a running loop
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._full = asyncio.Event()
+            self._flush_lock = asyncio.Lock()
+            self._task = asyncio.create_task(self._flush_loop())
+
+    async def enqueue(self, message: ChatMessage):
+        """Queue a message for the next batch"""
+        self._ensure_started()
+        document = message.dict()
+        document["_id"] = ObjectId()
+        self._pending.append(document)
+        self._wakeup.set()
+        if len(self._pending) >= self.batch_size:
+            self._full.set()
+        if len(self._pending) >= self.max_pending:
+            # Database is falling behind; apply backpressure to the caller
+            await self.flush()
+
+    async def flush(self):
+        """Write everything queued so far"""
+        if self._flush_lock is None:
+            return
+        async with self._flush_lock:
+            while self._pending:
+                batch = self._pending[:self.batch_size]
+                self._pending = self._pending[self.batch_size:]
+                if not await self._write(batch):
+                    self._requeue(batch)
+                    break
+            if self._sessions and not await self._write_sessions():
+                # Try the remaining sessions again on the next interval
+                self._wakeup.set()
+            self._full.clear()
+
+    def _requeue(self, batch: List[Dict[str, Any]]):
+        """Put a failed batch back in front, dropping the oldest beyond max_pending"""
+        self._pending = batch + self._pending
+        excess = len(self._pending) - self.max_pending
+        if excess > 0:
+            self.dropped += excess
+            print(f"❌ Chat message queue full, dropped {excess} oldest messages")
+            self._pending = self._pending[excess:]
+        # Try again on the next interval even if nothing new is queued
+        self._wakeup.set()
+
+    async def _write(self, batch: List[Dict[str, Any]]) -> bool:
+        """Store a batch and queue its session counters; False if it should be retried later"""
+        for attempt in range(self.retries + 1):
+            if attempt:
+                self.retried += 1
+                await asyncio.sleep(backoff_delay(attempt, CHAT_WRITE_RETRY_BASE, CHAT_WRITE_RETRY_CAP))
+            try:
+                db = await get_database()
+                stored = await self._insert(db, batch)
+                self._count_sessions(stored)
+                self.written += len(stored)
+                self.batches += 1
+                return True
+            except Exception as e:
+                self.errors += 1
+                print(f"❌ Failed to persist {len(batch)} chat messages (attempt {attempt + 1}): {e}")
+        return False
+
+    async def _insert(self, db, batch: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Insert a batch unordered and return the documents that are stored"""
+        try:
+            await db.chat_messages.insert_many(batch, ordered=False)
+            return batch
+        except BulkWriteError as e:
+            rejected = {
+                error["index"]
+                for error in e.details.get("writeErrors", [])
+                if error.get("code") != DUPLICATE_KEY
+            }
+            if rejected:
+                self.rejected += len(rejected)
+                print(f"❌ Dropped {len(rejected)} chat messages rejected by the database")
+            return [document for index, document in enumerate(batch) if index not in rejected]
+
+    def _count_sessions(self, documents: List[Dict[str, Any]]):
+        for document in documents:
+            session = self._sessions.setdefault(document["session_id"], {"count": 0, "updated_at": datetime.min})
+            session["count"] += 1
+            session["updated_at"] = max(session["updated_at"], document["timestamp"])
+
+    async def _write_sessions(self) -> bool:
+        """Apply the queued session counters; False if some are still queued"""
+        for attempt in range(self.retries + 1):
+            if attempt:
+                self.retried += 1
+                await asyncio.sleep(backoff_delay(attempt, CHAT_WRITE_RETRY_BASE, CHAT_WRITE_RETRY_CAP))
+            sessions = list(self._sessions.items())
+            try:
+                db = await get_database()
+                await db.chat_sessions.bulk_write(
+                    [
+                        UpdateOne(
+                            {"id": session_id},
+                            {
+                                "$inc": {"message_count": session["count"]},
+                                "$max": {"updated_at": session["updated_at"]}
+                            }
+                        )
+                        for session_id, session in sessions
+                    ],
+                    ordered=False
+                )
+                self._sessions = {}
+                return True
+            except BulkWriteError as e:
+                # The other updates were applied; keep only the failed ones
+                failed = {error["index"] for error in e.details.get("writeErrors", [])}
+                self._sessions = {
+                    session_id: session
+                    for index, (session_id, session) in enumerate(sessions)
+                    if index in failed
+                }
+                self.errors += 1
+                print(f"❌ Failed to update {len(failed)} of {len(sessions)} chat sessions (attempt {attempt + 1}): {e}")
+            except Exception as e:
+                self.errors += 1
+                print(f"❌ Failed to update {len(sessions)} chat sessions (attempt {attempt + 1}): {e}")
+        return False
+
+    async def _flush_loop(self):
+        while True:
+            await self._wakeup.wait()
+            # Collect the rest of this interval's messages unless the batch fills first
+            try:
+                await asyncio.wait_for(self._full.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def close(self):
+        """Drain the buffer and stop the flusher"""
+        await self.flush()
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def stats(self) -> Dict[str, Any]:
+        """Write-behind counters for this worker"""
+        return {
+            "pending": len(self._pending),
+            "pending_sessions": len(self._sessions),
+            "written": self.written,
+            "batches": self.batches,
+            "errors": self.errors,
+            "retried": self.retried,
+            "rejected": self.rejected,
+            "dropped": self.dropped,
+            "avg_batch": round(self.written / self.batches, 2) if self.batches else 0
+        }
@@ -1,12 +1,16 @@
 from fastapi import APIRouter, HTTPException, Depends
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel
 from typing import List, Dict, Any, Optional
 from datetime import datetime
 import json
 
 from app.chat.service import ChatService
-from app.chat.models import ChatMessage, ChatResponse, ChatSession
+from app.chat.models import ChatMessagePage, ChatResponse, ChatSession, ChatSessionPage
+from app.chat.pagination import parse_fields
+from app.chat.streaming import sse_event
 from app.database.mongodb import get_database
+from app.dependencies import get_chat_service
 
 router = APIRouter()
 
@@ -22,10 +26,12 @@ class ChatHistoryRequest(BaseModel):
     limit: Optional[int] = 50
 
 @router.post("/message", response_model=ChatResponse)
-async def send_message(request: ChatRequest):
+async def send_message(
+    request: ChatRequest,
+    chat_service: ChatService = Depends(get_chat_service)
+):
     """Send a message to the AI chat bot"""
     try:
-        chat_service = ChatService()
         response = await chat_service.process_message(
             message=request.message,
             user_id=request.user_id,
@@ -36,59 +42,107 @@ async def send_message(request: ChatRequest):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error processing message: {str(e)}")
 
-@router.get("/history/{user_id}", response_model=List[ChatMessage])
+@router.post("/message/stream")
+async def stream_message(
+    request: ChatRequest,
+    chat_service: ChatService = Depends(get_chat_service)
+):
+    """Send a message and stream the AI reply as server-sent events"""
+    events = chat_service.stream_message(
+        message=request.message,
+        user_id=request.user_id,
+        session_id=request.session_id,
+        context=request.context
+    )
+    return StreamingResponse(
+        (sse_event(event) async for event in events),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.get("/history/{user_id}", response_model=ChatMessagePage)
 async def get_chat_history(
     user_id: str,
     session_id: Optional[str] = None,
-    limit: int = 50
+    limit: int = 50,
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+    fields: Optional[str] = None,
+    chat_service: ChatService = Depends(get_chat_service)
 ):
-    """Get chat history for a user"""
+    """Get a page of chat history for a user (keyset cursors: before/after)"""
     try:
-        chat_service = ChatService()
         history = await chat_service.get_chat_history(
             user_id=user_id,
             session_id=session_id,
-            limit=limit
+            limit=limit,
+            before=before,
+            after=after,
+            fields=parse_fields(fields)
         )
-        return history
+        # Trusted DB reads: skip response model validation
+        return JSONResponse(content=history)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error retrieving chat history: {str(e)}")
 
 @router.post("/session", response_model=ChatSession)
-async def create_chat_session(user_id: str):
+async def create_chat_session(
+    user_id: str,
+    chat_service: ChatService = Depends(get_chat_service)
+):
     """Create a new chat session"""
     try:
-        chat_service = ChatService()
         session = await chat_service.create_session(user_id=user_id)
         return session
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error creating chat session: {str(e)}")
 
 @router.delete("/session/{session_id}")
-async def delete_chat_session(session_id: str, user_id: str):
+async def delete_chat_session(
+    session_id: str, user_id: str,
+    chat_service: ChatService = Depends(get_chat_service)
+):
     """Delete a chat session"""
     try:
-        chat_service = ChatService()
         await chat_service.delete_session(session_id=session_id, user_id=user_id)
         return {"message": "Session deleted successfully"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error deleting chat session: {str(e)}")
 
-@router.get("/sessions/{user_id}", response_model=List[ChatSession])
-async def get_user_sessions(user_id: str):
-    """Get all chat sessions for a user"""
+@router.get("/sessions/{user_id}", response_model=ChatSessionPage)
+async def get_user_sessions(
+    user_id: str,
+    limit: int = 50,
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+    fields: Optional[str] = None,
+    chat_service: ChatService = Depends(get_chat_service)
+):
+    """Get a page of chat sessions for a user (keyset cursors: before/after)"""
     try:
-        chat_service = ChatService()
-        sessions = await chat_service.get_user_sessions(user_id=user_id)
-        return sessions
+        sessions = await chat_service.get_user_sessions(
+            user_id=user_id,
+            limit=limit,
+            before=before,
+            after=after,
+            fields=parse_fields(fields)
+        )
+        # Trusted DB reads: skip response model validation
+        return JSONResponse(content=sessions)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error retrieving user sessions: {str(e)}")
 
 @router.post("/analytics/query")
-async def analytics_query(request: ChatRequest):
+async def analytics_query(
+    request: ChatRequest,
+    chat_service: ChatService = Depends(get_chat_service)
+):
     """Process analytics-specific queries"""
     try:
-        chat_service = ChatService()
         response = await chat_service.process_analytics_query(
             message=request.message,
             user_id=request.user_id,
@@ -2,28 +2,51 @@ import os
 import json
 import uuid
 from datetime import datetime
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, AsyncIterator, Set
 import asyncio
 
 from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain.schema import HumanMessage, AIMessage, SystemMessage
-from langchain.memory import ConversationBufferWindowMemory
-from langchain.prompts import ChatPromptTemplate, MessagesPlaceholder
-from langchain.chains import ConversationChain
 
+from app.analytics.service import AnalyticsService
+from app.chat.context import ContextBuilder
+from app.chat.memory import RedisConversationMemory
 from app.chat.models import ChatMessage, ChatResponse, ChatSession, MessageType
-from app.database.redis_client import get_redis_client
+from app.chat.pagination import fetch_page, projection_for
+from app.chat.persistence import ChatMessageWriter
+from app.chat.streaming import StreamStats, StreamTimer
+from app.database.mongodb import get_database
 from app.services.backend_client import BackendClient
+from app.services.structured_output import LLM_BATCH_MODE, SUGGESTIONS_INSTRUCTION, split_suggestions
+
+# Fields served by the history/sessions endpoints
+HISTORY_FIELDS = ("id", "message", "message_type", "user_id", "session_id", "timestamp", "metadata")
+SESSION_FIELDS = ("id", "user_id", "title", "created_at", "updated_at", "message_count", "is_active")
 
 class ChatService:
-    def __init__(self):
-        self.llm = ChatGoogleGenerativeAI(
+    def __init__(
+        self,
+        llm: Optional[ChatGoogleGenerativeAI] = None,
+        backend_client: Optional[BackendClient] = None,
+        analytics_service: Optional[AnalyticsService] = None,
+        message_writer: Optional[ChatMessageWriter] = None
+    ):
+        # Shared clients are injected by the service container; the fallbacks
+        # keep ad-hoc construction (scripts, shells) working.
+        self.llm = llm or ChatGoogleGenerativeAI(
             model="gemini-pro",
             google_api_key=os.getenv("GOOGLE_API_KEY"),
             temperature=0.7,
-            max_output_tokens=2048
+            max_output_tokens=2048,
+            convert_system_message_to_human=True
         )
-        self.backend_client = BackendClient()
+        self.backend_client = backend_client or BackendClient()
+        self.analytics_service = analytics_service or AnalyticsService()
+        self.message_writer = message_writer or ChatMessageWriter()
+        self.stream_stats = StreamStats()
+        # Detached bookkeeping tasks, referenced until they finish
+        self._background: Set[asyncio.Task] = set()
+        self.memory = RedisConversationMemory()
+        self.context_builder = ContextBuilder(self.llm, self.memory)
         
         # System prompt for analytics chat bot
         self.system_prompt = """
@@ -55,25 +78,25 @@ class ChatService:
                 session = await self.create_session(user_id)
                 session_id = session.id
 
-            # Get conversation memory
-            memory = await self._get_conversation_memory(session_id)
-            
-            # Create conversation chain
-            prompt = ChatPromptTemplate.from_messages([
-                ("system", self.system_prompt),
-                MessagesPlaceholder(variable_name="history"),
-                ("human", "{input}")
-            ])
-            
-            conversation = ConversationChain(
-                llm=self.llm,
-                memory=memory,
-                prompt=prompt,
-                verbose=True
-            )
+            # In batch mode the model also returns follow-up suggestions so
+            # no second LLM call is needed
+            system_prompt = self.system_prompt
+            if LLM_BATCH_MODE:
+                system_prompt += SUGGESTIONS_INSTRUCTION
+
+            # Budgeted prompt: rolling summary + newest history that fits
+            messages, usage = await self.context_builder.build(session_id, system_prompt, message)
 
             # Process the message
-            response_text = await conversation.apredict(input=message)
+            response = await self.llm.ainvoke(messages)
+            response_text = response.content
+            
+            suggestions = None
+            if LLM_BATCH_MODE:
+                response_text, suggestions = split_suggestions(response_text)
+            
+            # Persist only the new exchange (without the suggestions line)
+            await self.context_builder.record_exchange(session_id, message, response_text)
             
             # Save messages to database
             await self._save_message(
@@ -90,8 +113,9 @@ class ChatService:
                 session_id=session_id
             )
 
-            # Generate suggestions based on the response
-            suggestions = await self._generate_suggestions(message, response_text)
+            # Fall back to a separate call when the reply had no usable suggestions
+            if suggestions is None:
+                suggestions = await self._generate_suggestions(message, response_text)
 
             return ChatResponse(
                 message=response_text,
@@ -99,7 +123,8 @@ class ChatService:
                 suggestions=suggestions,
                 metadata={
                     "model": "gemini-pro",
-                    "context": context
+                    "context": context,
+                    "context_tokens": usage
                 }
             )
 
@@ -112,6 +137,72 @@ class ChatService:
                 metadata={"error": str(e)}
             )
 
+    async def stream_message(
+        self,
+        message: str,
+        user_id: str,
+        session_id: Optional[str] = None,
+        context: Optional[Dict[str, Any]] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Stream an AI response as token events
+
+        Yields "start", then "token" events as chunks arrive, then "done" with
+        the full reply and timing metrics. Memory and persistence run in a
+        detached task started just before "done", so a client that
+        disconnects on "done" cannot cancel them; suggestions follow as a
+        final "suggestions" event.
+        """
+        timer = StreamTimer()
+        try:
+            # Create session if not provided
+            if not session_id:
+                session = await self.create_session(user_id)
+                session_id = session.id
+
+            yield {"type": "start", "session_id": session_id}
+
+            messages, usage = await self.context_builder.build(session_id, self.system_prompt, message)
+
+            chunks = []
+            async for chunk in self.llm.astream(messages):
+                if not chunk.content:
+                    continue
+                timer.record(chunk.content)
+                chunks.append(chunk.content)
+                yield {"type": "token", "content": chunk.content, "session_id": session_id}
+
+            response_text = "".join(chunks)
+            metrics = timer.summary()
+            self.stream_stats.record(metrics)
+
+            # Off the time-to-first-token path, and outliving this generator
+            self._spawn(self._record_exchange(message, response_text, user_id, session_id))
+
+            yield {
+                "type": "done",
+                "message": response_text,
+                "session_id": session_id,
+                "timestamp": datetime.utcnow().isoformat(),
+                "metadata": {
+                    "model": "gemini-pro",
+                    "context": context,
+                    "context_tokens": usage,
+                    "stream": metrics
+                }
+            }
+
+            suggestions = await self._generate_suggestions(message, response_text)
+            yield {"type": "suggestions", "suggestions": suggestions, "session_id": session_id}
+
+        except Exception as e:
+            self.stream_stats.errors += 1
+            yield {
+                "type": "error",
+                "message": f"I apologize, but I encountered an error processing your message: {str(e)}",
+                "session_id": session_id or "error",
+                "timestamp": datetime.utcnow().isoformat()
+            }
+
     async def process_analytics_query(
         self, 
         message: str, 
@@ -131,12 +222,11 @@ class ChatService:
                     query_params=query_analysis.get("query_params", {})
                 )
 
-            # Create enhanced prompt with data context
+            # Create enhanced prompt; the data context is aggregated and
+            # downsampled by the context builder when it exceeds its budget
             enhanced_prompt = f"""
             User Query: {message}
             
-            Available Data Context: {json.dumps(data, default=str) if data else "No specific data requested"}
-            
             Please provide a comprehensive response that includes:
             1. Direct answer to the user's question
             2. Key insights from the data (if available)
@@ -144,30 +234,22 @@ class ChatService:
             4. Suggestions for further analysis
             """
 
-            # Get conversation memory
-            memory = await self._get_conversation_memory(session_id or "analytics")
-            
-            # Process with enhanced context
-            prompt = ChatPromptTemplate.from_messages([
-                ("system", self.system_prompt),
-                MessagesPlaceholder(variable_name="history"),
-                ("human", enhanced_prompt)
-            ])
-            
-            conversation = ConversationChain(
-                llm=self.llm,
-                memory=memory,
-                prompt=prompt,
-                verbose=True
+            # Sessionless queries still get history, but never another user's
+            memory_session = session_id or f"analytics:{user_id}"
+            messages, usage = await self.context_builder.build(
+                memory_session, self.system_prompt, enhanced_prompt, data=data or {}
             )
 
-            response_text = await conversation.apredict(input=enhanced_prompt)
+            response = await self.llm.ainvoke(messages)
+            response_text = response.content
+            await self.context_builder.record_exchange(memory_session, message, response_text)
 
             return {
                 "query": message,
                 "response": response_text,
                 "data": data,
                 "insights": await self._extract_insights(response_text),
+                "context_tokens": usage,
                 "timestamp": datetime.utcnow().isoformat()
             }
 
@@ -214,26 +296,34 @@ class ChatService:
                 "query_type": "general"
             }
 
-    async def _get_conversation_memory(self, session_id: str) -> ConversationBufferWindowMemory:
-        """Get or create conversation memory for a session"""
-        redis = await get_redis_client()
-        memory_key = f"chat_memory:{session_id}"
-        
-        # Try to load from Redis
-        memory_data = await redis.get(memory_key)
-        if memory_data:
-            memory = ConversationBufferWindowMemory(
-                k=10,  # Keep last 10 exchanges
-                return_messages=True
+    def _spawn(self, coro):
+        task = asyncio.create_task(coro)
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    async def _record_exchange(self, message: str, response_text: str, user_id: str, session_id: str):
+        """Append a finished exchange to memory and queue both messages for writing"""
+        try:
+            await self.context_builder.record_exchange(session_id, message, response_text)
+            await self._save_message(
+                message=message,
+                message_type=MessageType.USER,
+                user_id=user_id,
+                session_id=session_id
             )
-            # Restore memory from Redis data
-            # This is a simplified version - in production, you'd want more robust serialization
-            return memory
-        
-        return ConversationBufferWindowMemory(
-            k=10,
-            return_messages=True
-        )
+            await self._save_message(
+                message=response_text,
+                message_type=MessageType.AI,
+                user_id=user_id,
+                session_id=session_id
+            )
+        except Exception as e:
+            print(f"❌ Failed to record exchange for session {session_id}: {e}")
+
+    async def close(self):
+        """Wait for detached bookkeeping so its messages reach the writer"""
+        if self._background:
+            await asyncio.gather(*self._background, return_exceptions=True)
 
     async def _save_message(
         self, 
@@ -242,8 +332,7 @@ class ChatService:
         user_id: str, 
         session_id: str
     ):
-        """Save message to database"""
-        db = await get_database()
+        """Queue message for the batched write-behind to the database"""
         chat_message = ChatMessage(
             message=message,
             message_type=message_type,
@@ -251,7 +340,7 @@ class ChatService:
             session_id=session_id
         )
         
-        await db.chat_messages.insert_one(chat_message.dict())
+        await self.message_writer.enqueue(chat_message)
 
     async def _generate_suggestions(self, user_message: str, ai_response: str) -> List[str]:
         """Generate follow-up suggestions based on the conversation"""
@@ -309,36 +398,65 @@ class ChatService:
         self, 
         user_id: str, 
         session_id: Optional[str] = None, 
-        limit: int = 50
-    ) -> List[ChatMessage]:
-        """Get chat history for a user"""
+        limit: int = 50,
+        before: Optional[str] = None,
+        after: Optional[str] = None,
+        fields: Optional[List[str]] = None
+    ) -> Dict[str, Any]:
+        """Get one keyset page of chat history, in chronological order"""
+        # Read-your-writes for messages still queued on this worker
+        await self.message_writer.flush()
         db = await get_database()
         
         query = {"user_id": user_id}
         if session_id:
             query["session_id"] = session_id
-        
-        cursor = db.chat_messages.find(query).sort("timestamp", -1).limit(limit)
-        messages = []
-        
-        async for doc in cursor:
-            messages.append(ChatMessage(**doc))
-        
-        return list(reversed(messages))  # Return in chronological order
 
-    async def get_user_sessions(self, user_id: str) -> List[ChatSession]:
-        """Get all chat sessions for a user"""
+        returned = fields or HISTORY_FIELDS
+        return await fetch_page(
+            db.chat_messages,
+            query,
+            sort_field="timestamp",
+            projection=projection_for(fields, HISTORY_FIELDS, "timestamp"),
+            returned_fields=returned,
+            limit=limit,
+            before=before,
+            after=after,
+            newest_first=False
+        )
+
+    async def get_user_sessions(
+        self,
+        user_id: str,
+        limit: int = 50,
+        before: Optional[str] = None,
+        after: Optional[str] = None,
+        fields: Optional[List[str]] = None
+    ) -> Dict[str, Any]:
+        """Get one keyset page of a user's sessions, newest first
+
+        Pages on created_at, which never changes: updated_at moves whenever a
+        session gets a message, so cursors on it would skip or repeat
+        sessions between pages.
+        """
         db = await get_database()
-        cursor = db.chat_sessions.find({"user_id": user_id}).sort("updated_at", -1)
-        
-        sessions = []
-        async for doc in cursor:
-            sessions.append(ChatSession(**doc))
-        
-        return sessions
+        returned = fields or SESSION_FIELDS
+        return await fetch_page(
+            db.chat_sessions,
+            {"user_id": user_id},
+            sort_field="created_at",
+            projection=projection_for(fields, SESSION_FIELDS, "created_at"),
+            returned_fields=returned,
+            limit=limit,
+            before=before,
+            after=after,
+            newest_first=True
+        )
 
     async def delete_session(self, session_id: str, user_id: str):
         """Delete a chat session and its messages"""
+        # Queued messages must land before the delete or they would reappear
+        await self.message_writer.flush()
         db = await get_database()
         
         # Delete session
@@ -353,6 +471,6 @@ class ChatService:
             "user_id": user_id
         })
         
-        # Clear Redis memory
-        redis = await get_redis_client()
-        await redis.delete(f"chat_memory:{session_id}")
+        # Clear Redis memory and the rolling summary
+        await self.memory.clear(session_id)
+        await self.context_builder.clear(session_id)
@@ -0,0 +1,66 @@
+import json
+import time
+from typing import Any, Dict
+
+
+def sse_event(event: Dict[str, Any]) -> str:
+    """Format an event as a text/event-stream frame"""
+    return f"event: {event['type']}\ndata: {json.dumps(event, default=str)}\n\n"
+
+
+class StreamTimer:
+    """Measures time-to-first-token and throughput of one streamed reply"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.first_token_at = None
+        self.chunks = 0
+        self.characters = 0
+
+    def record(self, chunk: str):
+        if self.first_token_at is None:
+            self.first_token_at = time.perf_counter()
+        self.chunks += 1
+        self.characters += len(chunk)
+
+    def summary(self) -> Dict[str, Any]:
+        elapsed = time.perf_counter() - self.started
+        ttft = (self.first_token_at - self.started) if self.first_token_at else None
+        # Rough token count (~4 characters per token for Gemini/English)
+        tokens = max(1, self.characters // 4) if self.characters else 0
+        generation_time = elapsed - (ttft or 0)
+        return {
+            "ttft_ms": round(ttft * 1000, 1) if ttft is not None else None,
+            "total_ms": round(elapsed * 1000, 1),
+            "chunks": self.chunks,
+            "approx_tokens": tokens,
+            "tokens_per_sec": round(tokens / generation_time, 1) if generation_time > 0 else None
+        }
+
+
+class StreamStats:
+    """Process-wide streaming metrics"""
+
+    def __init__(self):
+        self.streams = 0
+        self.errors = 0
+        self.ttft_total_ms = 0.0
+        self.tokens_per_sec_total = 0.0
+        self.max_ttft_ms = 0.0
+
+    def record(self, summary: Dict[str, Any]):
+        self.streams += 1
+        if summary["ttft_ms"] is not None:
+            self.ttft_total_ms += summary["ttft_ms"]
+            self.max_ttft_ms = max(self.max_ttft_ms, summary["ttft_ms"])
+        if summary["tokens_per_sec"] is not None:
+            self.tokens_per_sec_total += summary["tokens_per_sec"]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "streams": self.streams,
+            "errors": self.errors,
+            "avg_ttft_ms": round(self.ttft_total_ms / self.streams, 1) if self.streams else None,
+            "max_ttft_ms": self.max_ttft_ms,
+            "avg_tokens_per_sec": round(self.tokens_per_sec_total / self.streams, 1) if self.streams else None
+        }
@@ -0,0 +1,197 @@
+import os
+from typing import Any, Dict, List
+
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure
+
+# Days chat data is kept (0 disables the TTL indexes). Messages expire this
+# long after they were sent, so long-running sessions lose their oldest
+# messages one by one; a session document expires this long after its last
+# message, by which time all of its messages are gone too.
+CHAT_RETENTION_DAYS = int(os.getenv("CHAT_RETENTION_DAYS", "90"))
+# Bucket granularity hint for the analytics_data time-series collection
+ANALYTICS_TS_GRANULARITY = os.getenv("ANALYTICS_TS_GRANULARITY", "minutes")
+
+# createIndex error codes for "same keys, different options/name"
+INDEX_OPTIONS_CONFLICT = 85
+INDEX_KEY_SPECS_CONFLICT = 86
+
+# Derived collections whose duplicates may be dropped before a unique index
+# is built on them, keeping the document with the newest value of the field
+DEDUPE_BEFORE_UNIQUE = {"ai_insights": "generated_at", "anomalies": "_id"}
+
+
+def _ttl(days: int) -> Dict[str, Any]:
+    return {"expireAfterSeconds": days * 86400} if days > 0 else {}
+
+
+def index_spec() -> Dict[str, List[IndexModel]]:
+    """Indexes the ai-service queries rely on, per collection
+
+    Compound keys follow the equality, sort, range order: equality-matched
+    fields first, then the sort field (which also serves the timestamp
+    range), then the _id tiebreaker used by keyset pagination.
+    """
+    return {
+        "analytics_data": [
+            # get_metric_series / get_metric_details: user + metric, newest first;
+            # value is included so the series read is a covered query
+            IndexModel(
+                [("user_id", ASCENDING), ("metric_type", ASCENDING), ("timestamp", DESCENDING), ("value", ASCENDING)],
+                name="user_metric_timestamp_value"
+            ),
+            # get_metrics / summaries / stats across all (or $in) metric types
+            IndexModel(
+                [("user_id", ASCENDING), ("timestamp", DESCENDING)],
+                name="user_timestamp"
+            )
+        ],
+        "analytics_rollups": [
+            # One bucket per user/metric/resolution; also the $merge key for rebuilds
+            IndexModel(
+                [("user_id", ASCENDING), ("metric_type", ASCENDING), ("resolution", ASCENDING), ("bucket", DESCENDING)],
+                name="user_metric_resolution_bucket",
+                unique=True
+            ),
+            # Rollups across all metric types of a user
+            IndexModel(
+                [("user_id", ASCENDING), ("resolution", ASCENDING), ("bucket", DESCENDING)],
+                name="user_resolution_bucket"
+            )
+        ],
+        "analytics_rollup_state": [
+            IndexModel([("user_id", ASCENDING)], name="user_unique", unique=True)
+        ],
+        "ai_insights": [
+            # One precomputed result per user, insight type and time range
+            IndexModel(
+                [("user_id", ASCENDING), ("insight_type", ASCENDING), ("time_range", ASCENDING)],
+                name="user_type_range",
+                unique=True
+            )
+        ],
+        "anomalies": [
+            IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+            # AnomalyStore.save upserts on this key
+            IndexModel(
+                [("user_id", ASCENDING), ("metric_type", ASCENDING), ("timestamp", ASCENDING)],
+                name="user_metric_timestamp_unique",
+                unique=True
+            ),
+            # A user's anomalies, newest first
+            IndexModel([("user_id", ASCENDING), ("timestamp", DESCENDING)], name="user_timestamp")
+        ],
+        "chat_messages": [
+            # History for one session, and session deletes
+            IndexModel(
+                [("user_id", ASCENDING), ("session_id", ASCENDING), ("timestamp", DESCENDING), ("_id", DESCENDING)],
+                name="user_session_timestamp_id"
+            ),
+            # History across all of a user's sessions
+            IndexModel(
+                [("user_id", ASCENDING), ("timestamp", DESCENDING), ("_id", DESCENDING)],
+                name="user_timestamp_id"
+            ),
+            # Per-message trimming: each message expires by its own send time
+            IndexModel([("timestamp", ASCENDING)], name="timestamp_ttl", **_ttl(CHAT_RETENTION_DAYS))
+        ],
+        "chat_sessions": [
+            IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+            # Session list, newest first (created_at is immutable, so keyset
+            # cursors stay stable while sessions receive messages)
+            IndexModel(
+                [("user_id", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)],
+                name="user_created_id"
+            ),
+            # Sessions idle for the retention period expire with their messages
+            IndexModel([("updated_at", ASCENDING)], name="updated_at_ttl", **_ttl(CHAT_RETENTION_DAYS))
+        ]
+    }
+
+
+async def ensure_time_series(db) -> bool:
+    """Create analytics_data as a time-series collection if it does not exist
+
+    Points are bucketed by timestamp with user_id as the metaField, so one
+    user's points share compressed buckets. An existing regular collection
+    cannot be converted in place and is left as it is.
+    """
+    if "analytics_data" in await db.list_collection_names(filter={"name": "analytics_data"}):
+        return False
+    await db.create_collection(
+        "analytics_data",
+        timeseries={"timeField": "timestamp", "metaField": "user_id", "granularity": ANALYTICS_TS_GRANULARITY}
+    )
+    return True
+
+
+async def dedupe(db, collection: str, keys: List[str], newest_field: str) -> int:
+    """Delete all but the newest document per combination of keys"""
+    pipeline = [
+        {"$sort": {newest_field: -1}},
+        {"$group": {"_id": {key: f"${key}" for key in keys}, "ids": {"$push": "$_id"}, "count": {"$sum": 1}}},
+        {"$match": {"count": {"$gt": 1}}}
+    ]
+    stale = []
+    async for group in db[collection].aggregate(pipeline, allowDiskUse=True):
+        stale.extend(group["ids"][1:])
+    if not stale:
+        return 0
+    result = await db[collection].delete_many({"_id": {"$in": stale}})
+    return result.deleted_count
+
+
+async def ensure_indexes(db) -> Dict[str, List[str]]:
+    """Create any missing indexes from the spec (idempotent)
+
+    analytics_data is created as a time-series collection first, since
+    creating an index would otherwise create it as a regular one. An index
+    that already exists with the same keys but other options (for example
+    the plain timestamp index from mongo-init.js) is converted with collMod
+    when only its TTL differs, and reported otherwise. Any other failure
+    is logged and the remaining indexes and collections are still built.
+    """
+    try:
+        if await ensure_time_series(db):
+            print("✅ Created analytics_data as a time-series collection")
+    except OperationFailure as e:
+        # Servers before 5.0 have no time-series collections
+        print(f"❌ Could not create time-series analytics_data: {e}")
+
+    created = {}
+    for collection, models in index_spec().items():
+        names = []
+        for model in models:
+            try:
+                name = await ensure_index(db, collection, model)
+                if name:
+                    names.append(name)
+            except Exception as e:
+                print(f"❌ Could not create index {collection}.{model.document['name']}: {e}")
+        created[collection] = names
+    return created
+
+
+async def ensure_index(db, collection: str, model: IndexModel) -> str:
+    """Create one index; returns its name, or "" if it conflicts and was skipped"""
+    document = model.document
+    if document.get("unique") and collection in DEDUPE_BEFORE_UNIQUE:
+        removed = await dedupe(db, collection, list(document["key"]), DEDUPE_BEFORE_UNIQUE[collection])
+        if removed:
+            print(f"✅ Removed {removed} duplicate {collection} documents before indexing")
+    try:
+        return (await db[collection].create_indexes([model]))[0]
+    except OperationFailure as e:
+        if e.code not in (INDEX_OPTIONS_CONFLICT, INDEX_KEY_SPECS_CONFLICT):
+            raise
+        if "expireAfterSeconds" not in document:
+            print(f"❌ Index {collection}.{document['name']} conflicts with an existing index: {e}")
+            return ""
+        await db.command({
+            "collMod": collection,
+            "index": {
+                "keyPattern": dict(document["key"]),
+                "expireAfterSeconds": document["expireAfterSeconds"]
+            }
+        })
+        return document["name"]
@@ -0,0 +1,38 @@
+from fastapi import Request
+
+from app.analytics.cache import AnalyticsCache
+from app.analytics.precompute import InsightWorker
+from app.analytics.service import AnalyticsService
+from app.chat.service import ChatService
+from app.services.backend_client import BackendClient
+from app.services.container import ServiceContainer
+
+
+def get_services(request: Request) -> ServiceContainer:
+    """Get the service container created in the app lifespan"""
+    return request.app.state.services
+
+
+def get_chat_service(request: Request) -> ChatService:
+    """Get the shared chat service"""
+    return get_services(request).chat_service
+
+
+def get_analytics_service(request: Request) -> AnalyticsService:
+    """Get the shared analytics service"""
+    return get_services(request).analytics_service
+
+
+def get_backend_client(request: Request) -> BackendClient:
+    """Get the shared backend client"""
+    return get_services(request).backend_client
+
+
+def get_analytics_cache(request: Request) -> AnalyticsCache:
+    """Get the shared analytics result cache"""
+    return get_services(request).analytics_cache
+
+
+def get_insight_worker(request: Request) -> InsightWorker:
+    """Get the insight precompute worker (also used for on-demand refreshes)"""
+    return get_services(request).insight_worker
@@ -1,12 +1,168 @@
 import os
+import asyncio
+import itertools
+import time
 import httpx
-from typing import Dict, Any, List, Optional
+from collections import defaultdict
+from typing import Dict, Any, List, Optional, AsyncIterator, Awaitable, Callable, Iterable
 import json
 
+from app.services.resilience import CircuitBreaker, CircuitOpenError, LatencyHistogram, backoff_delay
+
+try:
+    import h2  # noqa: F401 - httpx's optional HTTP/2 support (httpx[http2])
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+# Per-read timeout and (much shorter) connect timeout, in seconds
+BACKEND_TIMEOUT = float(os.getenv("BACKEND_TIMEOUT", "10"))
+BACKEND_CONNECT_TIMEOUT = float(os.getenv("BACKEND_CONNECT_TIMEOUT", "2"))
+# Connection pool sizing and keep-alive
+BACKEND_MAX_CONNECTIONS = int(os.getenv("BACKEND_MAX_CONNECTIONS", "100"))
+BACKEND_MAX_KEEPALIVE = int(os.getenv("BACKEND_MAX_KEEPALIVE", "20"))
+BACKEND_KEEPALIVE_EXPIRY = float(os.getenv("BACKEND_KEEPALIVE_EXPIRY", "30"))
+# Negotiate HTTP/2 (needs the h2 package; the backend must support it)
+BACKEND_HTTP2 = os.getenv("BACKEND_HTTP2", "false").lower() == "true"
+# Retries for idempotent GETs, with full-jitter exponential backoff
+BACKEND_RETRIES = int(os.getenv("BACKEND_RETRIES", "2"))
+BACKEND_RETRY_BASE = float(os.getenv("BACKEND_RETRY_BASE", "0.1"))
+BACKEND_RETRY_CAP = float(os.getenv("BACKEND_RETRY_CAP", "2"))
+# Per-endpoint circuit breaker
+BACKEND_BREAKER_FAILURES = int(os.getenv("BACKEND_BREAKER_FAILURES", "5"))
+BACKEND_BREAKER_RESET = float(os.getenv("BACKEND_BREAKER_RESET", "30"))
+
+# Concurrent requests per batch call, and metric types per metrics request
+BACKEND_BATCH_CONCURRENCY = int(os.getenv("BACKEND_BATCH_CONCURRENCY", "8"))
+BACKEND_BATCH_METRIC_CHUNK = int(os.getenv("BACKEND_BATCH_METRIC_CHUNK", "5"))
+
+# Statuses worth retrying: the request did not (or may not) reach a healthy backend
+RETRY_STATUSES = {429, 502, 503, 504}
+
+
+def _error_kind(error: Exception) -> str:
+    if isinstance(error, httpx.TimeoutException):
+        return "timeout"
+    if isinstance(error, httpx.ConnectError):
+        return "connect"
+    if isinstance(error, httpx.HTTPStatusError):
+        return f"http_{error.response.status_code // 100}xx"
+    return "transport"
+
+
 class BackendClient:
-    def __init__(self):
-        self.base_url = os.getenv("NESTJS_API_URL", "http://localhost:3001")
-        self.client = httpx.AsyncClient(timeout=30.0)
+    """HTTP client for the Nest.js backend.
+
+    One pooled ``httpx.AsyncClient`` is shared by all calls. GETs are
+    retried with jittered backoff on transport errors and 429/502/503/504,
+    and concurrent identical GETs share one in-flight request. Every
+    endpoint has its own circuit breaker (so a failing route fails fast
+    instead of stalling callers) and latency/error histogram.
+    """
+
+    def __init__(
+        self,
+        base_url: Optional[str] = None,
+        http2: bool = BACKEND_HTTP2,
+        transport: Optional[httpx.AsyncBaseTransport] = None
+    ):
+        self.base_url = base_url or os.getenv("NESTJS_API_URL", "http://localhost:3001")
+        if http2 and not HTTP2_AVAILABLE:
+            print("❌ BACKEND_HTTP2 is set but h2 is not installed; using HTTP/1.1")
+        self.http2 = http2 and HTTP2_AVAILABLE
+        self.client = httpx.AsyncClient(
+            timeout=httpx.Timeout(BACKEND_TIMEOUT, connect=BACKEND_CONNECT_TIMEOUT),
+            limits=httpx.Limits(
+                max_connections=BACKEND_MAX_CONNECTIONS,
+                max_keepalive_connections=BACKEND_MAX_KEEPALIVE,
+                keepalive_expiry=BACKEND_KEEPALIVE_EXPIRY
+            ),
+            http2=self.http2,
+            transport=transport
+        )
+        self.breakers: Dict[str, CircuitBreaker] = defaultdict(
+            lambda: CircuitBreaker(BACKEND_BREAKER_FAILURES, BACKEND_BREAKER_RESET)
+        )
+        self.histograms: Dict[str, LatencyHistogram] = defaultdict(LatencyHistogram)
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self.coalesced = 0
+        self.retries = 0
+
+    async def _get(self, endpoint: str, path: str, params: Optional[Dict[str, Any]] = None) -> Any:
+        """GET JSON, sharing one in-flight request among identical concurrent calls"""
+        key = f"{path}?{json.dumps(params or {}, sort_keys=True, default=str)}"
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            task = asyncio.create_task(
+                self._request("GET", endpoint, path, retries=BACKEND_RETRIES, params=params)
+            )
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+
+        # Shield so one cancelled caller doesn't cancel the others' request
+        return await asyncio.shield(task)
+
+    async def _post(self, endpoint: str, path: str, payload: Dict[str, Any]) -> Any:
+        """POST JSON once (not idempotent, so never retried)"""
+        return await self._request("POST", endpoint, path, json=payload)
+
+    async def _request(self, method: str, endpoint: str, path: str, retries: int = 0, **kwargs) -> Any:
+        breaker = self.breakers[endpoint]
+        histogram = self.histograms[endpoint]
+        attempt = 0
+
+        while True:
+            if not breaker.allow():
+                histogram.record_error("circuit_open")
+                raise CircuitOpenError(f"Backend endpoint {endpoint} is unavailable (circuit open)")
+            probing = breaker.state == "half_open"
+
+            start = time.perf_counter()
+            try:
+                response = await self.client.request(method, f"{self.base_url}{path}", **kwargs)
+                response.raise_for_status()
+            except (httpx.TransportError, httpx.HTTPStatusError) as e:
+                histogram.observe((time.perf_counter() - start) * 1000)
+                histogram.record_error(_error_kind(e))
+
+                status = e.response.status_code if isinstance(e, httpx.HTTPStatusError) else None
+                retryable = status is None or status in RETRY_STATUSES
+                # Client errors say nothing about backend health
+                if status is None or status >= 500 or status == 429:
+                    breaker.record_failure()
+                else:
+                    breaker.record_success()
+
+                if retryable and attempt < retries:
+                    attempt += 1
+                    self.retries += 1
+                    await asyncio.sleep(backoff_delay(attempt, BACKEND_RETRY_BASE, BACKEND_RETRY_CAP))
+                    continue
+                raise
+            except BaseException:
+                # Cancelled, or failed in a way that says nothing about the
+                # backend: no verdict, but a half-open probe must be freed
+                if probing:
+                    breaker.release()
+                raise
+
+            histogram.observe((time.perf_counter() - start) * 1000)
+            breaker.record_success()
+            return response.json()
+
+    def stats(self) -> Dict[str, Any]:
+        """Per-endpoint latency, errors and breaker state for this worker"""
+        return {
+            "http2": self.http2,
+            "coalesced": self.coalesced,
+            "retries": self.retries,
+            "endpoints": {
+                endpoint: {**histogram.stats(), "breaker": self.breakers[endpoint].stats()}
+                for endpoint, histogram in self.histograms.items()
+            }
+        }
 
     async def get_analytics_data(
         self, 
@@ -15,12 +171,11 @@ class BackendClient:
     ) -> Dict[str, Any]:
         """Get analytics data from Nest.js backend"""
         try:
-            response = await self.client.get(
-                f"{self.base_url}/api/analytics/data",
+            return await self._get(
+                "analytics_data",
+                "/api/analytics/data",
                 params={"user_id": user_id, **query_params}
             )
-            response.raise_for_status()
-            return response.json()
         except Exception as e:
             return {"error": str(e), "data": []}
 
@@ -36,23 +191,14 @@ class BackendClient:
             if metric_types:
                 params["metric_types"] = ",".join(metric_types)
             
-            response = await self.client.get(
-                f"{self.base_url}/api/analytics/metrics",
-                params=params
-            )
-            response.raise_for_status()
-            return response.json()
+            return await self._get("metrics", "/api/analytics/metrics", params=params)
         except Exception as e:
             return []
 
     async def get_dashboard_data(self, user_id: str) -> Dict[str, Any]:
         """Get dashboard data from backend"""
         try:
-            response = await self.client.get(
-                f"{self.base_url}/api/dashboard/{user_id}"
-            )
-            response.raise_for_status()
-            return response.json()
+            return await self._get("dashboard", f"/api/dashboard/{user_id}")
         except Exception as e:
             return {"error": str(e)}
 
@@ -65,17 +211,16 @@ class BackendClient:
     ) -> Dict[str, Any]:
         """Save chat message to backend"""
         try:
-            response = await self.client.post(
-                f"{self.base_url}/api/chat/messages",
-                json={
+            return await self._post(
+                "chat_messages",
+                "/api/chat/messages",
+                {
                     "message": message,
                     "user_id": user_id,
                     "session_id": session_id,
                     "message_type": message_type
                 }
             )
-            response.raise_for_status()
-            return response.json()
         except Exception as e:
             return {"error": str(e)}
 
@@ -91,12 +236,7 @@ class BackendClient:
             if session_id:
                 params["session_id"] = session_id
             
-            response = await self.client.get(
-                f"{self.base_url}/api/chat/history",
-                params=params
-            )
-            response.raise_for_status()
-            return response.json()
+            return await self._get("chat_history", "/api/chat/history", params=params)
         except Exception as e:
             return []
 
@@ -107,15 +247,14 @@ class BackendClient:
     ) -> Dict[str, Any]:
         """Create a chart via backend"""
         try:
-            response = await self.client.post(
-                f"{self.base_url}/api/charts/create",
-                json={
+            return await self._post(
+                "charts",
+                "/api/charts/create",
+                {
                     "user_id": user_id,
                     "config": chart_config
                 }
             )
-            response.raise_for_status()
-            return response.json()
         except Exception as e:
             return {"error": str(e)}
 
@@ -126,18 +265,123 @@ class BackendClient:
     ) -> Dict[str, Any]:
         """Set up an alert via backend"""
         try:
-            response = await self.client.post(
-                f"{self.base_url}/api/alerts/create",
-                json={
+            return await self._post(
+                "alerts",
+                "/api/alerts/create",
+                {
                     "user_id": user_id,
                     "config": alert_config
                 }
             )
-            response.raise_for_status()
-            return response.json()
         except Exception as e:
             return {"error": str(e)}
 
+    async def iter_user_metrics(
+        self,
+        user_ids: Iterable[str],
+        metric_types: Optional[List[str]] = None,
+        time_range: str = "7d",
+        concurrency: int = BACKEND_BATCH_CONCURRENCY,
+        metric_chunk: int = BACKEND_BATCH_METRIC_CHUNK
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Metrics for many users, yielded per (user, metric chunk) as requests complete
+
+        metric_types are split into chunks of metric_chunk per request so no
+        single response grows unbounded.
+        """
+        chunks = [
+            metric_types[i:i + metric_chunk] for i in range(0, len(metric_types), metric_chunk)
+        ] if metric_types else [None]
+        items = (
+            {"user_id": user_id, "metric_types": chunk}
+            for user_id in user_ids
+            for chunk in chunks
+        )
+
+        async def fetch(item):
+            params = {"user_id": item["user_id"], "time_range": time_range}
+            if item["metric_types"]:
+                params["metric_types"] = ",".join(item["metric_types"])
+            return await self._get("metrics", "/api/analytics/metrics", params=params)
+
+        async for result in self._iter_batch(items, fetch, concurrency):
+            yield result
+
+    async def iter_dashboard_data(
+        self,
+        user_ids: Iterable[str],
+        concurrency: int = BACKEND_BATCH_CONCURRENCY
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Dashboard data for many users, yielded as requests complete"""
+        items = ({"user_id": user_id} for user_id in user_ids)
+
+        async def fetch(item):
+            return await self._get("dashboard", f"/api/dashboard/{item['user_id']}")
+
+        async for result in self._iter_batch(items, fetch, concurrency):
+            yield result
+
+    async def iter_chat_history(
+        self,
+        user_ids: Iterable[str],
+        session_id: Optional[str] = None,
+        limit: int = 50,
+        concurrency: int = BACKEND_BATCH_CONCURRENCY
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Chat history for many users, yielded as requests complete"""
+        items = ({"user_id": user_id} for user_id in user_ids)
+
+        async def fetch(item):
+            params = {"user_id": item["user_id"], "limit": limit}
+            if session_id:
+                params["session_id"] = session_id
+            return await self._get("chat_history", "/api/chat/history", params=params)
+
+        async for result in self._iter_batch(items, fetch, concurrency):
+            yield result
+
+    async def _iter_batch(
+        self,
+        items: Iterable[Dict[str, Any]],
+        fetch: Callable[[Dict[str, Any]], Awaitable[Any]],
+        concurrency: int
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Run fetch over items with at most `concurrency` in flight
+
+        Items are pulled lazily, so huge (or generated) id lists never turn
+        into that many tasks at once. Each result is the item plus "ok",
+        "data" and "error"; one failure never aborts the batch. Breaking
+        out of the iteration cancels the requests still in flight.
+        """
+        async def run(item):
+            try:
+                return {**item, "ok": True, "data": await fetch(item), "error": None}
+            except Exception as e:
+                return {**item, "ok": False, "data": None, "error": str(e) or e.__class__.__name__}
+
+        items = iter(items)
+        pending = set()
+        try:
+            while True:
+                for item in itertools.islice(items, max(concurrency, 1) - len(pending)):
+                    pending.add(asyncio.create_task(run(item)))
+                if not pending:
+                    return
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    yield task.result()
+        finally:
+            for task in pending:
+                task.cancel()
+
+    @staticmethod
+    async def collect_batch(results: AsyncIterator[Dict[str, Any]]) -> Dict[str, List[Dict[str, Any]]]:
+        """Drain a batch iterator into {"succeeded": [...], "failed": [...]}"""
+        collected = {"succeeded": [], "failed": []}
+        async for result in results:
+            collected["succeeded" if result["ok"] else "failed"].append(result)
+        return collected
+
     async def close(self):
         """Close the HTTP client"""
         await self.client.aclose()
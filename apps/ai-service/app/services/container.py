@@ -0,0 +1,83 @@
+import os
+from typing import Optional
+
+from langchain_google_genai import ChatGoogleGenerativeAI
+
+from app.analytics.cache import AnalyticsCache
+from app.analytics.metric_stream import METRIC_STREAM_PUBLISH, create_broker
+from app.analytics.precompute import InsightStore, InsightWorker
+from app.analytics.rollups import RollupMaintainer
+from app.analytics.running_stats import RunningStatsStore
+from app.analytics.service import AnalyticsService
+from app.chat.persistence import ChatMessageWriter
+from app.chat.service import ChatService
+from app.services.backend_client import BackendClient
+from app.services.llm_cache import LLMResponseCache
+from app.websocket.broadcaster import RedisBroadcaster
+
+
+def create_llm() -> ChatGoogleGenerativeAI:
+    """Create the process-wide Gemini client"""
+    return ChatGoogleGenerativeAI(
+        model="gemini-pro",
+        google_api_key=os.getenv("GOOGLE_API_KEY"),
+        temperature=0.7,
+        max_output_tokens=2048,
+        # Gemini has no system role; fold the system prompt into the first turn
+        convert_system_message_to_human=True
+    )
+
+
+class ServiceContainer:
+    """Long-lived clients and services shared by every request.
+
+    The LLM is constructed once (constructing it calls ``genai.configure``,
+    which rebuilds the global transport) and the per-service variants are
+    shallow copies that share the underlying ``GenerativeModel``.
+    """
+
+    def __init__(
+        self,
+        llm: Optional[ChatGoogleGenerativeAI] = None,
+        backend_client: Optional[BackendClient] = None,
+        broadcaster: Optional[RedisBroadcaster] = None
+    ):
+        self.llm = llm or create_llm()
+        self.backend_client = backend_client or BackendClient()
+        self.analytics_cache = AnalyticsCache()
+        self.llm_cache = LLMResponseCache()
+        self.message_writer = ChatMessageWriter()
+        self.insight_store = InsightStore()
+        self.running_stats = RunningStatsStore()
+        self.metric_stream = create_broker() if METRIC_STREAM_PUBLISH else None
+        # Publish-only unless the API hands in one bound to its connection manager
+        self.broadcaster = broadcaster or RedisBroadcaster()
+
+        self.analytics_service = AnalyticsService(
+            llm=self.llm.copy(update={"temperature": 0.3, "max_output_tokens": 1024}),
+            cache=self.analytics_cache,
+            llm_cache=self.llm_cache,
+            insight_store=self.insight_store,
+            running_stats=self.running_stats,
+            metric_stream=self.metric_stream,
+            broadcaster=self.broadcaster
+        )
+        self.insight_worker = InsightWorker(self.analytics_service, self.insight_store, broadcaster=self.broadcaster)
+        self.rollup_maintainer = RollupMaintainer()
+        self.chat_service = ChatService(
+            llm=self.llm,
+            backend_client=self.backend_client,
+            analytics_service=self.analytics_service,
+            message_writer=self.message_writer
+        )
+
+    async def close(self):
+        """Stop background work, flush queued writes and release pooled connections"""
+        await self.insight_worker.stop()
+        await self.rollup_maintainer.stop()
+        await self.chat_service.close()
+        await self.message_writer.close()
+        await self.broadcaster.stop()
+        await self.backend_client.close()
+        if self.metric_stream is not None:
+            await self.metric_stream.stop()
@@ -0,0 +1,135 @@
+import asyncio
+import hashlib
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from app.database.redis_client import get_redis_client
+
+# Seconds a response stays valid, per prompt kind. Prompts are built purely
+# from numbers, so identical prompts may safely share an answer for a while.
+LLM_CACHE_TTLS = {
+    "metric_summary": 900,
+    "insights": 900,
+    "trend_insights": 3600,
+    "trend_commentary": 3600,
+    "trend_recommendations": 86400,
+}
+DEFAULT_TTL = 600
+
+
+class LLMResponseCache:
+    """Content-addressed cache for deterministic LLM prompts.
+
+    Lookups go through an in-process LRU first, then Redis; concurrent calls
+    with the same prompt share a single in-flight LLM request. Only
+    successful responses are stored.
+    """
+
+    def __init__(
+        self,
+        ttls: Optional[Dict[str, int]] = None,
+        max_entries: int = 1024,
+        prefix: str = "llm_cache"
+    ):
+        self.ttls = {**LLM_CACHE_TTLS, **(ttls or {})}
+        self.max_entries = max_entries
+        self.prefix = prefix
+        self._memory: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self.memory_hits = 0
+        self.redis_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.errors = 0
+
+    def make_key(self, llm: Any, prompt: str) -> str:
+        """Hash the prompt together with the generation parameters"""
+        params = (
+            getattr(llm, "model", ""),
+            getattr(llm, "temperature", ""),
+            getattr(llm, "max_output_tokens", "")
+        )
+        digest = hashlib.sha256(f"{params}\n{prompt.strip()}".encode()).hexdigest()
+        return f"{self.prefix}:{digest}"
+
+    async def ainvoke(self, llm: Any, prompt: str, kind: str) -> str:
+        """Return the response text for a prompt, calling the LLM on a miss"""
+        key = self.make_key(llm, prompt)
+
+        cached = self._memory_get(key)
+        if cached is not None:
+            self.memory_hits += 1
+            return cached
+
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            task = asyncio.create_task(self._load(llm, prompt, kind, key))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+
+        # Shield so a cancelled caller (e.g. a timed-out dashboard metric)
+        # doesn't cancel the request other callers are waiting on
+        return await asyncio.shield(task)
+
+    async def _load(self, llm: Any, prompt: str, kind: str, key: str) -> str:
+        ttl = self.ttls.get(kind, DEFAULT_TTL)
+
+        try:
+            redis = await get_redis_client()
+            cached = await redis.get(key)
+        except Exception:
+            redis = None
+            cached = None
+            self.errors += 1
+
+        if cached is not None:
+            self.redis_hits += 1
+            self._memory_set(key, cached, ttl)
+            return cached
+
+        self.misses += 1
+        response = await llm.ainvoke(prompt)
+        content = response.content
+
+        self._memory_set(key, content, ttl)
+        if redis is not None:
+            try:
+                await redis.set(key, content, ex=ttl)
+            except Exception:
+                self.errors += 1
+
+        return content
+
+    def _memory_get(self, key: str) -> Optional[str]:
+        entry = self._memory.get(key)
+        if entry is None:
+            return None
+        expires_at, content = entry
+        if expires_at < time.monotonic():
+            del self._memory[key]
+            return None
+        self._memory.move_to_end(key)
+        return content
+
+    def _memory_set(self, key: str, content: str, ttl: int):
+        self._memory[key] = (time.monotonic() + ttl, content)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters for this process"""
+        hits = self.memory_hits + self.redis_hits + self.coalesced
+        total = hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "redis_hits": self.redis_hits,
+            "coalesced": self.coalesced,
+            "misses": self.misses,
+            "errors": self.errors,
+            "hit_rate": round(hits / total, 4) if total else 0.0,
+            "memory_entries": len(self._memory)
+        }
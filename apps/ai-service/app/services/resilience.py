@@ -0,0 +1,116 @@
+import bisect
+import random
+import time
+from typing import Any, Dict, List, Sequence
+
+# Histogram bucket upper bounds in milliseconds (the last bucket is open)
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an endpoint whose breaker is open"""
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker for one endpoint.
+
+    closed: calls pass; ``failure_threshold`` consecutive failures open it.
+    open: calls fail fast until ``reset_timeout`` seconds have passed.
+    half-open: one probe call is let through; success closes the breaker,
+    failure opens it again. A probe that ends without a verdict (cancelled,
+    or an error that says nothing about the endpoint) must be given back
+    with ``release``; one that never reports back is reclaimed after
+    ``reset_timeout`` so the breaker cannot stay stuck half-open.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.rejected = 0
+        self._probing = False
+        self._probe_started = 0.0
+
+    def allow(self) -> bool:
+        """Whether a call may go out now (claims the probe when half-open)"""
+        if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_timeout:
+            self.state = "half_open"
+            self._probing = False
+        if self.state == "closed":
+            return True
+        if self.state == "half_open" and (
+            not self._probing or time.monotonic() - self._probe_started >= self.reset_timeout
+        ):
+            self._probing = True
+            self._probe_started = time.monotonic()
+            return True
+        self.rejected += 1
+        return False
+
+    def release(self):
+        """Give back a claimed probe without recording an outcome"""
+        self._probing = False
+
+    def record_success(self):
+        self.state = "closed"
+        self.failures = 0
+        self._probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        self._probing = False
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"state": self.state, "consecutive_failures": self.failures, "rejected": self.rejected}
+
+
+class LatencyHistogram:
+    """Fixed-bucket latency histogram with error counts by kind"""
+
+    def __init__(self, buckets_ms: Sequence[float] = LATENCY_BUCKETS_MS):
+        self.buckets_ms = list(buckets_ms)
+        self.counts: List[int] = [0] * (len(self.buckets_ms) + 1)
+        self.total_ms = 0.0
+        self.errors: Dict[str, int] = {}
+
+    def observe(self, elapsed_ms: float):
+        self.counts[bisect.bisect_left(self.buckets_ms, elapsed_ms)] += 1
+        self.total_ms += elapsed_ms
+
+    def record_error(self, kind: str):
+        self.errors[kind] = self.errors.get(kind, 0) + 1
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-quantile"""
+        total = sum(self.counts)
+        if not total:
+            return 0.0
+        rank = q * total
+        seen = 0
+        for bound, count in zip(self.buckets_ms + [float("inf")], self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+    def stats(self) -> Dict[str, Any]:
+        total = sum(self.counts)
+        labels = [f"le_{bound}" for bound in self.buckets_ms] + ["le_inf"]
+        return {
+            "requests": total,
+            "avg_ms": round(self.total_ms / total, 2) if total else 0.0,
+            "p50_ms": self.quantile(0.5),
+            "p99_ms": self.quantile(0.99),
+            "errors": dict(self.errors),
+            "buckets": {label: count for label, count in zip(labels, self.counts) if count}
+        }
+
+
+def backoff_delay(attempt: int, base: float, cap: float) -> float:
+    """Full-jitter exponential backoff for the given retry attempt (1-based)"""
+    return random.uniform(0, min(cap, base * 2 ** (attempt - 1)))
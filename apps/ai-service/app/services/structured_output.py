@@ -0,0 +1,90 @@
+import json
+import os
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+# Merge several list-valued LLM requests into one structured prompt
+LLM_BATCH_MODE = os.getenv("LLM_BATCH_MODE", "true").lower() in ("1", "true", "yes")
+
+SUGGESTIONS_MARKER = "SUGGESTIONS:"
+
+SUGGESTIONS_INSTRUCTION = f"""
+After your answer, add one final line starting with {SUGGESTIONS_MARKER} followed by a JSON array of 3 short follow-up questions or actions the user could take next.
+"""
+
+_FENCE = re.compile(r"^```(?:json)?\s*|\s*```$", re.MULTILINE)
+
+
+def build_batched_prompt(context: str, fields: Dict[str, str]) -> str:
+    """Build one prompt asking for several string lists as a JSON object
+
+    fields maps each output key to the instruction for that list.
+    """
+    schema = {
+        "type": "object",
+        "properties": {
+            key: {"type": "array", "items": {"type": "string"}, "description": description}
+            for key, description in fields.items()
+        },
+        "required": list(fields)
+    }
+    return f"""
+    {context.strip()}
+
+    Respond with a single JSON object (no prose, no code fences) matching this JSON schema:
+    {json.dumps(schema)}
+    """
+
+
+def extract_json(content: str) -> Any:
+    """Parse JSON from an LLM response, tolerating code fences and surrounding prose"""
+    text = _FENCE.sub("", content.strip())
+    try:
+        return json.loads(text)
+    except ValueError:
+        pass
+
+    for opening, closing in (("{", "}"), ("[", "]")):
+        start, end = text.find(opening), text.rfind(closing)
+        if start != -1 and end > start:
+            try:
+                return json.loads(text[start:end + 1])
+            except ValueError:
+                continue
+    raise ValueError("No JSON found in LLM response")
+
+
+def parse_batched_response(content: str, fields: Dict[str, str]) -> Optional[Dict[str, List[str]]]:
+    """Parse a batched response; None if any requested list is missing or malformed"""
+    try:
+        data = extract_json(content)
+    except ValueError:
+        return None
+
+    if not isinstance(data, dict):
+        return None
+
+    result = {}
+    for key in fields:
+        value = data.get(key)
+        if not isinstance(value, list) or not value:
+            return None
+        result[key] = [str(item) for item in value]
+    return result
+
+
+def split_suggestions(content: str) -> Tuple[str, Optional[List[str]]]:
+    """Split a chat reply into its answer and trailing suggestions list"""
+    index = content.rfind(SUGGESTIONS_MARKER)
+    if index == -1:
+        return content, None
+
+    answer = content[:index].rstrip()
+    try:
+        suggestions = extract_json(content[index + len(SUGGESTIONS_MARKER):])
+    except ValueError:
+        return answer, None
+
+    if not isinstance(suggestions, list):
+        return answer, None
+    return answer, [str(item) for item in suggestions]
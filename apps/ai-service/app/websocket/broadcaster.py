@@ -0,0 +1,139 @@
+import asyncio
+import json
+import os
+from collections import defaultdict
+from typing import Any, Dict, List, Optional
+
+from app.database.redis_client import get_redis_client
+from app.websocket.connection_manager import ConnectionManager
+
+# Seconds between publishes; messages queued within one tick share a PUBLISH
+BROADCAST_TICK = float(os.getenv("BROADCAST_TICK", "0.01"))
+
+CHANNEL_PREFIX = "ws"
+USER_CHANNEL = CHANNEL_PREFIX + ":user:{}"
+SESSION_CHANNEL = CHANNEL_PREFIX + ":session:{}"
+ALL_CHANNEL = CHANNEL_PREFIX + ":all"
+
+
+class RedisBroadcaster:
+    """Fan out WebSocket messages to every worker through Redis pub/sub.
+
+    Publishing only queues the message; a flusher sends everything queued
+    for a channel during one tick as a single JSON array. Each worker
+    pattern-subscribes to ws:* and hands messages to its own
+    ConnectionManager, which delivers them to the matching local sockets.
+    Without a manager (e.g. in worker.py) the broadcaster only publishes.
+    """
+
+    def __init__(self, manager: Optional[ConnectionManager] = None, tick: float = BROADCAST_TICK):
+        self.manager = manager
+        self.tick = tick
+        self._outbox: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        self._wakeup = asyncio.Event()
+        self._tasks: List[asyncio.Task] = []
+        self._pubsub = None
+        self.published = 0
+        self.publishes = 0
+        self.received = 0
+        self.delivered = 0
+        self.errors = 0
+
+    async def start(self):
+        """Start the flusher and, with a manager, subscribe and start the listener"""
+        self._tasks = [asyncio.create_task(self._flush_loop())]
+        if self.manager is None:
+            return
+        redis = await get_redis_client()
+        self._pubsub = redis.pubsub(ignore_subscribe_messages=True)
+        await self._pubsub.psubscribe(f"{CHANNEL_PREFIX}:*")
+        self._tasks.append(asyncio.create_task(self._listen_loop()))
+
+    async def stop(self):
+        """Flush pending messages and unsubscribe"""
+        await self.flush()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._pubsub is not None:
+            await self._pubsub.close()
+
+    def publish_to_user(self, user_id: str, message: Dict[str, Any]):
+        """Queue a message for all sockets of a user on any worker"""
+        self._enqueue(USER_CHANNEL.format(user_id), message)
+
+    def publish_to_session(self, session_id: str, message: Dict[str, Any]):
+        """Queue a message for all sockets of a chat session on any worker"""
+        self._enqueue(SESSION_CHANNEL.format(session_id), message)
+
+    def broadcast(self, message: Dict[str, Any]):
+        """Queue a message for every socket on every worker"""
+        self._enqueue(ALL_CHANNEL, message)
+
+    def _enqueue(self, channel: str, message: Dict[str, Any]):
+        self._outbox[channel].append(message)
+        self._wakeup.set()
+
+    async def flush(self):
+        """Publish everything queued, one PUBLISH per channel"""
+        if not self._outbox:
+            return
+        outbox, self._outbox = self._outbox, defaultdict(list)
+
+        try:
+            redis = await get_redis_client()
+            pipe = redis.pipeline(transaction=False)
+            for channel, messages in outbox.items():
+                pipe.publish(channel, json.dumps(messages, default=str))
+            await pipe.execute()
+            self.publishes += len(outbox)
+            self.published += sum(len(messages) for messages in outbox.values())
+        except Exception as e:
+            self.errors += 1
+            print(f"❌ Broadcast publish failed: {e}")
+
+    async def _flush_loop(self):
+        while True:
+            await self._wakeup.wait()
+            # Let the rest of this tick's messages accumulate
+            await asyncio.sleep(self.tick)
+            self._wakeup.clear()
+            await self.flush()
+
+    async def _listen_loop(self):
+        while True:
+            try:
+                message = await self._pubsub.get_message(timeout=1.0)
+                if message is None or message["type"] != "pmessage":
+                    continue
+                await self._dispatch(message["channel"], json.loads(message["data"]))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.errors += 1
+                print(f"❌ Broadcast listener error: {e}")
+                await asyncio.sleep(1)
+
+    async def _dispatch(self, channel: str, messages: List[Dict[str, Any]]):
+        _, kind, *rest = channel.split(":", 2)
+        target = rest[0] if rest else None
+        self.received += len(messages)
+
+        for message in messages:
+            if kind == "user":
+                self.delivered += await self.manager.send_to_user(message, target)
+            elif kind == "session":
+                self.delivered += await self.manager.send_to_session(message, target)
+            elif kind == "all":
+                self.delivered += await self.manager.broadcast(message)
+
+    def stats(self) -> Dict[str, Any]:
+        """Pub/sub counters for this worker"""
+        return {
+            "published_messages": self.published,
+            "publish_commands": self.publishes,
+            "received_messages": self.received,
+            "delivered_to_sockets": self.delivered,
+            "errors": self.errors
+        }
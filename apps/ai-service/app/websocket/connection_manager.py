@@ -0,0 +1,241 @@
+import asyncio
+import json
+import os
+from typing import Any, AsyncIterator, Callable, Dict, Optional, Set
+
+from fastapi import WebSocket
+
+# Outbound messages buffered per socket before the client counts as slow
+WS_QUEUE_SIZE = int(os.getenv("WS_QUEUE_SIZE", "256"))
+# Messages from one socket processed concurrently; further reads wait
+WS_MAX_INFLIGHT = int(os.getenv("WS_MAX_INFLIGHT", "4"))
+# Seconds a send may wait on a full queue / a stalled socket
+WS_SEND_TIMEOUT = float(os.getenv("WS_SEND_TIMEOUT", "5"))
+
+# Close code for clients that cannot keep up (1013: try again later)
+SLOW_CONSUMER_CLOSE_CODE = 1013
+# Event after which a handler only does bookkeeping (persistence, memory)
+DONE_EVENT = "done"
+
+MessageHandler = Callable[[Dict[str, Any]], AsyncIterator[Dict[str, Any]]]
+
+
+class Connection:
+    """One WebSocket with its outbound queue, writer task and in-flight handlers.
+
+    Everything sent to the client goes through a bounded queue drained by a
+    dedicated writer, so producers never block on a slow socket for longer
+    than the send timeout. Events of one request are delivered in order and
+    tagged with its request_id and a per-request sequence number; events of
+    concurrent requests may interleave.
+
+    Closing cancels handlers that are still streaming. A handler that has
+    emitted its "done" event is left to finish its bookkeeping, with any
+    further events dropped.
+
+    The user is bound when the socket connects; a user_id in a message
+    payload is overwritten with it, so a socket can neither act as nor
+    receive the broadcasts of another user.
+    """
+
+    def __init__(
+        self,
+        websocket: WebSocket,
+        manager: "ConnectionManager",
+        user_id: str,
+        queue_size: int = WS_QUEUE_SIZE,
+        max_inflight: int = WS_MAX_INFLIGHT,
+        send_timeout: float = WS_SEND_TIMEOUT
+    ):
+        self.websocket = websocket
+        self.manager = manager
+        self.send_timeout = send_timeout
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.closed = False
+        self.user_id = user_id
+        self.session_ids: Set[str] = set()
+
+        self._slots = asyncio.Semaphore(max_inflight)
+        self._handlers: Set[asyncio.Task] = set()
+        self._finishing: Set[asyncio.Task] = set()
+        self._next_request_id = 0
+        self._writer = asyncio.create_task(self._write_loop())
+
+    @property
+    def inflight(self) -> int:
+        """Messages from this socket currently being processed"""
+        return len(self._handlers)
+
+    async def send(self, message: Dict[str, Any]) -> bool:
+        """Queue a message; False if the connection is (or just got) closed"""
+        if self.closed:
+            return False
+        try:
+            await asyncio.wait_for(self.queue.put(message), self.send_timeout)
+            return True
+        except asyncio.TimeoutError:
+            self.manager.slow_consumers += 1
+            self.close(SLOW_CONSUMER_CLOSE_CODE, "Slow consumer")
+            return False
+
+    async def submit(self, message_data: Dict[str, Any], handler: MessageHandler):
+        """Run handler for a received message without blocking the receive loop
+
+        Waits only when max_inflight messages are already being processed,
+        which applies backpressure to a client that floods the socket.
+        """
+        await self._slots.acquire()
+        if self.closed:
+            self._slots.release()
+            return
+
+        if message_data.get("request_id") is None:
+            self._next_request_id += 1
+            message_data["request_id"] = self._next_request_id
+        message_data["user_id"] = self.user_id
+        if message_data.get("session_id"):
+            self.session_ids.add(message_data["session_id"])
+
+        task = asyncio.create_task(self._run(message_data, handler))
+        self._handlers.add(task)
+        task.add_done_callback(self._handlers.discard)
+        task.add_done_callback(self._finishing.discard)
+
+    async def _run(self, message_data: Dict[str, Any], handler: MessageHandler):
+        request_id = message_data["request_id"]
+        seq = 0
+        finishing = False
+        try:
+            async for event in handler(message_data):
+                if event.get("type") == DONE_EVENT:
+                    # Past this point closing the socket must not cancel us
+                    finishing = True
+                    self._finishing.add(asyncio.current_task())
+                event["request_id"] = request_id
+                event["seq"] = seq
+                seq += 1
+                if not await self.send(event) and not finishing:
+                    break
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"WebSocket handler error: {e}")
+            await self.send({
+                "type": "error",
+                "request_id": request_id,
+                "seq": seq,
+                "message": "An error occurred while processing your message"
+            })
+        finally:
+            self._slots.release()
+
+    async def _write_loop(self):
+        while True:
+            message = await self.queue.get()
+            try:
+                await asyncio.wait_for(
+                    self.websocket.send_text(json.dumps(message, default=str)),
+                    self.send_timeout
+                )
+            except asyncio.TimeoutError:
+                self.manager.slow_consumers += 1
+                self.close(SLOW_CONSUMER_CLOSE_CODE, "Slow consumer")
+                return
+            except Exception:
+                self.close()
+                return
+
+    def close(self, code: int = 1000, reason: Optional[str] = None):
+        """Stop streaming handlers and the writer, and close the socket if still open"""
+        if self.closed:
+            return
+        self.closed = True
+        self.manager.active_connections.pop(self.websocket, None)
+
+        current = asyncio.current_task()
+        for task in [*self._handlers, self._writer]:
+            if task is not current and task not in self._finishing:
+                task.cancel()
+
+        if code != 1000:
+            asyncio.create_task(self._close_socket(code, reason))
+
+    async def _close_socket(self, code: int, reason: Optional[str]):
+        try:
+            await self.websocket.close(code=code, reason=reason)
+        except Exception:
+            pass
+
+
+class ConnectionManager:
+    """Tracks the WebSocket connections of this worker"""
+
+    def __init__(
+        self,
+        queue_size: int = WS_QUEUE_SIZE,
+        max_inflight: int = WS_MAX_INFLIGHT,
+        send_timeout: float = WS_SEND_TIMEOUT
+    ):
+        self.queue_size = queue_size
+        self.max_inflight = max_inflight
+        self.send_timeout = send_timeout
+        self.active_connections: Dict[WebSocket, Connection] = {}
+        self.total_connections = 0
+        self.slow_consumers = 0
+
+    async def connect(self, websocket: WebSocket, user_id: str) -> Connection:
+        """Accept a socket for a user and start its writer"""
+        await websocket.accept()
+        connection = Connection(
+            websocket,
+            self,
+            user_id,
+            queue_size=self.queue_size,
+            max_inflight=self.max_inflight,
+            send_timeout=self.send_timeout
+        )
+        self.active_connections[websocket] = connection
+        self.total_connections += 1
+        return connection
+
+    def disconnect(self, websocket: WebSocket):
+        """Forget a socket and cancel its pending work"""
+        connection = self.active_connections.get(websocket)
+        if connection:
+            connection.close()
+
+    async def send_personal_message(self, message: Dict[str, Any], websocket: WebSocket) -> bool:
+        """Queue a message for one socket"""
+        connection = self.active_connections.get(websocket)
+        if connection is None:
+            return False
+        return await connection.send(message)
+
+    async def send_to_user(self, message: Dict[str, Any], user_id: str) -> int:
+        """Queue a message for every socket of a user; returns sockets reached"""
+        connections = [c for c in list(self.active_connections.values()) if c.user_id == user_id]
+        results = await asyncio.gather(*(c.send(message) for c in connections))
+        return sum(results)
+
+    async def send_to_session(self, message: Dict[str, Any], session_id: str) -> int:
+        """Queue a message for every socket that used a chat session"""
+        connections = [c for c in list(self.active_connections.values()) if session_id in c.session_ids]
+        results = await asyncio.gather(*(c.send(message) for c in connections))
+        return sum(results)
+
+    async def broadcast(self, message: Dict[str, Any]) -> int:
+        """Queue a message for every socket; slow ones don't delay the rest"""
+        connections = list(self.active_connections.values())
+        results = await asyncio.gather(*(c.send(message) for c in connections))
+        return sum(results)
+
+    def stats(self) -> Dict[str, Any]:
+        """Connection counters for this worker"""
+        connections = list(self.active_connections.values())
+        return {
+            "active_connections": len(connections),
+            "total_connections": self.total_connections,
+            "slow_consumers_disconnected": self.slow_consumers,
+            "queued_messages": sum(c.queue.qsize() for c in connections),
+            "inflight_requests": sum(c.inflight for c in connections)
+        }
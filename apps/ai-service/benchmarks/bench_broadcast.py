@@ -0,0 +1,104 @@
+"""End-to-end delivery latency of the Redis broadcaster across worker processes.
+
+Needs a Redis server (REDIS_URL, default redis://localhost:6379). Run from
+apps/ai-service:
+
+    python -m benchmarks.bench_broadcast --workers 4 --messages 2000
+
+Each worker process runs a RedisBroadcaster with a stand-in connection
+manager that records publish-to-delivery latency; the publisher spreads
+messages over --users user channels at --rate messages/second.
+"""
+import argparse
+import asyncio
+import multiprocessing
+import statistics
+import time
+
+from app.websocket.broadcaster import RedisBroadcaster
+
+
+class LatencyRecorder:
+    """Stands in for ConnectionManager: one local socket per user"""
+
+    def __init__(self):
+        self.latencies = []
+
+    def _record(self, message) -> int:
+        self.latencies.append(time.time() - message["sent_at"])
+        return 1
+
+    async def send_to_user(self, message, user_id):
+        return self._record(message)
+
+    async def send_to_session(self, message, session_id):
+        return self._record(message)
+
+    async def broadcast(self, message):
+        return self._record(message)
+
+
+def worker(expected: int, ready, results):
+    async def run():
+        recorder = LatencyRecorder()
+        broadcaster = RedisBroadcaster(recorder)
+        await broadcaster.start()
+        ready.release()
+
+        deadline = time.time() + 60
+        while len(recorder.latencies) < expected and time.time() < deadline:
+            await asyncio.sleep(0.05)
+
+        await broadcaster.stop()
+        results.put(recorder.latencies)
+
+    asyncio.run(run())
+
+
+async def publish(messages: int, users: int, rate: float):
+    publisher = RedisBroadcaster()
+    await publisher.start()
+    interval = 1 / rate
+    for i in range(messages):
+        publisher.publish_to_user(f"user-{i % users}", {"type": "insight", "sent_at": time.time()})
+        await asyncio.sleep(interval)
+    await asyncio.sleep(0.5)
+    await publisher.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--rate", type=float, default=2000.0)
+    args = parser.parse_args()
+
+    ready = multiprocessing.Semaphore(0)
+    results = multiprocessing.Queue()
+    workers = [
+        multiprocessing.Process(target=worker, args=(args.messages, ready, results))
+        for _ in range(args.workers)
+    ]
+    for process in workers:
+        process.start()
+    for _ in workers:
+        ready.acquire()
+
+    asyncio.run(publish(args.messages, args.users, args.rate))
+
+    latencies = []
+    for _ in workers:
+        latencies.extend(results.get())
+    for process in workers:
+        process.join()
+
+    quantiles = statistics.quantiles(latencies, n=100)
+    print(f"{args.workers} workers, {len(latencies)} deliveries")
+    print(f"latency p50 {quantiles[49] * 1000:7.2f} ms")
+    print(f"latency p95 {quantiles[94] * 1000:7.2f} ms")
+    print(f"latency p99 {quantiles[98] * 1000:7.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""Chat message persistence: per-message insert_one vs. write-behind batches.
+
+Needs a MongoDB server (MONGODB_URI, as for the service). Run from
+apps/ai-service:
+
+    python -m benchmarks.bench_chat_persistence --turns 5000 --concurrency 100
+
+Each simulated chat turn saves a user and an AI message. "request path" is
+the time a turn spends persisting before it could respond; "throughput" is
+turns per second until every message is durable. Documents are written for
+a throwaway benchmark user and removed afterwards.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+import uuid
+
+from app.chat.models import ChatMessage, ChatSession, MessageType
+from app.chat.persistence import ChatMessageWriter
+from app.database.mongodb import close_mongo_connection, get_database
+
+BENCH_USER = "bench-chat-persistence"
+
+
+def turn_messages(session_id: str, i: int):
+    return [
+        ChatMessage(message=f"question {i}", message_type=MessageType.USER, user_id=BENCH_USER, session_id=session_id),
+        ChatMessage(message=f"answer {i}", message_type=MessageType.AI, user_id=BENCH_USER, session_id=session_id)
+    ]
+
+
+async def run(mode: str, turns: int, concurrency: int, sessions: list):
+    db = await get_database()
+    writer = ChatMessageWriter()
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def turn(i: int):
+        async with semaphore:
+            messages = turn_messages(sessions[i % len(sessions)], i)
+            start = time.perf_counter()
+            if mode == "insert_one":
+                # Baseline behaviour of _save_message
+                for message in messages:
+                    await db.chat_messages.insert_one(message.dict())
+            else:
+                for message in messages:
+                    await writer.enqueue(message)
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[turn(i) for i in range(turns)])
+    await writer.close()
+    elapsed = time.perf_counter() - start
+
+    quantiles = statistics.quantiles(latencies, n=100)
+    print(
+        f"{mode:12s} request path p50 {quantiles[49] * 1000:7.3f} ms  p99 {quantiles[98] * 1000:7.3f} ms"
+        f"   throughput {turns / elapsed:9.0f} turns/s"
+    )
+    if mode == "write_behind":
+        print(f"{'':12s} {writer.stats()}")
+
+
+async def main_async(args):
+    db = await get_database()
+    sessions = [str(uuid.uuid4()) for _ in range(args.sessions)]
+    await db.chat_sessions.insert_many([ChatSession(id=s, user_id=BENCH_USER).dict() for s in sessions])
+    try:
+        for mode in ("insert_one", "write_behind"):
+            await run(mode, args.turns, args.concurrency, sessions)
+        counts = [doc["message_count"] async for doc in db.chat_sessions.find({"user_id": BENCH_USER})]
+        print(f"session message_count total {sum(counts)} (expected {args.turns * 2} from write-behind)")
+    finally:
+        await db.chat_messages.delete_many({"user_id": BENCH_USER})
+        await db.chat_sessions.delete_many({"user_id": BENCH_USER})
+        await close_mongo_connection()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--turns", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--sessions", type=int, default=200)
+    args = parser.parse_args()
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
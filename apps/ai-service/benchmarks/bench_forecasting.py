@@ -0,0 +1,50 @@
+"""Forecasting engine throughput for single series and dashboard batches.
+
+Run from apps/ai-service:
+
+    python -m benchmarks.bench_forecasting --series 1000 --points 100
+"""
+import argparse
+import time
+
+import numpy as np
+
+from app.analytics.forecasting import forecast_batch, forecast_series
+
+
+def timeit(fn, repeat: int) -> float:
+    fn()  # warm-up
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--series", type=int, default=1000)
+    parser.add_argument("--points", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    values = list(rng.normal(size=args.points).cumsum() + 100)
+    batch = {
+        f"series-{i}": list(rng.normal(size=args.points).cumsum() + 100)
+        for i in range(args.series)
+    }
+
+    for method in ("linear", "holt", "holt_winters", "seasonal_naive"):
+        elapsed = timeit(lambda: forecast_series(values, method=method), args.repeat * 10)
+        print(f"{method:15s} single series: {elapsed * 1e6:10.1f} us")
+
+    for method in ("linear", "holt"):
+        elapsed = timeit(lambda: forecast_batch(batch, method=method), args.repeat)
+        print(
+            f"{method:15s} batch of {args.series}: {elapsed * 1e3:8.1f} ms "
+            f"({elapsed / args.series * 1e6:.1f} us/series)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""Metric ingest throughput: one POST /metrics per point vs. POST /metrics/bulk.
+
+Needs MongoDB (MONGODB_URI) and Redis (REDIS_URL) as for the service. Run
+from apps/ai-service:
+
+    python -m benchmarks.bench_ingest --points 20000 --concurrency 50
+
+Requests go through the real analytics router in-process (httpx ASGI
+transport), so the numbers include validation, Mongo writes and cache
+invalidation but no network hop. Points are written for throwaway
+benchmark users and removed afterwards.
+"""
+import argparse
+import asyncio
+import json
+import time
+from datetime import datetime, timedelta
+
+import httpx
+from fastapi import FastAPI
+
+from app.analytics.cache import AnalyticsCache
+from app.analytics.router import router
+from app.analytics.service import AnalyticsService
+from app.database.mongodb import close_mongo_connection, get_database
+from app.dependencies import get_analytics_service
+
+BENCH_USER_PREFIX = "bench-ingest-"
+METRICS = ["page_views", "revenue", "active_users", "conversion_rate"]
+
+
+def build_app() -> FastAPI:
+    app = FastAPI()
+    app.include_router(router, prefix="/api/analytics")
+    service = AnalyticsService(llm=object(), cache=AnalyticsCache())
+    app.dependency_overrides[get_analytics_service] = lambda: service
+    return app
+
+
+def make_points(count: int, users: int):
+    start = datetime.utcnow() - timedelta(days=1)
+    return [
+        {
+            "metric_type": METRICS[i % len(METRICS)],
+            "value": float(i % 1000),
+            "user_id": f"{BENCH_USER_PREFIX}{i % users}",
+            "timestamp": (start + timedelta(seconds=i)).isoformat()
+        }
+        for i in range(count)
+    ]
+
+
+async def single(client, points, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def post(point):
+        async with semaphore:
+            response = await client.post("/api/analytics/metrics", json=point)
+            response.raise_for_status()
+
+    await asyncio.gather(*[post(point) for point in points])
+
+
+async def bulk(client, points, chunk_rows):
+    async def body():
+        # Stream the NDJSON body the way a collector would
+        for i in range(0, len(points), chunk_rows):
+            yield "".join(json.dumps(point) + "\n" for point in points[i:i + chunk_rows]).encode()
+
+    response = await client.post(
+        "/api/analytics/metrics/bulk",
+        content=body(),
+        headers={"content-type": "application/x-ndjson"}
+    )
+    response.raise_for_status()
+    return response.json()
+
+
+async def main_async(args):
+    points = make_points(args.points, args.users)
+    db = await get_database()
+    transport = httpx.ASGITransport(app=build_app())
+    try:
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            single_points = points[:args.single_points]
+            start = time.perf_counter()
+            await single(client, single_points, args.concurrency)
+            single_rate = len(single_points) / (time.perf_counter() - start)
+            print(f"POST /metrics       {single_rate:10.0f} points/s  ({len(single_points)} points)")
+
+            start = time.perf_counter()
+            result = await bulk(client, points, args.chunk_rows)
+            bulk_rate = len(points) / (time.perf_counter() - start)
+            print(f"POST /metrics/bulk  {bulk_rate:10.0f} points/s  ({len(points)} points, {result['batches']} batches)")
+            print(f"speedup             {bulk_rate / single_rate:10.1f}x")
+    finally:
+        await db.analytics_data.delete_many({"user_id": {"$regex": f"^{BENCH_USER_PREFIX}"}})
+        await close_mongo_connection()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--points", type=int, default=20000)
+    parser.add_argument("--single-points", type=int, default=2000, help="points sent one request each")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--chunk-rows", type=int, default=500, help="rows per streamed body chunk")
+    args = parser.parse_args()
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""Metric stream consumer throughput and running-stats accuracy.
+
+Needs Redis (REDIS_URL) as for the service. Run from apps/ai-service:
+
+    python -m benchmarks.bench_running_stats --points 200000 --series 2000
+
+Points go through an in-memory broker into MetricStreamConsumer, so the
+numbers cover parsing, validation and the Redis read-fold-write per batch.
+Afterwards every series is checked against NumPy over the same points,
+and the last batch is redelivered to confirm it is not counted twice.
+Keys are written under a throwaway prefix and removed afterwards.
+"""
+import argparse
+import asyncio
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from app.analytics.metric_stream import MemoryBroker, MetricStreamConsumer
+from app.analytics.running_stats import RunningStatsStore
+from app.database.redis_client import close_redis_connection, get_redis_client
+
+BENCH_PREFIX = "bench_metric_stats"
+METRICS = ["page_views", "revenue", "active_users", "conversion_rate"]
+
+
+def make_points(count: int, series: int, seed: int = 7):
+    rng = np.random.default_rng(seed)
+    start = datetime(2024, 1, 1)
+    ids = rng.integers(0, series, count)
+    values = rng.normal(100, 15, count).round(3)
+    # Mostly increasing timestamps with some late arrivals
+    seconds = np.arange(count) * 10 - rng.integers(0, 2, count) * rng.integers(0, 600, count)
+    docs = [
+        {
+            "user_id": f"bench-user-{i // len(METRICS)}",
+            "metric_type": METRICS[i % len(METRICS)],
+            "value": float(value),
+            "timestamp": start + timedelta(seconds=int(offset))
+        }
+        for i, value, offset in zip(ids.tolist(), values, seconds)
+    ]
+    return docs
+
+
+def expected(docs):
+    by_series = {}
+    for doc in docs:
+        by_series.setdefault((doc["user_id"], doc["metric_type"]), []).append((doc["timestamp"], doc["value"]))
+    result = {}
+    for key, points in by_series.items():
+        values = np.array([value for _, value in points])
+        newest = sorted(points)[-2:]
+        result[key] = {
+            "count": len(values),
+            "mean": values.mean(),
+            "variance": values.var(ddof=1) if len(values) > 1 else 0.0,
+            "last": newest[-1][1],
+            "previous": newest[0][1] if len(newest) > 1 else None
+        }
+    return result
+
+
+async def run(points: int, series: int, batch_size: int):
+    redis = await get_redis_client()
+    store = RunningStatsStore(prefix=BENCH_PREFIX)
+    broker = MemoryBroker(topic="bench")
+    consumer = MetricStreamConsumer(broker, store, batch_size=batch_size)
+
+    docs = make_points(points, series)
+    await broker.publish(docs)
+
+    start = time.perf_counter()
+    while broker.position < len(broker.log):
+        await consumer.run_once(timeout_ms=0)
+    elapsed = time.perf_counter() - start
+    print(f"consumed {consumer.consumed} points in {consumer.batches} batches: "
+          f"{elapsed:.2f}s, {consumer.consumed / elapsed:,.0f} points/s")
+
+    # Redeliver the last batch as a broker would after a crash before commit
+    broker.position = max(0, len(broker.log) - batch_size)
+    await consumer.run_once(timeout_ms=0)
+    print(f"redelivered batch: {consumer.duplicates} duplicates skipped")
+
+    failures = 0
+    reads = []
+    for (user_id, metric_type), want in expected(docs).items():
+        read_start = time.perf_counter()
+        got = await store.get(user_id, metric_type)
+        reads.append(time.perf_counter() - read_start)
+        ok = (
+            got["count"] == want["count"]
+            and abs(got["mean"] - want["mean"]) < 1e-6
+            and abs(got["variance"] - want["variance"]) < 1e-6 * max(1.0, want["variance"])
+            and got["last"] == want["last"]
+            and got["previous"] == want["previous"]
+        )
+        failures += not ok
+    print(f"checked {len(reads)} series against NumPy: {failures} mismatches; "
+          f"p50 read {np.median(reads) * 1000:.2f}ms")
+
+    keys = [key async for key in redis.scan_iter(f"{BENCH_PREFIX}:*")]
+    if keys:
+        await redis.delete(*keys)
+    await close_redis_connection()
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--points", type=int, default=200000)
+    parser.add_argument("--series", type=int, default=2000)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+    failures = asyncio.run(run(args.points, args.series, args.batch_size))
+    raise SystemExit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""Per-request overhead of building services vs. using the shared container.
+
+Run from apps/ai-service:
+
+    python -m benchmarks.bench_service_container --requests 500
+
+No network access is needed: the endpoints only resolve their services, so
+the numbers isolate construction cost (LLM client, ``genai.configure``,
+``httpx.AsyncClient`` pool) from actual Gemini/Mongo latency.
+"""
+import argparse
+import asyncio
+import os
+import time
+
+import httpx
+from fastapi import Depends, FastAPI
+
+os.environ.setdefault("GOOGLE_API_KEY", "benchmark-key")
+
+from app.analytics.service import AnalyticsService
+from app.chat.service import ChatService
+from app.dependencies import get_analytics_service, get_chat_service
+from app.services.container import ServiceContainer
+
+
+def build_app() -> FastAPI:
+    app = FastAPI()
+    app.state.services = ServiceContainer()
+
+    @app.get("/per-request")
+    async def per_request():
+        # Baseline behaviour: every request builds fresh services
+        analytics_service = AnalyticsService()
+        chat_service = ChatService()
+        return {"ok": analytics_service is not None and chat_service is not None}
+
+    @app.get("/shared")
+    async def shared(
+        analytics_service: AnalyticsService = Depends(get_analytics_service),
+        chat_service: ChatService = Depends(get_chat_service)
+    ):
+        return {"ok": analytics_service is not None and chat_service is not None}
+
+    return app
+
+
+async def run(path: str, requests: int) -> float:
+    app = build_app()
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        await client.get(path)  # warm-up
+        start = time.perf_counter()
+        for _ in range(requests):
+            response = await client.get(path)
+            response.raise_for_status()
+        elapsed = time.perf_counter() - start
+    await app.state.services.close()
+    return elapsed / requests
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=500)
+    args = parser.parse_args()
+
+    before = asyncio.run(run("/per-request", args.requests))
+    after = asyncio.run(run("/shared", args.requests))
+
+    print(f"per-request services: {before * 1e6:10.1f} us/request")
+    print(f"shared container:     {after * 1e6:10.1f} us/request")
+    print(f"speedup:              {before / after:10.1f}x")
+
+
+if __name__ == "__main__":
+    main()
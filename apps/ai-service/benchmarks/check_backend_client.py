@@ -0,0 +1,199 @@
+"""Exercise BackendClient's resilience and batch features against a local stub backend.
+
+Run from apps/ai-service:
+
+    python -m benchmarks.check_backend_client
+
+A stub Nest.js backend (uvicorn, separate process) serves routes that are
+slow, flaky or failing on purpose and counts the requests it receives. Each
+scenario checks both what the caller got and what the stub saw, and the
+script exits non-zero if any check fails.
+"""
+import os
+
+# Tight settings so the scenarios run in a few seconds; set before import
+os.environ.setdefault("BACKEND_TIMEOUT", "0.5")
+os.environ.setdefault("BACKEND_RETRY_BASE", "0.05")
+os.environ.setdefault("BACKEND_BREAKER_FAILURES", "3")
+os.environ.setdefault("BACKEND_BREAKER_RESET", "1")
+
+import argparse
+import asyncio
+import multiprocessing
+import sys
+import time
+from collections import Counter
+
+import uvicorn
+from fastapi import FastAPI, Response
+
+from app.services.backend_client import BackendClient
+
+HOST = "127.0.0.1"
+
+
+def build_stub() -> FastAPI:
+    app = FastAPI()
+    counts = Counter()
+    state = {"history_healthy": False, "active": 0, "max_active": 0}
+
+    @app.get("/api/dashboard/{user_id}")
+    async def dashboard(user_id: str):
+        counts["dashboard"] += 1
+        await asyncio.sleep(0.2)
+        return {"user_id": user_id, "widgets": []}
+
+    @app.get("/api/analytics/metrics")
+    async def metrics(response: Response, user_id: str):
+        counts[f"metrics:{user_id}"] += 1
+        if user_id.startswith("batch"):
+            # Batch scenario: track concurrency; "batch-missing-*" users don't exist
+            state["active"] += 1
+            state["max_active"] = max(state["max_active"], state["active"])
+            await asyncio.sleep(0.05)
+            state["active"] -= 1
+            if user_id.startswith("batch-missing"):
+                response.status_code = 404
+                return {"message": "no such user"}
+            return [{"metric_type": "revenue", "value": 1.0}]
+        # Fails twice for every user, then recovers
+        if counts[f"metrics:{user_id}"] <= 2:
+            response.status_code = 503
+            return {"message": "warming up"}
+        return [{"metric_type": "revenue", "value": 1.0}]
+
+    @app.get("/api/analytics/data")
+    async def slow_data():
+        counts["data"] += 1
+        await asyncio.sleep(2)
+        return {"data": []}
+
+    @app.get("/api/chat/history")
+    async def history(response: Response):
+        counts["history"] += 1
+        if not state["history_healthy"]:
+            response.status_code = 500
+            return {"message": "down"}
+        return []
+
+    @app.post("/api/chat/messages")
+    async def save_message(response: Response):
+        counts["messages"] += 1
+        response.status_code = 503
+        return {"message": "unavailable"}
+
+    @app.post("/__heal")
+    async def heal():
+        state["history_healthy"] = True
+        return {}
+
+    @app.get("/__counts")
+    async def get_counts():
+        return {**counts, "max_active": state["max_active"]}
+
+    return app
+
+
+def serve(port: int):
+    uvicorn.run(build_stub(), host=HOST, port=port, log_level="warning")
+
+
+class Checks:
+    def __init__(self):
+        self.failed = 0
+
+    def expect(self, name: str, ok: bool, detail: str = ""):
+        self.failed += not ok
+        print(f"{'ok  ' if ok else 'FAIL'} {name}{f'  ({detail})' if detail else ''}")
+
+
+async def run(port: int) -> int:
+    checks = Checks()
+    client = BackendClient(base_url=f"http://{HOST}:{port}")
+
+    async def stub_counts():
+        return (await client.client.get(f"{client.base_url}/__counts")).json()
+
+    # Coalescing: 50 concurrent identical GETs -> one upstream request
+    results = await asyncio.gather(*[client.get_dashboard_data("u1") for _ in range(50)])
+    counts = await stub_counts()
+    checks.expect("coalesced dashboard GETs", counts.get("dashboard") == 1 and all("widgets" in r for r in results),
+                  f"upstream requests={counts.get('dashboard')}, coalesced={client.coalesced}")
+
+    # Retries: two 503s are absorbed by the jittered retries
+    metrics = await client.get_user_metrics("u2")
+    counts = await stub_counts()
+    checks.expect("GET retried through 503s", metrics == [{"metric_type": "revenue", "value": 1.0}] and counts.get("metrics:u2") == 3,
+                  f"upstream requests={counts.get('metrics:u2')}")
+
+    # Timeouts: bounded by read timeout x attempts instead of stalling for 30s
+    start = time.perf_counter()
+    data = await client.get_analytics_data("u1", {})
+    elapsed = time.perf_counter() - start
+    checks.expect("slow endpoint times out quickly", "error" in data and elapsed < 3, f"{elapsed:.2f}s")
+
+    # POSTs are never retried
+    await client.save_chat_message("hi", "u1", "s1")
+    counts = await stub_counts()
+    checks.expect("POST not retried", counts.get("messages") == 1, f"upstream requests={counts.get('messages')}")
+
+    # Circuit breaker: opens after 3 failures, then fails fast without calling upstream
+    for _ in range(10):
+        await client.get_chat_history("u1", limit=10)
+    counts = await stub_counts()
+    breaker = client.breakers["chat_history"]
+    checks.expect("breaker opens and sheds load", breaker.state == "open" and counts.get("history") == 3,
+                  f"upstream requests={counts.get('history')}, rejected={breaker.rejected}")
+
+    # Half-open probe after the reset timeout closes the breaker again
+    await client.client.post(f"{client.base_url}/__heal")
+    await asyncio.sleep(1.1)
+    history = await client.get_chat_history("u1", limit=10)
+    checks.expect("breaker closes after a successful probe", history == [] and breaker.state == "closed")
+
+    # Batch: 40 users x 2 metric chunks, capped concurrency, per-item failures
+    user_ids = [f"batch-{i}" for i in range(36)] + [f"batch-missing-{i}" for i in range(4)]
+    metric_types = ["revenue", "page_views", "active_users"]
+    start = time.perf_counter()
+    first_at = None
+    results = []
+    async for result in client.iter_user_metrics(user_ids, metric_types, concurrency=8, metric_chunk=2):
+        first_at = first_at or time.perf_counter() - start
+        results.append(result)
+    elapsed = time.perf_counter() - start
+    counts = await stub_counts()
+    failed = [r for r in results if not r["ok"]]
+    checks.expect("batch reports per-item failures", len(results) == 80 and len(failed) == 8
+                  and all(r["user_id"].startswith("batch-missing") for r in failed),
+                  f"{len(results)} results, {len(failed)} failed")
+    checks.expect("batch respects the concurrency cap", counts.get("max_active") == 8,
+                  f"max concurrent upstream={counts.get('max_active')}")
+    checks.expect("batch streams results as they complete", first_at < elapsed / 4,
+                  f"first after {first_at * 1000:.0f}ms of {elapsed * 1000:.0f}ms")
+
+    stats = client.stats()
+    for endpoint, endpoint_stats in stats["endpoints"].items():
+        print(f"     {endpoint:14s} {endpoint_stats['requests']:4d} req  p50<={endpoint_stats['p50_ms']}ms  "
+              f"errors={endpoint_stats['errors']}  breaker={endpoint_stats['breaker']['state']}")
+
+    await client.close()
+    return 1 if checks.failed else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=8766)
+    args = parser.parse_args()
+
+    stub = multiprocessing.Process(target=serve, args=(args.port,), daemon=True)
+    stub.start()
+    time.sleep(1.5)
+    try:
+        code = asyncio.run(run(args.port))
+    finally:
+        stub.terminate()
+    sys.exit(code)
+
+
+if __name__ == "__main__":
+    main()
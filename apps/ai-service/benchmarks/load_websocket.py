@@ -0,0 +1,141 @@
+"""WebSocket load test: thousands of idle sockets plus active streaming ones.
+
+Run from apps/ai-service:
+
+    python -m benchmarks.load_websocket --idle 2000 --active 200 --messages 3
+
+A single uvicorn worker serves a stand-in chat endpoint built on the real
+ConnectionManager; replies are streamed from a fake LLM that emits
+--tokens chunks every --token-delay seconds, so results reflect the
+connection layer rather than Gemini latency.
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import resource
+import statistics
+import time
+
+import httpx
+import uvicorn
+import websockets
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+
+from app.websocket.connection_manager import ConnectionManager
+
+HOST = "127.0.0.1"
+
+
+def build_app(tokens: int, token_delay: float) -> FastAPI:
+    app = FastAPI()
+    manager = ConnectionManager()
+
+    async def fake_stream(message_data):
+        for i in range(tokens):
+            await asyncio.sleep(token_delay)
+            yield {"type": "token", "content": f"t{i} "}
+        yield {"type": "done", "message": "ok"}
+
+    @app.websocket("/ws/chat/{user_id}")
+    async def websocket_endpoint(websocket: WebSocket, user_id: str):
+        connection = await manager.connect(websocket, user_id)
+        try:
+            while True:
+                message_data = json.loads(await websocket.receive_text())
+                await connection.submit(message_data, fake_stream)
+        except WebSocketDisconnect:
+            manager.disconnect(websocket)
+
+    @app.get("/stats")
+    async def stats():
+        return manager.stats()
+
+    return app
+
+
+def serve(port: int, tokens: int, token_delay: float):
+    raise_fd_limit()
+    uvicorn.run(build_app(tokens, token_delay), host=HOST, port=port, log_level="warning", ws_ping_interval=None)
+
+
+def raise_fd_limit():
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+async def active_client(url: str, messages: int, first_event: list, completion: list):
+    async with websockets.connect(url, ping_interval=None, max_queue=None) as ws:
+        started = {}
+        for request_id in range(messages):
+            started[request_id] = time.perf_counter()
+            await ws.send(json.dumps({"request_id": request_id, "message": "hi"}))
+
+        pending = set(started)
+        seen = set()
+        while pending:
+            event = json.loads(await ws.recv())
+            request_id = event["request_id"]
+            if request_id not in seen:
+                seen.add(request_id)
+                first_event.append(time.perf_counter() - started[request_id])
+            if event["type"] == "done":
+                completion.append(time.perf_counter() - started[request_id])
+                pending.discard(request_id)
+
+
+async def run(args):
+    url = f"ws://{HOST}:{args.port}/ws/chat/load"
+
+    idle = []
+    start = time.perf_counter()
+    for i in range(0, args.idle, 200):
+        batch = await asyncio.gather(*[
+            websockets.connect(url, ping_interval=None) for _ in range(min(200, args.idle - i))
+        ])
+        idle.extend(batch)
+    print(f"opened {len(idle)} idle sockets in {time.perf_counter() - start:.2f}s")
+
+    first_event, completion = [], []
+    start = time.perf_counter()
+    await asyncio.gather(*[
+        active_client(url, args.messages, first_event, completion) for _ in range(args.active)
+    ])
+    elapsed = time.perf_counter() - start
+
+    async with httpx.AsyncClient() as client:
+        server_stats = (await client.get(f"http://{HOST}:{args.port}/stats")).json()
+
+    for ws in idle:
+        await ws.close()
+
+    quantiles = statistics.quantiles(first_event, n=100)
+    print(f"{args.active} active sockets x {args.messages} concurrent messages in {elapsed:.2f}s")
+    print(f"first event  p50 {quantiles[49] * 1000:7.1f} ms   p99 {quantiles[98] * 1000:7.1f} ms")
+    quantiles = statistics.quantiles(completion, n=100)
+    print(f"completion   p50 {quantiles[49] * 1000:7.1f} ms   p99 {quantiles[98] * 1000:7.1f} ms")
+    print(f"server: {server_stats}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--idle", type=int, default=2000)
+    parser.add_argument("--active", type=int, default=200)
+    parser.add_argument("--messages", type=int, default=3)
+    parser.add_argument("--tokens", type=int, default=20)
+    parser.add_argument("--token-delay", type=float, default=0.01)
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    raise_fd_limit()
+    server = multiprocessing.Process(target=serve, args=(args.port, args.tokens, args.token_delay), daemon=True)
+    server.start()
+    time.sleep(1.5)
+    try:
+        asyncio.run(run(args))
+    finally:
+        server.terminate()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+"""Metric stream consumer maintaining the running statistics and detecting anomalies.
+
+    python consumer.py                               # Kafka (KAFKA_BROKER, METRIC_STREAM_TOPIC)
+    python consumer.py --broker file --file events.ndjson
+"""
+import argparse
+import asyncio
+import signal
+
+from app.analytics.anomalies import AnomalyDetector
+from app.analytics.metric_stream import METRIC_STREAM_BROKER, FileBroker, MetricStreamConsumer, create_broker
+from app.database.mongodb import close_mongo_connection
+from app.database.redis_client import close_redis_connection, get_redis_client
+
+
+async def main(broker_kind: str, path: str = None, detect_anomalies: bool = True):
+    await get_redis_client()
+
+    broker = FileBroker(path) if broker_kind == "file" and path else create_broker(broker_kind)
+    consumer = MetricStreamConsumer(broker, detector=AnomalyDetector() if detect_anomalies else None)
+    await consumer.start()
+    print(f"🚀 Metric stream consumer started ({broker_kind})")
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    await stop.wait()
+
+    print("🛑 Shutting down metric stream consumer...")
+    await consumer.stop()
+    print(f"📊 {consumer.stats()}")
+    await close_redis_connection()
+    await close_mongo_connection()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fold metric events into running statistics")
+    parser.add_argument("--broker", choices=["kafka", "file"], default=METRIC_STREAM_BROKER)
+    parser.add_argument("--file", help="NDJSON file for the file broker (default METRIC_STREAM_FILE)")
+    parser.add_argument("--no-anomalies", action="store_true", help="skip streaming anomaly detection")
+    args = parser.parse_args()
+    asyncio.run(main(args.broker, args.file, not args.no_anomalies))
@@ -4,21 +4,71 @@ from fastapi.responses import JSONResponse
 import asyncio
 import json
 import os
+from contextlib import asynccontextmanager
 from datetime import datetime
-from typing import List, Dict, Any
+from typing import List, Dict, Any, AsyncIterator, Optional
 import uvicorn
 
-from app.chat.router import chat_router
-from app.analytics.router import analytics_router
+from app.chat.router import router as chat_router
+from app.analytics.router import router as analytics_router
+from app.analytics.precompute import INSIGHT_WORKER
 from app.websocket.connection_manager import ConnectionManager
-from app.database.redis_client import get_redis_client
-from app.services.backend_client import BackendClient
+from app.websocket.broadcaster import RedisBroadcaster
+from app.database.indexes import ensure_indexes
+from app.database.mongodb import close_mongo_connection, get_database
+from app.database.redis_client import get_redis_client, close_redis_connection
+from app.services.container import ServiceContainer
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Create shared clients on startup and release them on shutdown"""
+    try:
+        # Initialize Redis connection
+        await get_redis_client()
+        print("✅ Redis connected successfully")
+    except Exception as e:
+        print(f"❌ Error during startup: {e}")
+
+    try:
+        # Indexes the service's queries depend on
+        await ensure_indexes(await get_database())
+        print("✅ MongoDB indexes ensured")
+    except Exception as e:
+        print(f"❌ Error ensuring MongoDB indexes: {e}")
+
+    # One LLM client, backend client and service instance per process; the
+    # services publish WebSocket updates through this worker's broadcaster
+    app.state.broadcaster = RedisBroadcaster(manager)
+    app.state.services = ServiceContainer(broadcaster=app.state.broadcaster)
+    print("✅ Service container initialized")
+
+    # Insight precomputation and rollup upkeep; run worker.py instead when INSIGHT_WORKER=off
+    if INSIGHT_WORKER == "inline":
+        app.state.services.insight_worker.start()
+        app.state.services.rollup_maintainer.start()
+        print("✅ Insight worker started")
+
+    # Cross-worker WebSocket fan-out
+    try:
+        await app.state.broadcaster.start()
+        print("✅ WebSocket broadcaster subscribed")
+    except Exception as e:
+        print(f"❌ Error starting broadcaster: {e}")
+    print("🚀 AnalyticsAI Chat Bot Service started successfully!")
+
+    yield
+
+    print("🛑 Shutting down AnalyticsAI Chat Bot Service...")
+    await app.state.services.close()
+    await close_redis_connection()
+    await close_mongo_connection()
 
 # Initialize FastAPI app
 app = FastAPI(
     title="AnalyticsAI Chat Bot Service",
     description="AI-powered chat bot for analytics dashboard Q&A",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # CORS middleware
@@ -37,27 +87,6 @@ app.include_router(analytics_router, prefix="/api/analytics", tags=["analytics"]
 # WebSocket connection manager
 manager = ConnectionManager()
 
-@app.on_event("startup")
-async def startup_event():
-    """Initialize connections on startup"""
-    try:
-        # Initialize Redis connection
-        await get_redis_client()
-        print("✅ Redis connected successfully")
-        
-        # Initialize backend client
-        app.state.backend_client = BackendClient()
-        print("✅ Backend client initialized")
-        
-        print("🚀 AnalyticsAI Chat Bot Service started successfully!")
-    except Exception as e:
-        print(f"❌ Error during startup: {e}")
-
-@app.on_event("shutdown")
-async def shutdown_event():
-    """Clean up connections on shutdown"""
-    print("🛑 Shutting down AnalyticsAI Chat Bot Service...")
-
 @app.get("/")
 async def root():
     """Health check endpoint"""
@@ -80,7 +109,7 @@ async def health_check():
     
     try:
         # Check backend connection
-        backend_client = app.state.backend_client
+        backend_client = app.state.services.backend_client
         response = await backend_client.client.get(f"{backend_client.base_url}/health")
         backend_status = "healthy" if response.status_code == 200 else "unhealthy"
     except Exception as e:
@@ -92,58 +121,67 @@ async def health_check():
             "redis": redis_status,
             "backend": backend_status
         },
+        "cache": app.state.services.analytics_cache.stats(),
+        "llm_cache": app.state.services.llm_cache.stats(),
+        "chat_streaming": app.state.services.chat_service.stream_stats.stats(),
+        "chat_persistence": app.state.services.message_writer.stats(),
+        "backend": app.state.services.backend_client.stats(),
+        "insight_worker": app.state.services.insight_worker.stats(),
+        "rollups": app.state.services.rollup_maintainer.stats(),
+        "websocket": manager.stats(),
+        "broadcast": app.state.broadcaster.stats(),
         "timestamp": datetime.utcnow().isoformat()
     }
 
+@app.websocket("/ws/chat/{user_id}")
+async def websocket_endpoint(websocket: WebSocket, user_id: str):
+    """WebSocket endpoint for real-time chat and a user's live updates"""
+    await serve_chat_socket(websocket, user_id)
+
 @app.websocket("/ws/chat")
-async def websocket_endpoint(websocket: WebSocket):
-    """WebSocket endpoint for real-time chat"""
-    await manager.connect(websocket)
+async def websocket_query_endpoint(websocket: WebSocket, user_id: Optional[str] = None):
+    """Same as /ws/chat/{user_id}, with the user in the query string"""
+    if not user_id:
+        # 1008: policy violation
+        await websocket.close(code=1008, reason="user_id is required")
+        return
+    await serve_chat_socket(websocket, user_id)
+
+async def serve_chat_socket(websocket: WebSocket, user_id: str):
+    """Run the receive loop of a socket bound to user_id for its lifetime"""
+    connection = await manager.connect(websocket, user_id)
     try:
         while True:
             # Receive message from client
             data = await websocket.receive_text()
-            message_data = json.loads(data)
+            try:
+                message_data = json.loads(data)
+            except ValueError:
+                await connection.send({"type": "error", "message": "Invalid JSON message"})
+                continue
             
-            # Process the message
-            response = await process_chat_message(message_data)
-            
-            # Send response back to client
-            await manager.send_personal_message(response, websocket)
+            # Stream the reply from a handler task so the receive loop keeps
+            # accepting messages while the LLM is generating
+            await connection.submit(message_data, process_chat_message)
             
     except WebSocketDisconnect:
         manager.disconnect(websocket)
     except Exception as e:
         print(f"WebSocket error: {e}")
-        await manager.send_personal_message({
-            "type": "error",
-            "message": "An error occurred while processing your message"
-        }, websocket)
+        manager.disconnect(websocket)
 
-async def process_chat_message(message_data: Dict[str, Any]) -> Dict[str, Any]:
-    """Process incoming chat message and generate AI response"""
-    try:
-        user_message = message_data.get("message", "")
-        user_id = message_data.get("user_id", "anonymous")
-        session_id = message_data.get("session_id", "default")
-        
-        # For now, return a simple response
-        # This will be enhanced with actual AI processing
-        response = {
-            "type": "ai_response",
-            "message": f"I received your message: '{user_message}'. I'm processing your analytics query...",
-            "timestamp": datetime.utcnow().isoformat(),
-            "session_id": session_id
-        }
-        
-        return response
-        
-    except Exception as e:
-        return {
-            "type": "error",
-            "message": f"Error processing message: {str(e)}",
-            "timestamp": datetime.utcnow().isoformat()
-        }
+async def process_chat_message(message_data: Dict[str, Any]) -> AsyncIterator[Dict[str, Any]]:
+    """Process incoming chat message and stream AI response events"""
+    chat_service = app.state.services.chat_service
+    
+    events = chat_service.stream_message(
+        message=message_data.get("message", ""),
+        user_id=message_data["user_id"],
+        session_id=message_data.get("session_id"),
+        context=message_data.get("context")
+    )
+    async for event in events:
+        yield event
 
 if __name__ == "__main__":
     uvicorn.run(
@@ -0,0 +1,91 @@
+import asyncio
+from types import SimpleNamespace
+
+import app.chat.context as context_module
+import app.chat.memory as memory_module
+from app.chat.service import ChatService
+
+
+class FakeRedis:
+    """The few list/string commands chat memory uses, kept in a dict"""
+
+    def __init__(self):
+        self.data = {}
+
+    async def get(self, key):
+        return self.data.get(key)
+
+    async def set(self, key, value, ex=None):
+        self.data[key] = value
+
+    async def lrange(self, key, start, end):
+        items = self.data.get(key, [])
+        end = len(items) if end == -1 else end + 1
+        return items[start:end] if start >= 0 else items[start:end or None]
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+
+class FakePipeline:
+    def __init__(self, redis):
+        self.redis = redis
+        self.calls = []
+
+    def __getattr__(self, command):
+        return lambda *args: self.calls.append((command, args))
+
+    async def execute(self):
+        results = []
+        for command, args in self.calls:
+            key = args[0]
+            if command == "rpush":
+                self.redis.data.setdefault(key, []).append(args[1])
+            elif command == "lrange":
+                results.append(await self.redis.lrange(*args))
+                continue
+            elif command == "ltrim":
+                self.redis.data[key] = self.redis.data.get(key, [])[args[1]:]
+            results.append(True)
+        return results
+
+
+class FakeLLM:
+    """Echoes the question and records every prompt it is given"""
+
+    def __init__(self):
+        self.prompts = []
+
+    async def ainvoke(self, prompt):
+        self.prompts.append(prompt)
+        if isinstance(prompt, str):
+            # Query analysis / insight extraction: no data, no insights
+            return SimpleNamespace(content='{"needs_data": false}')
+        return SimpleNamespace(content=f"Answer to: {prompt[-1].content.split('User Query:')[1].split()[0]}")
+
+
+def test_sessionless_analytics_queries_do_not_share_history(monkeypatch):
+    redis = FakeRedis()
+
+    async def get_redis_client():
+        return redis
+
+    monkeypatch.setattr(memory_module, "get_redis_client", get_redis_client)
+    monkeypatch.setattr(context_module, "get_redis_client", get_redis_client)
+
+    llm = FakeLLM()
+    service = ChatService(llm=llm, backend_client=object(), analytics_service=object(), message_writer=object())
+
+    async def run():
+        await service.process_analytics_query("alice-secret-revenue", "alice")
+        await service.process_analytics_query("bob-question", "bob")
+        await service.process_analytics_query("alice-followup", "alice")
+
+    asyncio.run(run())
+
+    chat_prompts = [prompt for prompt in llm.prompts if not isinstance(prompt, str)]
+    bob_prompt = " ".join(message.content for message in chat_prompts[1])
+    alice_followup = " ".join(message.content for message in chat_prompts[2])
+    assert "alice-secret-revenue" not in bob_prompt
+    assert "alice-secret-revenue" in alice_followup
+    assert "bob-question" not in alice_followup
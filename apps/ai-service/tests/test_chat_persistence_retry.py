@@ -0,0 +1,71 @@
+import asyncio
+from datetime import datetime
+
+from pymongo.errors import BulkWriteError
+
+import app.chat.persistence as persistence
+from app.chat.models import ChatMessage, MessageType
+from app.chat.persistence import ChatMessageWriter
+
+
+class FakeMessages:
+    def __init__(self):
+        self.ids = set()
+
+    async def insert_many(self, documents, ordered=False):
+        for document in documents:
+            self.ids.add(document["_id"])
+
+
+class FlakySessions:
+    """Applies every update, but reports the second one as failed the first time"""
+
+    def __init__(self):
+        self.counts = {}
+        self.calls = 0
+
+    async def bulk_write(self, operations, ordered=False):
+        self.calls += 1
+        errors = []
+        for index, operation in enumerate(operations):
+            if self.calls == 1 and index == 1:
+                errors.append({"index": index, "code": 112, "errmsg": "write conflict"})
+                continue
+            session_id = operation._filter["id"]
+            self.counts[session_id] = self.counts.get(session_id, 0) + operation._doc["$inc"]["message_count"]
+        if errors:
+            raise BulkWriteError({"writeErrors": errors})
+
+
+class FakeDatabase:
+    def __init__(self):
+        self.chat_messages = FakeMessages()
+        self.chat_sessions = FlakySessions()
+
+
+def test_partial_session_update_failure_does_not_double_count(monkeypatch):
+    db = FakeDatabase()
+
+    async def get_database():
+        return db
+
+    monkeypatch.setattr(persistence, "get_database", get_database)
+    monkeypatch.setattr(persistence, "backoff_delay", lambda *args: 0)
+
+    async def run():
+        writer = ChatMessageWriter(interval_ms=1000)
+        for session_id in ("s1", "s2", "s1"):
+            await writer.enqueue(ChatMessage(
+                message="hi",
+                message_type=MessageType.USER,
+                user_id="alice",
+                session_id=session_id,
+                timestamp=datetime(2026, 1, 1)
+            ))
+        await writer.close()
+
+        assert len(db.chat_messages.ids) == 3
+        assert db.chat_sessions.counts == {"s1": 2, "s2": 1}
+        assert writer.stats()["pending_sessions"] == 0
+
+    asyncio.run(run())
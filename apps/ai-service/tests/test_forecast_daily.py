@@ -0,0 +1,16 @@
+from datetime import datetime, timedelta
+
+from app.analytics.forecasting import fill_days, forecast_series
+
+
+def test_fill_days_orders_and_interpolates_gaps():
+    days = [datetime(2026, 1, 4), datetime(2026, 1, 1), datetime(2026, 1, 2)]
+    assert fill_days(days, [4.0, 1.0, 2.0]) == [1.0, 2.0, 3.0, 4.0]
+
+
+def test_weekly_season_lines_up_with_daily_steps():
+    start = datetime(2026, 1, 1)
+    values = fill_days([start + timedelta(days=d) for d in range(21)], [d % 7 for d in range(21)])
+    forecast = forecast_series(values, horizon=7)
+    assert [point["day"] for point in forecast] == list(range(1, 8))
+    assert [round(point["value"]) for point in forecast] == [0, 1, 2, 3, 4, 5, 6]
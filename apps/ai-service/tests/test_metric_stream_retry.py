@@ -0,0 +1,73 @@
+import asyncio
+import json
+from datetime import datetime, timedelta
+
+from app.analytics.anomalies import AnomalyDetector
+from app.analytics.metric_stream import MetricStreamConsumer
+
+
+class FlakyStore:
+    """Running stats store whose first apply fails"""
+
+    def __init__(self):
+        self.offsets = {}
+        self.failures = 1
+
+    async def applied_offsets(self):
+        return dict(self.offsets)
+
+    async def apply(self, points, offsets):
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError("transaction aborted")
+        self.offsets.update(offsets)
+
+
+class RecordingAnomalyStore:
+    def __init__(self):
+        self.saved = []
+
+    async def save(self, user_insights):
+        self.saved.append(list(user_insights))
+
+
+def records(values):
+    start = datetime(2026, 1, 1)
+    return [
+        {
+            "source": "p0",
+            "offset": i,
+            "value": json.dumps({
+                "user_id": "alice",
+                "metric_type": "page_views",
+                "value": value,
+                "timestamp": (start + timedelta(minutes=i)).isoformat()
+            })
+        }
+        for i, value in enumerate(values)
+    ]
+
+
+def test_failed_apply_does_not_fold_batch_twice():
+    async def run():
+        batch = records([10.0] * 40 + [500.0])
+        detector = AnomalyDetector(window=20, season_period=0)
+        consumer = MetricStreamConsumer(None, store=FlakyStore(), detector=detector, anomaly_store=RecordingAnomalyStore())
+
+        try:
+            await consumer.process(batch)
+        except RuntimeError:
+            pass
+        assert detector.points == 0
+        assert detector.series == {}
+
+        await consumer.process(batch)
+        assert detector.points == 41
+        assert len(consumer.anomaly_store.saved[-1]) == 1
+
+        reference = AnomalyDetector(window=20, season_period=0)
+        flagged = [reference.update("alice", "page_views", v, datetime(2026, 1, 1)) for v in [10.0] * 40 + [500.0]]
+        assert detector.series[("alice", "page_views")].ewma == reference.series[("alice", "page_views")].ewma
+        assert sum(f is not None for f in flagged) == 1
+
+    asyncio.run(run())
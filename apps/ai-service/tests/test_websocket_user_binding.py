@@ -0,0 +1,39 @@
+import asyncio
+
+from app.websocket.connection_manager import ConnectionManager
+
+
+class FakeWebSocket:
+    def __init__(self):
+        self.sent = []
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, text):
+        self.sent.append(text)
+
+    async def close(self, code=1000, reason=None):
+        pass
+
+
+def test_payload_user_id_does_not_rebind_connection():
+    async def run():
+        manager = ConnectionManager()
+        connection = await manager.connect(FakeWebSocket(), "alice")
+        seen = []
+
+        async def handler(message_data):
+            seen.append(message_data["user_id"])
+            yield {"type": "done"}
+
+        await connection.submit({"message": "hi", "user_id": "bob"}, handler)
+        await asyncio.sleep(0.01)
+
+        assert seen == ["alice"]
+        assert connection.user_id == "alice"
+        assert await manager.send_to_user({"type": "insights_updated"}, "bob") == 0
+        assert await manager.send_to_user({"type": "insights_updated"}, "alice") == 1
+        connection.close()
+
+    asyncio.run(run())
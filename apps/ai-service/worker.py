@@ -0,0 +1,40 @@
+"""Standalone insight precompute and rollup maintenance worker.
+
+Run next to the API with INSIGHT_WORKER=off set on the API processes:
+
+    python worker.py
+"""
+import asyncio
+import signal
+
+from app.database.indexes import ensure_indexes
+from app.database.mongodb import close_mongo_connection, get_database
+from app.database.redis_client import close_redis_connection, get_redis_client
+from app.services.container import ServiceContainer
+
+
+async def main():
+    await get_redis_client()
+    await ensure_indexes(await get_database())
+
+    services = ServiceContainer()
+    # Publish-only: connected sockets live on the API workers
+    await services.broadcaster.start()
+    services.insight_worker.start()
+    services.rollup_maintainer.start()
+    print("🚀 Insight worker started")
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    await stop.wait()
+
+    print("🛑 Shutting down insight worker...")
+    await services.close()
+    await close_redis_connection()
+    await close_mongo_connection()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
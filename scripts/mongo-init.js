@@ -3,7 +3,10 @@ db = db.getSiblingDB('analytics');
 
 // Create collections with proper indexes
 db.createCollection('users');
-db.createCollection('analytics_data');
+// Time-series collection: points bucketed by timestamp, grouped per user
+db.createCollection('analytics_data', {
+  timeseries: { timeField: 'timestamp', metaField: 'user_id', granularity: 'minutes' }
+});
 db.createCollection('dashboards');
 db.createCollection('chat_messages');
 db.createCollection('ai_insights');